@@ -15,8 +15,8 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-from BeautifulSoup import BeautifulSoup
 import re
+from common.htmltable import iter_table_records
 
 class Analysis_Ganga_Jobs(hf.module.ModuleBase):
     config_keys = {
@@ -69,39 +69,24 @@ class Analysis_Ganga_Jobs(hf.module.ModuleBase):
             'status': 1.
         }
 
-        # read content from downloaded file
-        content = open(self.source.getTmpPath()).read()
-
-        # fetch the table from the html input, identify the beginning of the table
-        table_start_identifier = re.compile(('<table border=0 cellpadding=3>'
-            '<tr align=center bgcolor=lightblue style\=\'font-weight: bold\'>'
-            '<td>Analysis Sites</td><td>Job<br>Nodes</td>'
-            '<td>Jobs</td><td>Latest</td><td>defined</td>'
-            '<td>assigned</td><td>waiting</td>'
-            '<td>activated</td><td>sent</td>'
-            '<td>running</td><td>holding</td>'
-            '<td>transferring</td><td>finished</td>'
-            '<td colspan=2>failed tot trf other</td></tr>(?!</table>)'))
-        table_end_identifier = re.compile('</table>')
-        table_start = table_start_identifier.search(content).span()[1]
-        table_end = table_end_identifier.search(content[table_start:]).span()[0]
-        table_string = content[table_start:table_end+table_start]
-        # parse html
-        soup = BeautifulSoup(table_string)
-        for row in soup.findAll('tr'):
-            col = row.findAll('td')
+        # fetch the table from the html input, it is identified by its header row
+        rows = iter_table_records(self.source.getTmpPath(), cell_tags=('td',),
+                                  xpath='//table[tr[1]/td[1] = "Analysis Sites"]')
+        for index, col in enumerate(rows):
+            if index == 0:
+                continue
             # extract relevant information
-            queue_name = col[0].string
-            defined = float(col[4].findAll('a')[0].string)
-            assigned = float(col[5].findAll('a')[0].string)
-            waiting = float(col[6].findAll('a')[0].string)
-            activated = float(col[7].findAll('a')[0].string)
-            sent = float(col[8].findAll('a')[0].string)
-            running = float(col[9].findAll('a')[0].string)
-            holding = float(col[10].findAll('a')[0].string)
-            transferring = float(col[11].findAll('a')[0].string)
-            finished = float(col[12].findAll('a')[0].string)
-            failed = float(re.search(r'\d+', unicode(col[13])).group())
+            queue_name = col[0]
+            defined = float(col[4])
+            assigned = float(col[5])
+            waiting = float(col[6])
+            activated = float(col[7])
+            sent = float(col[8])
+            running = float(col[9])
+            holding = float(col[10])
+            transferring = float(col[11])
+            finished = float(col[12])
+            failed = float(re.search(r'\d+', col[13]).group())
             
             # apply rating according to thresholds set in the module configuration, consider chosen queues only
             if queue_name in self.queues:
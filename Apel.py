@@ -16,11 +16,10 @@
 import hf
 from sqlalchemy import TEXT, INT, TIMESTAMP, Column
 from sqlalchemy.sql import desc
-from lxml import etree
 import re
-from HTMLParser import HTMLParser
+from common.htmltable import iter_table_records
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous, store_subtables, subtable_rows
 from datetime import datetime
-from BeautifulSoup import BeautifulSoup
 
 class Apel(hf.module.ModuleBase):
     config_keys = {
@@ -40,7 +39,7 @@ class Apel(hf.module.ModuleBase):
         Column('apel_description', TEXT),
         Column('apel_link', TEXT),
         Column('last_build', TIMESTAMP),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         'details_table': ([
@@ -60,9 +59,17 @@ class Apel(hf.module.ModuleBase):
         self.details_table_db_value_list = []
 
     def extractData(self):
+        fingerprint = source_fingerprint(self, self.source_html, self.source_xml)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
+
+        from lxml import etree
+        import lxml.html
         data = {
             'source_html': self.config['source_html'],
             'source_xml': self.config['source_xml'],
+            'source_hash': fingerprint,
             'status': 1
             }
         daysagowarning = int(self.config['daysagowarning'])
@@ -103,8 +110,7 @@ class Apel(hf.module.ModuleBase):
                 data['status'] = 0
 
         # fetch the table from the html input
-        table = TableParser(data_html, '')
-        table = table.table
+        table = list(iter_table_records(self.source_html.getTmpPath(), cell_tags=('td',)))
 
         # check whether there is a table
         if len(table) < 2 or len(table[1]) < 4:
@@ -141,139 +147,27 @@ class Apel(hf.module.ModuleBase):
                 self.details_table_db_value_list.append(apel_detail)
 
         # get date of last build
-        soup = BeautifulSoup(data_html)
-        for li in soup.findAll('li'):
-            if li.string:
-                if li.string[0:12] == 'lastBuild : ':
-                    last_build_string = li.string.split('lastBuild : ')[1][:-3]
+        if len(data_html) < 2:
+            return data
+        for li in lxml.html.document_fromstring(data_html).iter('li'):
+            if li.text and len(li) == 0:
+                if li.text[0:12] == 'lastBuild : ':
+                    last_build_string = li.text.split('lastBuild : ')[1][:-3]
                     last_build = datetime.strptime(last_build_string, "%Y-%m-%d %H:%M:%S")
                     data['last_build'] = last_build
 
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details_table'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_table_db_value_list])
+        store_subtables(self, parent_id, {'details_table': self.details_table_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details = self.subtables['details_table'].select().where(self.subtables['details_table'].c.parent_id==self.dataset['id']).order_by(desc('record_start')).execute().fetchall()
+        details = subtable_rows(self, 'details_table').order_by(desc('record_start')).execute().fetchall()
         data['details'] = map(dict, details)
 
         data['source_html_link'] = self.config['source_html'].split('|')[2]
 
         return data
 
-
-class TableParser(HTMLParser):
-
-    def __init__(self, s, tclass):
-        # parse given string s, seaching for first table with class tclass
-        # all rows and within these all columns will be saved into the array
-        # table. This will be done recursively with all subtables.
-        # if a table only contains one row, indexing for rows will be skipped
-        # if a row only contains one column, indexing for columns will be skipped
-        # if no table is found, the full input is returned
-
-        # if no tclass is given, the first table found will be used
-
-        HTMLParser.__init__(self)
-        self.tstart = 0
-        self.tend = 0
-        self.foundTable = False
-        self.TableDepth = 0
-
-        self.tclass = tclass
-        self.tstring = s
-        self.table = []
-        self.trow = []
-        self.tdstart = 0
-        self.tdend = 0
-
-        self.feed(s)
-
-        # check if given html string is complete
-        self.incomplete = False
-        try:
-            self.close()
-        except Exception:
-            self.incomplete = True
-
-        if len(self.table) == 0:
-            if self.foundTable:
-                # empty table found
-                self.table = ''
-            else:
-                #print('\n\n\n\nHERE WE GO!!!!!\n\n\n\n')
-                # if no table found, then return full input string
-                self.table = self.tstring
-
-        elif len(self.table) == 1:
-            # if only one row, then skip indexing rows
-            self.table = self.table[0]
-
-
-    def handle_starttag(self, tag, attributes):
-
-        if tag == 'table':
-
-            if self.foundTable:
-                if self.TableDepth >= 0:
-                    self.TableDepth += 1
-                else:
-                    self.TableDepth = -1
-
-            else:
-                # we search for table of class tclass
-                if self.tclass != '':
-                    for name, value in attributes:
-                        if name == 'class' and value == self.tclass:
-                            self.foundTable = True
-                            self.tstart = self.getpos()[1] + len(self.get_starttag_text())
-                else:
-                    self.foundTable = True
-
-        elif tag == 'tr':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.trow = []
-
-        elif tag == 'td':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.tdstart = self.getpos()[1] + len(self.get_starttag_text())
-
-        else:
-            pass
-
-
-    def handle_endtag(self, tag):
-
-        if tag == 'table':
-
-            if self.foundTable:
-                if self.TableDepth >= 0:
-                    self.TableDepth -= 1
-
-                    if self.TableDepth == -1:
-                        self.tend = self.getpos()[1]
-                        #self.tstring[self.tstart:self.tend]
-
-                else:
-                    self.TableDepth = -1
-
-
-        elif tag == 'tr':
-            if self.foundTable == True and self.TableDepth == 0:
-                # it tr did not contain any td, it will not be added
-                if len(self.trow) == 1:
-                    # if tr does only contain one td, skip indexing tds
-                    self.table.append(self.trow[0])
-                elif len(self.trow) > 1:
-                    self.table.append(self.trow)
-
-        elif tag == 'td':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.tdend = self.getpos()[1]
-                td = self.tstring[self.tdstart:self.tdend]
-                td = TableParser(td, '').table
-                self.trow.append(td)
-
@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 
-import json, time
+import time
 import logging
-import os
 from sqlalchemy import Column, TEXT
 
 import hf
-import htcondor
+from common.scheddfanout import ScheddQueries, locate_schedds
+from common.effhistory import EfficiencyHistoryStore, import_legacy_json, export_legacy_json
+from common.plotting import pyplot
 
 class BatchCpuEffHistory(hf.module.ModuleBase):
     config_keys = {
@@ -16,7 +17,15 @@ class BatchCpuEffHistory(hf.module.ModuleBase):
 	'single_core_color': ('Matplotlib colorstring for single core jobs', 'b'),
 	'multi_core_color': ('Matplotlib colorstring for multi core jobs', 'r'),
 	'i_color': ('Matplotlib colorstring for input data', 'g'),
-	'o_color': ('Matplotlib colorstring for input data', 'c')
+	'o_color': ('Matplotlib colorstring for input data', 'c'),
+        'history_db': ('SQLite file storing the efficiency history of the jobs, on a local disk as SQLite locking is unreliable on NFS',
+                       'tmp/batch_efficiency.sqlite'),
+        'json_history': ('JSON efficiency history of older versions, imported once into an empty history_db, empty to disable',
+                         '/ekpcommon/happyface/upload/ekplocal/batch_efficiency.history'),
+        'json_export': ('JSON file rewritten with the whole history after every run for consumers like Batch_eff_plots on other hosts, '
+                        'the write grows with the number of jobs instead of the new samples, empty to disable', ''),
+        'history_ttl': ('Seconds after which jobs which are no longer running are removed from the history', '3600'),
+        'schedd_timeout': ('Seconds after which the query of a schedd is given up', '120')
 	}
     table_columns = [
                       Column("filename_plot", TEXT)
@@ -31,102 +40,74 @@ class BatchCpuEffHistory(hf.module.ModuleBase):
                              5: 'held',
                              6: 'submission_er',
                              7: 'suspended'}
-        self.eff_history_fn = '/ekpcommon/happyface/upload/ekplocal/batch_efficiency.history'
+        self.eff_history_fn = self.config['history_db']
+        self.eff_history_ttl = int(self.config['history_ttl'])
+        self.json_history_fn = self.config.get('json_history', '')
+        self.json_export_fn = self.config.get('json_export', '')
         self.logger = logging.getLogger(__name__)
         self.source_url = self.config['htcondor_collector']
 
 
     def extractData(self):
+        from common.jobtable import JobTable
 	data = {}
-        history_producer = self.produce_history()
-        history_producer.next()
         self.logger.info('Processing efficiency information')
-        for job in self.get_htcondor_information(self.config['htcondor_collector']):
-            if self.condor_job_status[job[u'JobStatus']] in ('running',) and job[u'JobUniverse'] != 9:
-                history_producer.send(job)
+        jobs = JobTable.from_ads(self.get_htcondor_information(self.config['htcondor_collector']),
+                                 numeric=['JobStatus', 'JobUniverse', 'RequestCpus', 'ServerTime',
+                                          'JobStartDate', 'RemoteSysCpu', 'RemoteUserCpu',
+                                          'NetworkInputMb', 'NetworkOutputMb'],
+                                 categorical=['GlobalJobId'])
+        self.write_history(jobs, (jobs['JobStatus'] == 2) & (jobs['JobUniverse'] != 9))
         data['filename_plot'] = self.plot()
         return data
 
-    def produce_history(self):
-        eff_history = self.load_eff_history(self.eff_history_fn) or {}
-        try:
-            while True:
-                next_job = (yield)
-                next_job[u'JobStatus'] = self.condor_job_status[next_job[u'JobStatus']]
-                next_job[u'RemoteTotalCpu'] = next_job[u'RemoteSysCpu'] + next_job[u'RemoteUserCpu']
-                if next_job[u'JobStatus'] in ('running', 'removed', 'completed', 'held'):
-                    try:
-                        next_job[u'RemoteWalltime'] = (next_job[u'ServerTime']
-                                                        - next_job[u'JobStartDate'])
-		    except KeyError:
-                        print next_job['GlobalJobId']
-                        raise
-                    try:
-                        next_job[u'CpuEfficiency'] = (round(next_job[u'RemoteTotalCpu']
-                                                        / float(next_job[u'RequestCpus'] 
-                                                        * next_job[u'RemoteWalltime']), 2))
-                    except ZeroDivisionError:
-                        pass
-                try:
-		    # Check for reasonable values of input and output
-                    if next_job[u'NetworkInputMb'] >= 0. and next_job[u'NetworkInputMb'] <= 10000.:
-                        next_job[u'NetworkInput'] = next_job[u'NetworkInputMb'] 
-                    else:
-                        next_job[u'NetworkInput'] = 0.
-                    if next_job[u'NetworkOutputMb'] >= 0. and next_job[u'NetworkOutputMb'] <= 10000.:
-                        next_job[u'NetworkOutput'] = next_job[u'NetworkOutputMb'] 
-                    else:
-                        next_job[u'NetworkOutput'] = 0.
-                except KeyError:
-                    next_job[u'NetworkInput'] = 0.0
-		    next_job[u'NetworkOutput'] = 0.0
-                job_history = eff_history.setdefault(next_job['GlobalJobId'], dict())
-                job_history['last'] = time.time()
-                job_history['ncpus'] = next_job['RequestCpus']
-                job_history[int(next_job['RemoteWalltime'])] = (next_job.get('RemoteTotalCpu', 0),
-                                                next_job.get('NetworkInput', 0),
-                                                next_job.get('NetworkOutput', 0))
-        except GeneratorExit:
-            self.logger.info('Writing efficiency history')
-            with open(self.eff_history_fn, 'w') as f:
-                json.dump(eff_history, f)
-
-    def load_eff_history(self, eff_history_fn):
-        self.logger.info('Loading efficiency history')
-        eff_history = {}
-        if os.path.exists(eff_history_fn):
-            try:
-                eff_history = json.load(open(eff_history_fn))
-            except ValueError:
-                os.unlink(eff_history_fn)
-                raise
-            for job_id in list(eff_history):  # forget about jobs after 60min
-                if time.time() - eff_history[job_id].get('last', 0) > 60 * 60:
-                    eff_history.pop(job_id)
-            return eff_history
-    
+    def write_history(self, jobs, selected):
+        import numpy as np
+        walltime = jobs['ServerTime'] - jobs['JobStartDate']
+        cputime = jobs['RemoteSysCpu'] + jobs['RemoteUserCpu']
+        # Check for reasonable values of input and output
+        network = []
+        for attribute in ('NetworkInputMb', 'NetworkOutputMb'):
+            values = jobs[attribute]
+            with np.errstate(invalid='ignore'):
+                network.append(np.where((values >= 0.) & (values <= 10000.), values, 0.))
+
+        self.logger.info('Writing efficiency history')
+        eff_history = EfficiencyHistoryStore(self.eff_history_fn)
+        if self.json_history_fn:
+            imported = import_legacy_json(eff_history, self.json_history_fn)
+            if imported:
+                self.logger.info('Imported %i jobs from %s' % (imported, self.json_history_fn))
+        job_ids = jobs.categories['GlobalJobId']
+        selected = selected & (jobs['GlobalJobId'] >= 0) & ~np.isnan(walltime) & ~np.isnan(jobs['RequestCpus'])
+        for row in np.flatnonzero(selected):
+            eff_history.add_sample(job_ids[jobs['GlobalJobId'][row]], int(jobs['RequestCpus'][row]),
+                                   int(walltime[row]),
+                                   float(np.nan_to_num(cputime[row])),
+                                   float(network[0][row]),
+                                   float(network[1][row]))
+        eff_history.commit()
+        eff_history.compact(self.eff_history_ttl)
+        if self.json_export_fn:
+            export_legacy_json(eff_history, self.json_export_fn, time.time() - self.eff_history_ttl)
+        eff_history.close()
+
     def get_htcondor_information(self, htcondor_collector_host):
+        import htcondor
         htcondor_collector = htcondor.Collector(htcondor_collector_host)
-        htcondor_schedds_ads = htcondor_collector.locateAll(htcondor.DaemonTypes.Schedd)
-    
-        for htcondor_schedd_ad in htcondor_schedds_ads:
-            htcondor_schedd = htcondor.Schedd(htcondor_schedd_ad)
-            try:
-                htcondor_jobs = htcondor_schedd.query(
-                                    "JobStartDate =!= undefined")
-            except IOError: # Some schedd like gridka26.gridka.de do not return jobs, instead IOError is thrown
-                pass
-            else:
-                for htcondor_job in htcondor_jobs:
-                    yield dict(htcondor_job.items())
+        # Some schedd like gridka26.gridka.de do not return jobs, instead IOError is thrown,
+        # the fan out reports them and continues with the remaining schedds
+        htcondor_jobs = ScheddQueries(locate_schedds(htcondor_collector), "JobStartDate =!= undefined",
+                                      timeout=float(self.config['schedd_timeout']), logger=self.logger)
+        for htcondor_job in htcondor_jobs:
+            yield dict(htcondor_job.items())
     
     
     def plot(self):
-        import matplotlib
-        matplotlib.use("agg")
-        import matplotlib.pyplot
+        plt = pyplot()
+        import matplotlib.lines
         
-        eff_history = json.load(open('/ekpcommon/happyface/upload/ekplocal/batch_efficiency.history'))
+        eff_history = EfficiencyHistoryStore(self.eff_history_fn)
 
         plot_color = {}
         plot_color2 = {}
@@ -137,38 +118,22 @@ class BatchCpuEffHistory(hf.module.ModuleBase):
         plot_data_y2 = {}
         plot_data_y3 = {}
         max_x = 2*24*60*60
-        lastTime_all = 0
-        for jobid in eff_history:
-                lastTime = int(eff_history[jobid].pop('last'))
-                lastTime_all = max(lastTime_all, lastTime)
-                if lastTime < time.time() - 30*60:
-                        continue
-                ncpu = eff_history[jobid].pop('ncpus', 1)
+        lastTime_all = eff_history.last_update()
+        for jobid, ncpu, lastTime, samples in eff_history.history(time.time() - 30*60):
                 if ncpu == 1:
                         plot_color[jobid] = self.config['single_core_color'] 
                 else:
                         plot_color[jobid] = self.config['multi_core_color']
                 plot_color2[jobid] = self.config['i_color']
                 plot_color3[jobid] = self.config['o_color']
-                eff_history_tmp = {}
-                for walltime_str in eff_history[jobid]:
-                        tmp = eff_history[jobid][walltime_str]
-                        eff_history_tmp[int(walltime_str)] = tmp
 
                 eff_history_x = plot_data_x.setdefault(jobid, [])
                 eff_history_x2 = plot_data_x2.setdefault(jobid, [])
                 eff_history_y = plot_data_y.setdefault(jobid, [])
                 eff_history_y2 = plot_data_y2.setdefault(jobid, [])
                 eff_history_y3 = plot_data_y3.setdefault(jobid, [])
-                for walltime in sorted(eff_history_tmp):
-                        if isinstance(eff_history_tmp[walltime], int):
-                                cputime = int(eff_history_tmp[walltime])
-                                inp = 0
-                                outp = 0
-                        else:
-                                cputime = int(eff_history_tmp[walltime][0])
-                                inp = float(eff_history_tmp[walltime][1])
-                                outp = float(eff_history_tmp[walltime][2])
+                for walltime, cputime, inp, outp in samples:
+                        cputime = int(cputime)
 
                         eff_history_x.append(walltime)
                         max_x = max(max_x, walltime)
@@ -177,8 +142,9 @@ class BatchCpuEffHistory(hf.module.ModuleBase):
                         eff_history_x2.append(walltime)
                         eff_history_y2.append(inp)
                         eff_history_y3.append(outp)
+        eff_history.close()
 
-        fig = matplotlib.pyplot.figure(figsize=(10.9,5.8))
+        fig = plt.figure(figsize=(10.9,5.8))
         ax = fig.add_subplot(111, ylim=(0,102))
         ax.set_xscale('log')
         ax.set_xlim((60, max_x))
@@ -224,5 +190,6 @@ class BatchCpuEffHistory(hf.module.ModuleBase):
         #print lastTime_str
         plotname = hf.downloadService.getArchivePath( self.run, self.instance_name + ".png")
         fig.savefig(plotname, dpi=90, bbox_inches='tight')
+        plt.close(fig)
         return plotname
 
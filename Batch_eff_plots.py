@@ -1,12 +1,15 @@
 #!/usr/bin/env python
 
-import hf, json, time
+import hf, json, os, time
 from sqlalchemy import TEXT, Column
+from common.effhistory import EfficiencyHistoryStore, legacy_history
+from common.plotting import FigureSpec, submit
 
 
 class Batch_eff_plots(hf.module.ModuleBase):
     config_keys = {
-        'jason_history': ('URL of the jason file', '')
+        'jason_history': ('URL of the jason file, used if history_db does not exist, e.g. on another host than BatchCpuEffHistory, which then needs json_export', ''),
+        'history_db': ('SQLite efficiency history written by BatchCpuEffHistory', 'tmp/batch_efficiency.sqlite')
     }
 
     table_columns = [
@@ -16,21 +19,35 @@ class Batch_eff_plots(hf.module.ModuleBase):
 
     def prepareAcquisition(self):
 
-        if 'jason_history' not in self.config: raise hf.exceptions.ConfigError('jason_history option not set')
+        self.history_db = self.config['history_db']
+        if self.history_db and os.path.exists(self.history_db):
+            self.source_url = self.history_db
+            return
+        self.history_db = ''
+        if not self.config.get('jason_history'):
+            raise hf.exceptions.ConfigError('Neither history_db "%s" exists nor jason_history is set' % self.config['history_db'])
         self.jason_history = hf.downloadService.addDownload(self.config['jason_history'])
         self.source_url = self.jason_history.getSourceUrl()
 
-    def extractData(self):
-        import matplotlib
-        import matplotlib.pyplot
+    def loadJsonHistory(self):
+        # the json file of BatchCpuEffHistory in the format of EfficiencyHistoryStore.history
+        return legacy_history(json.load(open(self.jason_history.getTmpPath())))
 
+    def extractData(self):
         # initialization
         data = {}
         data["filename_eff_plot"] = ""
         data["filename_eff_inst_plot"] = ""
         data['status'] = 1.0
 
-        eff_history = json.load(open(self.jason_history.getTmpPath()))
+        if self.history_db:
+            eff_history = EfficiencyHistoryStore(self.history_db)
+            jobs = list(eff_history.history(time.time() - 15*60))
+            lastTime_all = eff_history.last_update()
+            eff_history.close()
+        else:
+            jobs = self.loadJsonHistory()
+            lastTime_all = max([0] + [job[2] for job in jobs])
 
         plot_color = {}
         plot_color2 = {}
@@ -43,15 +60,11 @@ class Batch_eff_plots(hf.module.ModuleBase):
         plot_data_y3 = {}
         max_x = 61
         max_x2 = 61
-        lastTime_all = 0
 
         # retrieving history data
-        for jobid in eff_history:
-            lastTime = eff_history[jobid].pop('last')
-            lastTime_all = max(lastTime_all, lastTime)
+        for jobid, ncpu, lastTime, samples in jobs:
             if lastTime < time.time() - 15*60:
                 continue
-            ncpu = eff_history[jobid].pop('ncpus', 1)
             if ncpu == 1:
                 plot_color[jobid] = 'r'
                 plot_color2[jobid] = 'g'
@@ -60,16 +73,6 @@ class Batch_eff_plots(hf.module.ModuleBase):
                 plot_color[jobid] = 'b'
                 plot_color2[jobid] = 'g'
                 plot_color3[jobid] = 'b'
-            eff_history_tmp = {}
-            eff_history_tmp2 = {}
-
-            for walltime_str in eff_history[jobid]:
-                tmp = eff_history[jobid][walltime_str]
-                eff_history_tmp[int(walltime_str)] = tmp
-                if isinstance(tmp, int):
-                    eff_history_tmp2[int(walltime_str)] = int(tmp)
-                else:
-                    eff_history_tmp2[int(walltime_str)] = int(tmp[0])
 
             eff_history_x = plot_data_x.setdefault(jobid, [])
             eff_history_x2 = plot_data_x2.setdefault(jobid, [])
@@ -78,13 +81,9 @@ class Batch_eff_plots(hf.module.ModuleBase):
             eff_history_y2 = plot_data_y2.setdefault(jobid, [])
             eff_history_y3 = plot_data_y3.setdefault(jobid, [])
 
-            for walltime in sorted(eff_history_tmp):
-                if isinstance(eff_history_tmp[walltime], int):
-                    cputime = int(eff_history_tmp[walltime])
-                    io = 0
-                else:
-                    cputime = int(eff_history_tmp[walltime][0])
-                    io = float(eff_history_tmp[walltime][1])
+            for walltime, cputime, io, io_out in samples:
+                cputime = int(cputime)
+                io = float(io)
 
                 eff_history_x.append(walltime / ncpu)
                 max_x = max(max_x, walltime / ncpu)
@@ -93,15 +92,13 @@ class Batch_eff_plots(hf.module.ModuleBase):
                 eff_history_x2.append(walltime / ncpu)
                 eff_history_y2.append(io / ncpu)
 
-            eff_history_list = sorted(eff_history_tmp2)
-
-            for (wt1, wt2) in zip(eff_history_list, eff_history_list[1:]):
+            for (wt1, cpu1, io1, out1), (wt2, cpu2, io2, out2) in zip(samples, samples[1:]):
                 eff_history_x3.append(wt1 / ncpu)
                 max_x2 = max(max_x2, wt2 / ncpu)
-                eff_history_y3.append(100. * (eff_history_tmp2[wt2] - eff_history_tmp2[wt1]) / float(max(1, wt2-wt1)))
+                eff_history_y3.append(100. * (int(cpu2) - int(cpu1)) / float(max(1, wt2-wt1)))
 
         # creating a plot
-        fig1 = matplotlib.pyplot.figure()
+        fig1 = FigureSpec()
         ax = fig1.add_subplot(111, ylim=(0,102))
         ax.set_xscale('log')
         ax.set_xlim((60, max_x))
@@ -120,12 +117,12 @@ class Batch_eff_plots(hf.module.ModuleBase):
                 linewidth = 2, color = plot_color2[jobid], alpha = 0.03)
 
         lastTime_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(lastTime_all))
-        ax.text(0, 1.05, 'Individual job history (last update: %s)' % lastTime_str, transform = ax.transAxes)
+        ax.axes_text(0, 1.05, 'Individual job history (last update: %s)' % lastTime_str)
         #print lastTime_str
-        fig1.savefig(hf.downloadService.getArchivePath(self.run, self.instance_name + "_batch_efficiency.png"), dpi = 60)
+        submit(fig1, hf.downloadService.getArchivePath(self.run, self.instance_name + "_batch_efficiency.png"), self.logger, dpi = 60)
         data["filename_eff_plot"] = self.instance_name + "_batch_efficiency.png"
 
-        fig2 = matplotlib.pyplot.figure()
+        fig2 = FigureSpec()
         fig2.subplots_adjust(left=0.1, right=0.95, top = 0.95, bottom = 0.1)
         ax = fig2.add_subplot(111, xlim=(60, max_x2), ylim=(-2,102))
         #ax.set_xscale('log')
@@ -137,6 +134,7 @@ class Batch_eff_plots(hf.module.ModuleBase):
                     markeredgewidth = 0, linewidth = 0, color = plot_color3[jobid],
                     alpha = 0.03, markersize = 3)
         else:
+            tmp = None
             for color in ['b', 'r']:
                 allx = []
                 ally = []
@@ -153,14 +151,13 @@ class Batch_eff_plots(hf.module.ModuleBase):
                 if not allx:
                     continue
                 if color == 'r':
-                    tmp = matplotlib.pyplot.hexbin(x = allx, y = ally,
+                    tmp = ax.hexbin(x = allx, y = ally, alpha = 0.7,
                         linewidth = 1, gridsize = 40, xscale = 'log', bins = 'log', cmap = 'Reds', mincnt=1)
-                    tmp.set_alpha(0.7)
                 elif color == 'b':
-                    tmp = matplotlib.pyplot.hexbin(x = allx, y = ally,
+                    tmp = ax.hexbin(x = allx, y = ally, alpha = 0.7,
                         linewidth = 1, gridsize = 40, xscale = 'log', bins = 'log', cmap = 'Blues', mincnt=1)
-                    tmp.set_alpha(0.7)
-            matplotlib.pyplot.colorbar(pad = 0.01, fraction = 0.1)
-        fig2.savefig(hf.downloadService.getArchivePath(self.run, self.instance_name + "_batch_efficiency_inst.png"), dpi = 60)
+            if tmp is not None:
+                fig2.colorbar(tmp, ax = ax, pad = 0.01, fraction = 0.1)
+        submit(fig2, hf.downloadService.getArchivePath(self.run, self.instance_name + "_batch_efficiency_inst.png"), self.logger, dpi = 60)
         data["filename_eff_inst_plot"] = self.instance_name + "_batch_efficiency_inst.png"
         return data
@@ -15,8 +15,7 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-import re
-from BeautifulSoup import BeautifulSoup
+from common.htmltable import iter_table_records
 
 class Black_Holes(hf.module.ModuleBase):
 
@@ -73,33 +72,22 @@ class Black_Holes(hf.module.ModuleBase):
 
         self.failed = {}
 
-        # read content from downloaded file
-        contents = {}
         for queue in self.queues:
-            contents[queue] = open(self.sources[queue].getTmpPath()).read()
-
-        for queue in self.queues:
-            table_start_identifier = re.compile('<table id=\'sitetable\'  class=\'display\' >(?!</table>)')
-            table_end_identifier = re.compile('</table>')
-            table_start = table_start_identifier.search(contents[queue]).span()[1]
-            table_end = table_end_identifier.search((contents[queue])[table_start:]).span()[0]
-            table_string = (contents[queue])[table_start:table_end+table_start]
-            soup = BeautifulSoup(table_string)
-            for body in soup.findAll('tbody'):
-                for index, row in enumerate(body.findAll('tr')):
-                    col = row.findAll('td')
-                    if index == 0:
-                        self.failed[queue] = int(col[6].string)
-                    else:
-                        worker_node = col[0].string
-                        failed = int(col[6].string)
-                        self.subtable_queue_details.append(
-                            {
-                                'queue_name': queue,
-                                'worker_node': worker_node,
-                                'failed': failed,
-                            }
-                        )
+            rows = iter_table_records(self.sources[queue].getTmpPath(), table_id='sitetable',
+                                      section='tbody', cell_tags=('td',))
+            for index, col in enumerate(rows):
+                if index == 0:
+                    self.failed[queue] = int(col[6])
+                else:
+                    worker_node = col[0]
+                    failed = int(col[6])
+                    self.subtable_queue_details.append(
+                        {
+                            'queue_name': queue,
+                            'worker_node': worker_node,
+                            'failed': failed,
+                        }
+                    )
 
         for entry in self.subtable_queue_details:
             if self.failed[entry['queue_name']] == 0:
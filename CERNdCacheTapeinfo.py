@@ -1,6 +1,7 @@
 import hf
 from sqlalchemy import INT, FLOAT, Column
 from datetime import datetime, timedelta
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous
 
 class CERNdCacheTapeinfo(hf.module.ModuleBase):
     config_keys = {
@@ -17,7 +18,7 @@ class CERNdCacheTapeinfo(hf.module.ModuleBase):
         Column('total_tape_size', FLOAT),
         Column('used_disk_size', FLOAT),
         Column('total_disk_size', FLOAT),
-    ], []
+    ] + reuse_columns(), []
 
 
     def prepareAcquisition(self):
@@ -43,8 +44,14 @@ class CERNdCacheTapeinfo(hf.module.ModuleBase):
 
     def extractData(self):
 
+        # the numbers are updated once per day
+        fingerprint = source_fingerprint(self, self.used_tape, self.total_tape, self.used_disk, self.total_disk)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
 
-        data = {'used_tape_size': 0.0,
+        data = {'source_hash': fingerprint,
+                'used_tape_size': 0.0,
                 'used_tape_timestamp': 0,
                 'total_tape_size': 0.0,
                 'used_disk_size': 0.0,
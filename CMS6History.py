@@ -18,6 +18,7 @@ from sqlalchemy import TEXT, Column
 import json
 import datetime
 import ast
+from common.plotting import pyplot
 
 
 class CMS6History(hf.module.ModuleBase):
@@ -50,8 +51,8 @@ class CMS6History(hf.module.ModuleBase):
         self.statistics_db_value_list = []
 
     def extractData(self):
+        plt = pyplot()
         import matplotlib.gridspec as gridspec
-        import matplotlib.pyplot as plt
         import numpy as np
         from matplotlib.font_manager import FontProperties
         data = {}
@@ -322,6 +323,7 @@ class CMS6History(hf.module.ModuleBase):
         plt.tight_layout()
         fig.savefig(hf.downloadService.getArchivePath(
             self.run, self.instance_name + "_history.png"), dpi=91)
+        plt.close(fig)
         data["filename_plot"] = self.instance_name + "_history.png"
         print data
         return data
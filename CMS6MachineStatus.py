@@ -18,6 +18,7 @@ from sqlalchemy import *
 import json
 import ast
 from operator import itemgetter
+from common.plotting import pyplot
 
 
 class CMS6MachineStatus(hf.module.ModuleBase):
@@ -107,7 +108,7 @@ class CMS6MachineStatus(hf.module.ModuleBase):
 
     def extractData(self):
         import numpy as np
-        import matplotlib.pyplot as plt
+        plt = pyplot()
         from matplotlib.font_manager import FontProperties
 
         def sitescan(machine_name, sites):  # function to find site for machine_name
@@ -327,6 +328,7 @@ class CMS6MachineStatus(hf.module.ModuleBase):
         plt.tight_layout()
         fig.savefig(hf.downloadService.getArchivePath(
             self.run, self.instance_name + "_sites.png"), dpi=91)
+        plt.close(fig)
         temp = np.zeros(2)
         temp_2 = np.zeros(2)
         for avg in plot_avg_load_claimed:
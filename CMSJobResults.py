@@ -15,12 +15,10 @@
 #   limitations under the License.
 
 import hf
-from lxml.html import parse
 import StringIO
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import numpy as np 
 from datetime import datetime
-import pytz
+from common.plotting import pyplot
 
 state_colors = {
     'submitted': '#5CADFF',
@@ -117,7 +115,10 @@ class CMSJobResults(hf.module.ModuleBase):
   
     def extractData(self):
 
-        import matplotlib.pyplot as plt
+        import numpy as np
+        from lxml.html import parse
+        plt = pyplot()
+        import pytz
         import matplotlib.cm as cm
         from matplotlib.font_manager import FontProperties
         self.plt = plt
@@ -313,6 +314,7 @@ class CMSJobResults(hf.module.ModuleBase):
 
             fig.savefig(hf.downloadService.getArchivePath(
                     self.run, self.instance_name + "_jobs_dist.png"), dpi=91)
+            self.plt.close(fig)
             data["filename_plot"] = self.instance_name + "_jobs_dist.png"
 
         return data
@@ -15,12 +15,10 @@
 #   limitations under the License.
 
 import hf
-from  lxml.html import parse
 import StringIO
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import numpy as np
 from datetime import datetime
-import pytz
+from common.plotting import pyplot
 
 state_colors = {
     'cleanup': '#909090',
@@ -97,7 +95,10 @@ class CMSJobs(hf.module.ModuleBase):
         self.statistics_db_value_list = []
 
     def extractData(self):
-        import matplotlib.pyplot as plt
+        from lxml.html import parse
+        import numpy as np
+        plt = pyplot()
+        import pytz
         from matplotlib.font_manager import FontProperties
         self.plt = plt
 
@@ -249,6 +250,7 @@ class CMSJobs(hf.module.ModuleBase):
 
             fig.savefig(hf.downloadService.getArchivePath(self.run, 
                     self.instance_name + "_jobs_dist.png"), dpi=91)
+            self.plt.close(fig)
             data["filename_plot"] = self.instance_name + "_jobs_dist.png"
 
         return data
@@ -15,8 +15,9 @@
 #   limitations under the License.
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from lxml import etree
 from string import strip
+from common.indexes import IndexSpec
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 class CMSPhedexAgents(hf.module.ModuleBase):
 
@@ -31,7 +32,7 @@ class CMSPhedexAgents(hf.module.ModuleBase):
 
     table_columns = [
         Column('requestTime', FLOAT)
-        ],[]
+        ] + reuse_columns(),[]
 
     subtable_columns = {
         'details': ([
@@ -46,6 +47,9 @@ class CMSPhedexAgents(hf.module.ModuleBase):
             ],[])
         }
 
+    # the agents are shown ordered by name
+    subtable_indexes = {'details': [IndexSpec('parent_id', 'name')]}
+
     def prepareAcquisition(self):
         self.time_warning = float(self.config['time_warning'])
         self.time_critical = float(self.config['time_critical'])
@@ -64,6 +68,7 @@ class CMSPhedexAgents(hf.module.ModuleBase):
 
     def extractData(self):
 
+        from lxml import etree
         data = {}
         help_list = []
         root = etree.parse(open(self.source.getTmpPath())).getroot()
@@ -161,12 +166,11 @@ class CMSPhedexAgents(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.\
-            parent_id==self.dataset['id']).order_by(self.subtables['details'].c.name.asc()).execute().fetchall()
+        details_list = subtable_rows(self, 'details').order_by(self.subtables['details'].c.name.asc()).execute().fetchall()
         details_list = [dict(time_str=self.formatTime(row['time_diff']), **row) for row in details_list]
 
         data['details'] = details_list
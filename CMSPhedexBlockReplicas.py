@@ -17,9 +17,11 @@
 import hf
 import datetime
 import os
-import json
 from sqlalchemy import TEXT, INT, Column, desc
-from sqlalchemy.orm import sessionmaker
+from common.history import column_history
+from common.ingest import iter_json_items
+from common.plotting import FigureSpec, render
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 
 class CMSPhedexBlockReplicas(hf.module.ModuleBase):
@@ -33,7 +35,7 @@ class CMSPhedexBlockReplicas(hf.module.ModuleBase):
     }
     config_hint = ''
 
-    table_columns = [Column('n_incomplete', INT)], []
+    table_columns = [Column('n_incomplete', INT)] + reuse_columns(), []
 
     subtable_columns = {
         'details': ([Column('dataset', TEXT),
@@ -58,22 +60,12 @@ class CMSPhedexBlockReplicas(hf.module.ModuleBase):
         self.critical_threshold = int(self.config['critical'])
 
         self.history_days = int(self.config['history'])
-        delta = datetime.timedelta(days=self.history_days)
-        stop = datetime.datetime.now()
-        self.history_start_time = stop - delta
 
         self.rows = []
 
     def extractData(self):
-        import matplotlib as mpl
-        import matplotlib.pyplot as plt
-
-        with open(self.source.getTmpPath()) as in_f:
-            data = json.load(in_f)
-
         n_incomplete = 0
-        blocks = data['phedex']['block']
-        for block in blocks:
+        for block in iter_json_items(self.source.getTmpPath(), 'phedex.block'):
             for replica in block['replica']:
                 if replica['node'] != self.node:
                     continue  # should not happen with right node in config anyway
@@ -91,24 +83,22 @@ class CMSPhedexBlockReplicas(hf.module.ModuleBase):
                         'group': replica['group'],
                     })
 
-        # get history from DB
-        Session = sessionmaker(bind=hf.database.engine)
-        session = Session()
-        tab_runs = hf.module.database.hf_runs
-        history = session.query(tab_runs.c.time, self.module_table.c.n_incomplete).join(
-            self.module_table).filter(tab_runs.c.time >= self.history_start_time).all()
+        # history of this instance from DB, the current run is added to it
+        history = column_history(self, ['n_incomplete'], hours=24 * self.history_days)
+        history.append((datetime.datetime.now(), n_incomplete))
         x, y = zip(*history)
-        fig = plt.figure()
-        plt.plot_date(x, y, '-')
-        plt.title('history (last %d days)' % self.history_days)
-        plt.xlabel('date')
-        plt.ylabel('no. incomplete replicas')
+        fig = FigureSpec()
+        axis = fig.add_subplot(111)
+        axis.plot_date(x, y, '-')
+        axis.set_title('history (last %d days)' % self.history_days)
+        axis.set_xlabel('date')
+        axis.set_ylabel('no. incomplete replicas')
         fig.autofmt_xdate()
 
-        # save to archive directory
+        # save to archive directory, the file is needed right away for the remote copy
         plot_fn = self.instance_name + '_history.svg'
         archive_path = hf.downloadService.getArchivePath(self.run, plot_fn)
-        fig.savefig(archive_path)
+        render(fig, archive_path)
         # eventually copy to remote archive directory
         remote_archive_path = hf.downloadService.remote_archive_dir
         if remote_archive_path:
@@ -124,12 +114,12 @@ class CMSPhedexBlockReplicas(hf.module.ModuleBase):
         return {'status': status, 'n_incomplete': n_incomplete}
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.rows])
+        store_subtables(self, parent_id, {'details': self.rows})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id == self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         details_list = map(dict, details_list)
 
         data['details'] = details_list
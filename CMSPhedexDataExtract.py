@@ -1,10 +1,117 @@
 # -*- coding: utf-8 -*-
 import hf, datetime
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import json
 from string import strip
 import time
 import sys
+from common.ingest import iter_json_items
+from common.reuse import reuse_columns, store_subtables, subtable_rows
+from common.rules import Rules, compiled_rules
+from common.templatecache import cached_template_data
+
+UNUSED_LINK_COLOR = '#0000FF'
+COLOR_MAP = ('#a50026', '#a90426', '#af0926', '#b30d26', '#b91326', '#bd1726',
+        '#c21c27', '#c62027', '#cc2627', '#d22b27', '#d62f27', '#da362a', '#dc3b2c',
+        '#e0422f', '#e24731', '#e54e35', '#e75337', '#eb5a3a', '#ee613e', '#f16640',
+        '#f46d43', '#f57245', '#f67a49', '#f67f4b', '#f8864f', '#f98e52', '#f99355',
+        '#fa9b58', '#fba05b', '#fca85e', '#fdad60', '#fdb365', '#fdb768', '#fdbd6d',
+        '#fdc372', '#fdc776', '#fecc7b', '#fed07e', '#fed683', '#feda86', '#fee08b',
+        '#fee28f', '#fee695', '#feea9b', '#feec9f', '#fff0a6', '#fff2aa', '#fff6b0',
+        '#fff8b4', '#fffcba', '#feffbe', '#fbfdba', '#f7fcb4', '#f4fab0', '#eff8aa',
+        '#ecf7a6', '#e8f59f', '#e5f49b', '#e0f295', '#dcf08f', '#d9ef8b', '#d3ec87',
+        '#cfeb85', '#c9e881', '#c5e67e', '#bfe47a', '#bbe278', '#b5df74', '#afdd70',
+        '#abdb6d', '#a5d86a', '#a0d669', '#98d368', '#93d168', '#8ccd67', '#84ca66',
+        '#7fc866', '#78c565', '#73c264', '#6bbf64', '#66bd63', '#5db961', '#57b65f',
+        '#4eb15d', '#45ad5b', '#3faa59', '#36a657', '#30a356', '#279f53', '#219c52',
+        '#199750', '#17934e', '#148e4b', '#118848', '#0f8446', '#0c7f43', '#0a7b41',
+        '#07753e', '#05713c', '#026c39', '#006837')
+
+TIERS = ('t0', 't1', 't2', 't3')
+
+
+class PhedexRules(Rules):
+    """ Thresholds of the link evaluation per tier """
+
+    def __init__(self, config):
+        self.eval_time = int(config['eval_time'])
+        self.critical_failures = {}
+        self.warning_failures = {}
+        self.critical_quality = {}
+        self.warning_quality = {}
+        self.critical_ratio = {}
+        self.warning_ratio = {}
+        self.eval_amount = {}
+        for tier in TIERS:
+            self.critical_failures[tier] = int(config[tier + '_critical_failures'])
+            self.warning_failures[tier] = int(config[tier + '_warning_failures'])
+            self.critical_quality[tier] = float(config[tier + '_critical_quality'])
+            self.warning_quality[tier] = float(config[tier + '_warning_quality'])
+            self.eval_amount[tier] = int(config[tier + '_eval_amount'])
+            if tier != 't0':
+                self.critical_ratio[tier] =  float(config[tier + '_critical_ratio'])
+                self.warning_ratio[tier] = float(config[tier + '_warning_ratio'])
+
+    def marking(self, name, fail_files, color):
+        """ color marking a time bin of the link *name* with *fail_files* failures """
+        tier = name.split('_')[0].lower()
+        if self.critical_failures[tier] <= fail_files:
+            return '#ff0000'
+        elif self.warning_failures[tier] <= fail_files:
+            return '#af00af'
+        return color
+
+    def tier_status(self, link_list):
+        status = {}
+        status['all'] = 1.0
+        for tier,links in link_list.iteritems():
+            status['%s' % tier] = 1.0
+            good_link = 0
+            bad_link = 0
+            warn_link = 0
+            for time_bins in links.itervalues():
+                try:
+                    done_files = 0
+                    fail_files = 0
+                    for single_bin in time_bins:
+                        done_files += int(single_bin['done_files'])
+                        fail_files += int(single_bin['fail_files'])
+                    if fail_files != 0 and (float(done_files) / (done_files + fail_files) <= self.critical_quality[tier] or \
+                        fail_files >= self.critical_failures[tier]):
+                        bad_link += 1
+                    elif fail_files != 0 and (float(done_files) / (done_files + fail_files) <= self.warning_quality[tier] or \
+                        fail_files >= self.warning_failures[tier]):
+                        warn_link += 1
+                    elif done_files != 0:
+                        good_link += 1
+                except IndexError:
+                    pass
+            if tier == 't0' and bad_link > 0: #here you could use a config parameter
+                if status['all'] != 0.0:
+                    status['all'] = 0.0
+            elif tier != 't0':
+                metric = (2.0 * bad_link + warn_link) / (2.0 * bad_link + warn_link + good_link)
+                sum_links = bad_link + warn_link + good_link
+                if (metric >= self.critical_ratio[tier]) and (self.eval_amount[tier] <= (sum_links)):
+                    if status['all'] != 0.0:
+                        status['all'] = 0.0
+                    status['%s' % tier] = 0.0
+                elif (metric >= self.warning_ratio[tier]) and (self.eval_amount[tier] <= (sum_links)):
+                    if status['all'] == 1.0:
+                        status['all'] = 0.5
+                    status['%s' % tier] = 0.5
+        return status
+
+
+def time_bin_links(rows, x0):
+    """ rows of the time bins from *x0* on, by bin, tier and link: x_list[x]['t1']['T1_DE_KIT'] == [{...}, ] """
+    x_list = {}
+    for values in rows:
+        if values['timebin'] >= x0:
+            x = int(values['timebin']-x0)/3600
+            help_append = {'x': x, 'done_files': int(values['done_files']), 'fail_files': int(values['fail_files'])}
+            x_list.setdefault(x, {}).setdefault('t%s' % values['name'][1], {}).setdefault(values['name'], []).append(help_append)
+    return x_list
+
 
 class CMSPhedexDataExtract(hf.module.ModuleBase):
 
@@ -66,7 +173,7 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
         Column('direction', TEXT),
         Column('request_timestamp', INT),
         Column('time_range', INT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         'details': ([
@@ -76,7 +183,14 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
             Column('rate', INT),
             Column('name', TEXT),
             Column('color', TEXT),
-            Column('quality', FLOAT)
+            Column('quality', FLOAT),
+            Column('marking', TEXT)
+        ], []),
+        # status of every tier per time bin, evaluated at acquisition
+        'bin_status': ([
+            Column('x', INT),
+            Column('tier', TEXT),
+            Column('status', FLOAT)
         ], [])
     }
 
@@ -102,6 +216,8 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
         self.url1 += str(self.time-self.time_range*3600)
         self.source1 = hf.downloadService.addDownload(self.url1)
         self.critical_average_quality = float(self.config['critical_average_quality'])
+        self.link_quality_index = None # built from the linktest file on first use, see buildLinkQualityIndex
+        self.link_status_cache = {}
 
         self.source = hf.downloadService.addDownload(self.url)
         self.source_url = self.source.getSourceUrl()+'\n'+self.source1.getSourceUrl()
@@ -119,17 +235,32 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
             self.max_int_size = 24
         self.max_int_val = 1073741823
 
+    def buildLinkQualityIndex(self):
+        # sum up the qualities of the linktest file in a single pass, indexed by the name of the remote site
+        index = {}
+        for links in iter_json_items(self.source1.getTmpPath(), 'phedex.link'):
+            if self.your_name in links[self.link_direction]:
+                continue
+            total, count = index.get(links[self.parse_direction], (0.0, 0))
+            for transfer in links['transfer']:
+                if transfer['quality'] != None and transfer['timebin'] >= self.quality_x_line:
+                    count += 1
+                    total += float(transfer['quality'])
+            index[links[self.parse_direction]] = (total, count)
+        return index
+
     def confirmLinkStatus(self, link_name):
-        fobj1 = json.load(open(self.source1.getTmpPath(), 'r'))['phedex']['link']
+        if link_name in self.link_status_cache:
+            return self.link_status_cache[link_name]
+        if self.link_quality_index is None:
+            self.link_quality_index = self.buildLinkQualityIndex()
 
         i = 0
         avg_quality = 0.0
-        for links in fobj1:
-            if links[self.parse_direction].startswith(link_name) and self.your_name not in links[self.link_direction]:
-                for transfer in links['transfer']:
-                    if transfer['quality'] != None and transfer['timebin'] >= self.quality_x_line:
-                        i += 1
-                        avg_quality += float(transfer['quality'])
+        for name, (total, count) in self.link_quality_index.iteritems():
+            if name.startswith(link_name):
+                i += count
+                avg_quality += total
         if i > 0:
             avg_quality = avg_quality/float(i)
             if avg_quality < self.critical_average_quality:
@@ -139,98 +270,21 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
         else:
             link_status = 1
 
+        self.link_status_cache[link_name] = link_status
         return link_status
 
-    def getPhedexConfigData(self):
-        self.eval_time = int(self.config['eval_time'])
-        self.time = int(time.time())/3600*3600
-
-        self.critical_failures = {}
-        self.warning_failures = {}
-        self.critical_quality = {}
-        self.warning_quality = {}
-        self.critical_ratio = {}
-        self.warning_ratio = {}
-        self.eval_amount = {}
-        for tier in ['t0', 't1', 't2', 't3']:
-            self.critical_failures[tier] = int(self.config[tier + '_critical_failures'])
-            self.warning_failures[tier] = int(self.config[tier + '_warning_failures'])
-            self.critical_quality[tier] = float(self.config[tier + '_critical_quality'])
-            self.warning_quality[tier] = float(self.config[tier + '_warning_quality'])
-            self.eval_amount[tier] = int(self.config[tier + '_eval_amount'])
-            if tier != 't0':
-                self.critical_ratio[tier] =  float(self.config[tier + '_critical_ratio'])
-                self.warning_ratio[tier] = float(self.config[tier + '_warning_ratio'])
-
-        self.unused_link_color = '#0000FF'
-        self.color_map = ['#a50026', '#a90426', '#af0926', '#b30d26', '#b91326', '#bd1726', \
-            '#c21c27', '#c62027', '#cc2627', '#d22b27', '#d62f27', '#da362a', '#dc3b2c', \
-            '#e0422f', '#e24731', '#e54e35', '#e75337', '#eb5a3a', '#ee613e', '#f16640', \
-            '#f46d43', '#f57245', '#f67a49', '#f67f4b', '#f8864f', '#f98e52', '#f99355', \
-            '#fa9b58', '#fba05b', '#fca85e', '#fdad60', '#fdb365', '#fdb768', '#fdbd6d', \
-            '#fdc372', '#fdc776', '#fecc7b', '#fed07e', '#fed683', '#feda86', '#fee08b', \
-            '#fee28f', '#fee695', '#feea9b', '#feec9f', '#fff0a6', '#fff2aa', '#fff6b0', \
-            '#fff8b4', '#fffcba', '#feffbe', '#fbfdba', '#f7fcb4', '#f4fab0', '#eff8aa', \
-            '#ecf7a6', '#e8f59f', '#e5f49b', '#e0f295', '#dcf08f', '#d9ef8b', '#d3ec87', \
-            '#cfeb85', '#c9e881', '#c5e67e', '#bfe47a', '#bbe278', '#b5df74', '#afdd70', \
-            '#abdb6d', '#a5d86a', '#a0d669', '#98d368', '#93d168', '#8ccd67', '#84ca66', \
-            '#7fc866', '#78c565', '#73c264', '#6bbf64', '#66bd63', '#5db961', '#57b65f', \
-            '#4eb15d', '#45ad5b', '#3faa59', '#36a657', '#30a356', '#279f53', '#219c52', \
-            '#199750', '#17934e', '#148e4b', '#118848', '#0f8446', '#0c7f43', '#0a7b41', \
-            '#07753e', '#05713c', '#026c39', '#006837']
-
-    def getTierStatus(self, link_list):
-        status = {}
-        status['all'] = 1.0
-        for tier,links in link_list.iteritems():
-            status['%s' % tier] = 1.0
-            good_link = 0
-            bad_link = 0
-            warn_link = 0
-            for time_bins in links.itervalues():
-                try:
-                    done_files = 0
-                    fail_files = 0
-                    for single_bin in time_bins:
-                        done_files += int(single_bin['done_files'])
-                        fail_files += int(single_bin['fail_files'])
-                    if fail_files != 0 and (float(done_files) / (done_files + fail_files) <= self.critical_quality[tier] or \
-                        fail_files >= self.critical_failures[tier]):
-                        bad_link += 1
-                    elif fail_files != 0 and (float(done_files) / (done_files + fail_files) <= self.warning_quality[tier] or \
-                        fail_files >= self.warning_failures[tier]):
-                        warn_link += 1
-                    elif done_files != 0:
-                        good_link += 1
-                except IndexError:
-                    pass
-            if tier == 't0' and bad_link > 0: #here you could use a config parameter
-                if status['all'] != 0.0:
-                    status['all'] = 0.0
-            elif tier != 't0':
-                metric = (2.0 * bad_link + warn_link) / (2.0 * bad_link + warn_link + good_link)
-                sum_links = bad_link + warn_link + good_link
-                if (metric >= self.critical_ratio[tier]) and (self.eval_amount[tier] <= (sum_links)):
-                    if status['all'] != 0.0:
-                        status['all'] = 0.0
-                    status['%s' % tier] = 0.0
-                elif (metric >= self.warning_ratio[tier]) and (self.eval_amount[tier] <= (sum_links)):
-                    if status['all'] == 1.0:
-                        status['all'] = 0.5
-                    status['%s' % tier] = 0.5
-        return status
-
     def extractData(self):
 
-        self.getPhedexConfigData()
+        self.rules = rules = compiled_rules(self, PhedexRules)
+        self.time = int(time.time())/3600*3600
 
         data = {'direction' : self.link_direction, 'time_range' : self.time_range, 'request_timestamp' : self.time}
 
         #store the last N qualities of the Tx links within those dictionaries, {TX_xxx : (q1,q2,q3...)}
 
         link_list = {} # link_list['t1']['t1_de_kit'] == [{time1}, {time2}, ]
-        fobj = json.load(open(self.source.getTmpPath(), 'r'))['phedex']['link']
-        x_line = self.time - self.eval_time * 3600 #data with a timestamp greater than this one will be used for status evaluation
+        fobj = iter_json_items(self.source.getTmpPath(), 'phedex.link')
+        x_line = self.time - rules.eval_time * 3600 #data with a timestamp greater than this one will be used for status evaluation
 
         for links in fobj:
             if links[self.link_direction].startswith(self.your_name) and links[self.parse_direction] not in self.blacklist:
@@ -259,41 +313,51 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
                     #quality = done_files/(done_files + fail_files), if else to catch ZeroDivisionError
                     if done != 0:
                         help_append['quality'] = float(done)/float(done + fail)
-                        help_append['color'] = self.color_map[int(help_append['quality']*100)]
+                        help_append['color'] = COLOR_MAP[int(help_append['quality']*100)]
 
                         linkappend = 1
                         if (help_append['timebin'] >= self.quality_x_line) and \
                             (help_append['quality'] < self.critical_average_quality) and \
                             (not self.confirmLinkStatus(help_append['name'])):
-                            help_append['color'] = self.unused_link_color
+                            help_append['color'] = UNUSED_LINK_COLOR
                             linkappend = 0
+                        help_append['marking'] = rules.marking(link_name, fail, help_append['color'])
                         self.details_db_value_list.append(help_append)
                         if (help_append['timebin'] >= x_line) and linkappend:
                             link_list.setdefault(tier, {}).setdefault(link_name, []).append(help_append)
                     elif fail != 0:
                         help_append['quality'] = 0.0
-                        help_append['color'] = self.color_map[int(help_append['quality']*100)]
+                        help_append['color'] = COLOR_MAP[int(help_append['quality']*100)]
 
                         linkappend = 1
                         if help_append['timebin'] >= self.quality_x_line and not self.confirmLinkStatus(help_append['name']):
-                            help_append['color'] = self.unused_link_color
+                            help_append['color'] = UNUSED_LINK_COLOR
                             linkappend = 0
+                        help_append['marking'] = rules.marking(link_name, fail, help_append['color'])
                         self.details_db_value_list.append(help_append)
                         if help_append['timebin'] >= x_line and linkappend:
                             link_list.setdefault(tier, {}).setdefault(link_name, []).append(help_append)
 
         # code for status evaluation TODO: find a way to evaluate trend, change of quality between two bins etc.
-        status = self.getTierStatus(link_list)
+        status = rules.tier_status(link_list)
         data['status'] = status['all']
 
+        # summaries of all links per time bin, shown below the link matrix
+        self.bin_status_list = []
+        x0 = self.time - self.time_range * 3600
+        for x, bin_links in time_bin_links(self.details_db_value_list, x0).iteritems():
+            for tier, tier_status in rules.tier_status(bin_links).iteritems():
+                self.bin_status_list.append({'x': x, 'tier': tier, 'status': tier_status})
+
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list, 'bin_status': self.bin_status_list})
 
+    @cached_template_data
     def getTemplateData(self):
 
-        self.getPhedexConfigData()
+        rules = compiled_rules(self, PhedexRules)
 
         report_base = strip(self.config['report_base']) + '&'
         your_direction = strip(self.config['link_direction'])
@@ -306,27 +370,22 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
             your_direction = 'tofilter='
 
         data = hf.module.ModuleBase.getTemplateData(self)
-        details_list = self.subtables['details'].select().\
-            where(self.subtables['details'].c.parent_id==self.dataset['id']).\
+        details_list = subtable_rows(self, 'details').\
             order_by(self.subtables['details'].c.name.asc()).execute().fetchall()
 
         raw_data_list = [] #contains dicts {x,y,weight,fails,done,rate,time,color,link} where the weight determines the the color
-        x_list = {} #for Summary of the quality of all links at one time
         y_list = {} #for Summary of the quality of one link over different times
 
         x0 = self.dataset['request_timestamp'] / 3600 * 3600 - self.dataset['time_range'] * 3600 #normalize the timestamps to the requested timerange
         y_value_map = {} # maps the name of a link to a y-value
-        x_line = self.dataset['request_timestamp'] - self.eval_time * 3600
+        x_line = self.dataset['request_timestamp'] - rules.eval_time * 3600
 
         for values in details_list:
             if values['name'] not in y_value_map: #add a new entry if the link name is not in the value_map 
                 y_value_map[values['name']] = len(y_value_map)
-            t_number = values['name'].split('_')[0].lower()
-            marking_color = values['color']
-            if int(self.config['%s_critical_failures'%t_number]) <= int(values['fail_files']):
-                marking_color = '#ff0000'
-            elif int(self.config['%s_warning_failures'%t_number]) <= int(values['fail_files']):
-                marking_color = '#af00af'
+            marking_color = values['marking']
+            if marking_color is None: # stored before the marking was evaluated at acquisition
+                marking_color = rules.marking(values['name'], int(values['fail_files']), values['color'])
             help_dict = {'x':int(values['timebin']-x0)/3600,
                 'y':int(y_value_map[values['name']]),
                 'w':str('%.2f' %values['quality']),
@@ -337,13 +396,10 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
                 'color':values['color'],
                 'link':report_base + their_direction + values['name'],
                 'marking':marking_color}
-            help_append = {'x': int(values['timebin']-x0)/3600, 'done_files': int(values['done_files']), 'fail_files': int(values['fail_files'])}
             raw_data_list.append(help_dict)
             if values['timebin'] >= x_line:
                 y_list[help_dict['y']] = y_list.get(help_dict['y'], {})
                 y_list[help_dict['y']][help_dict['x']] = help_dict['w']
-            if (values['timebin'] >= x0):
-                x_list.setdefault(help_dict['x'], {}).setdefault('t%s' % values['name'][1], {}).setdefault(values['name'], []).append(help_append)
 
         #create list for Summaries of the qualities of the links over different times
         y_summary = []
@@ -355,19 +411,26 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
                 total += float(y_list[y_value][x_value])
                 i += 1
             avg = total/float(i)
-            y_append_help['color'] = self.color_map[int(avg*100)]
+            y_append_help['color'] = COLOR_MAP[int(avg*100)]
             y_append_help['quality'] = str('%.2f' % avg)
             y_summary.append(y_append_help)
 
         #create list for Summaries of the qualities of all links over one time
 
+        bin_status = {}
+        for row in subtable_rows(self, 'bin_status').execute().fetchall():
+            bin_status.setdefault(row['x'], {})[row['tier']] = row['status']
+        if not bin_status and details_list:
+            # stored before the time bins were evaluated at acquisition
+            for x, bin_links in time_bin_links(details_list, x0).iteritems():
+                bin_status[x] = rules.tier_status(bin_links)
+
         x_summary = []
-        for link_list in x_list:
-            x_append_help = {'x': link_list}
-            status = self.getTierStatus(x_list[link_list])
+        for x, status in bin_status.iteritems():
+            x_append_help = {'x': x}
             for tier in status:
                 x_append_help[tier] = status[tier]
-                x_append_help['%s_color' % tier] = self.color_map[int(status[tier]*100)]
+                x_append_help['%s_color' % tier] = COLOR_MAP[int(status[tier]*100)]
             x_summary.append(x_append_help)
 
         name_mapper = []
@@ -391,7 +454,7 @@ class CMSPhedexDataExtract(hf.module.ModuleBase):
         else:
             data['button_pic'] = self.config['button_pic_path_out']
             data['info_link'] = 'https://cmsweb.cern.ch/phedex/'+self.config['category']+'/Activity::QualityPlots?graph=quality_all&entity=src&dest_filter='
-        data['eval_time'] = 'last %s hrs' % self.eval_time
+        data['eval_time'] = 'last %s hrs' % rules.eval_time
         data['y_summary'] = y_summary
         data['x_summary'] = x_summary
         return data
@@ -16,7 +16,7 @@
 
 import hf
 from sqlalchemy import Column, TEXT, FLOAT
-from lxml import etree
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 class CMSPhedexErrorLog(hf.module.ModuleBase):
 
@@ -48,7 +48,7 @@ class CMSPhedexErrorLog(hf.module.ModuleBase):
         Column('destination_status', TEXT),
         Column('source_status', TEXT),
         Column('unknown_status', TEXT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         'details': ([
@@ -87,6 +87,7 @@ class CMSPhedexErrorLog(hf.module.ModuleBase):
 
     def extractData(self):
 
+        from lxml import etree
         data = {}
         data['destination'] = 0
         data['source'] = 0
@@ -211,10 +212,10 @@ class CMSPhedexErrorLog(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         data['details'] = sorted(map(dict, details_list), key = lambda group: group['node'])
         return data
@@ -16,7 +16,7 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from lxml import etree
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 
 class CMSPhedexPhysicsGroups(hf.module.ModuleBase):
@@ -28,7 +28,7 @@ class CMSPhedexPhysicsGroups(hf.module.ModuleBase):
     }
     config_hint = ''
 
-    table_columns = [],[]
+    table_columns = reuse_columns(),[]
 
     subtable_columns = {
         'details': ([Column('phys_group', TEXT),
@@ -53,6 +53,7 @@ class CMSPhedexPhysicsGroups(hf.module.ModuleBase):
 
 
     def extractData(self):
+        from lxml import etree
         status = 1.
 
         root = etree.parse(open(self.source.getTmpPath())).getroot()
@@ -86,13 +87,13 @@ class CMSPhedexPhysicsGroups(hf.module.ModuleBase):
 
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.rows])
+        store_subtables(self, parent_id, {'details': self.rows})
 
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id == self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         details_list = map(dict, details_list)
 
         data['details'] = details_list
@@ -16,7 +16,8 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-import lxml.html as ltml
+from common.htmltable import iter_table_rows
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous, store_subtables, subtable_rows
 
 class CMSSiteReadiness(hf.module.ModuleBase):
 
@@ -28,7 +29,7 @@ class CMSSiteReadiness(hf.module.ModuleBase):
     }
     config_hint = ''
 
-    table_columns = [], []
+    table_columns = reuse_columns(), []
 
     subtable_columns = {"rows" : ([Column("name", TEXT), Column("order", INT)] + \
         [Column("%02i_color"%i, TEXT) for i in xrange(1,11)] + [Column("%02i_link"%i, TEXT) for i in xrange(1,11)] + \
@@ -62,17 +63,19 @@ class CMSSiteReadiness(hf.module.ModuleBase):
         return giveback.strip()
 
     def extractData(self):
-        tree = ltml.parse(open(self.site_html.getTmpPath()))
-        ntable = ltml.fromstring('H')
+        # the report is updated once a day
+        fingerprint = source_fingerprint(self, self.site_html)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
+        self.giveback['source_hash'] = fingerprint
 
-        #get just the needed table from the html-file
+        import lxml.html as ltml
+        #get just the rows of the needed table from the html-file, the last table containing the site name
 
-        for tables in tree.iter('table'):
-            for tds in tables.iter('td'):
-                for divs in tds.iter('div'):
-                    if divs.text == self.tracked_site:
-                        ntable = tables
-                        break
+        rows = iter_table_rows(self.site_html.getTmpPath(), limit=None,
+                               xpath='(//table[.//td//div[text() = $site]])[last()]//tr',
+                               variables={'site': self.tracked_site})
 
         #extract needed data from KIT table and store in data with linked keyword
         #iterate about <tr> -> <td> -> <div> and extract data from div.text
@@ -80,7 +83,7 @@ class CMSSiteReadiness(hf.module.ModuleBase):
         data_out = {}
         monthwarn = 0
         keycount = 0
-        for trs in ntable.iter('tr'):
+        for trs in rows:
             key = ''
             keyset = 'unset'
             j = 0 
@@ -180,14 +183,15 @@ class CMSSiteReadiness(hf.module.ModuleBase):
 
     def fillSubtables(self, parent_id):
         def generate():
-            l = len(self.data['01_color'])
+            # a reused dataset has no rows
+            l = len(self.data.get('01_color', []))
             for i in xrange(l):
-                yield dict(((key, val[i]) for key,val in self.data.iteritems()), order=i, parent_id=parent_id)
-        self.subtables['rows'].insert().execute([k for k in generate()])
+                yield dict(((key, val[i]) for key,val in self.data.iteritems()), order=i)
+        store_subtables(self, parent_id, {'rows': list(generate())})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        info_list = self.subtables['rows'].select().where(self.subtables['rows'].c.parent_id==self.dataset['id']). \
+        info_list = subtable_rows(self, 'rows'). \
             order_by(self.subtables['rows'].c.order.asc()).execute().fetchall()
         data['tabledata'] = map(dict, info_list)        
         return data
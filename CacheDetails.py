@@ -18,9 +18,9 @@ import hf
 from sqlalchemy import TEXT, Column
 import json
 import time
-import socket
 import logging
-import urllib2
+from common.fetcher import fetch_all
+from common.plotting import pyplot
 
 class CacheDetails(hf.module.ModuleBase):
     config_keys = {'source_url': ('Not used, but filled to avoid warnings', 'http://ekpsg01.ekp.kit.edu:8080/cache/content/'),
@@ -68,19 +68,16 @@ class CacheDetails(hf.module.ModuleBase):
     def extractData(self):
 	# read details for every file from filelist
         self.logger.info("Script to acquire details data form Cache.")
-        for machine in self.machines:
+        urls = ["http://" + machine + ".ekp.kit.edu:8080/cache/content/*" for machine in self.machines]
+        # query all machines at once, a slow cache node must not stall the others
+        responses = fetch_all(urls, timeout=2, deadline=10, logger=self.logger)
+        for machine, response in zip(self.machines, responses):
             self.machine_data[machine] = {}
             file_count = 0
             status = ""
-            self.logger.info("Reading detailed data from " + machine  + '...')
-            url = "http://" + machine + ".ekp.kit.edu:8080/cache/content/*"
-            # html request + error handling
-            req = urllib2.Request(url)
-            try:
-                response = urllib2.urlopen(req, timeout=2)
-                html = response.read()
+            if response.ok:
                 status = "Aquisition successful"
-                services = json.loads(html)
+                services = json.loads(response.body)
                 filenames = services.keys()
                 file_count = len(filenames)
                 for filename in filenames:
@@ -90,20 +87,13 @@ class CacheDetails(hf.module.ModuleBase):
                         'score': services[filename]['score'],
                         'maintained': services[filename]['maintained']
                     }
-                self.logger.info("Sucessful")
-            except urllib2.URLError as e:
-                self.logger.error(str(e.reason) + " " + machine)
-                status = "Aquisition failed"
-            except socket.timeout, e:
-                self.logger.error(("There was an error while reading the file details: %r " % e) + machine)
-                status = "Aquisition failed"
-            except socket.timeout:
-                self.logger.error("socket timeout " + machine)
+                self.logger.info("Reading detailed data from " + machine + " successful")
+            else:
                 status = "Aquisition failed"
             # load json file and dump data into lists
             self.machine_data[machine]["status"] = status
             self.machine_data[machine]["file_count"] = file_count
-            self.machine_data[machine]["error_count"] = 0		
+            self.machine_data[machine]["error_count"] = 0
 	
         data = {}
         data['filename_plot'] = ""
@@ -189,7 +179,7 @@ class CacheDetails(hf.module.ModuleBase):
         return data
 
     def plot(self):
-        import matplotlib.pyplot as plt
+        plt = pyplot()
         from matplotlib.font_manager import FontProperties
 	
 	# Create File Size Distribution plot.
@@ -262,6 +252,8 @@ class CacheDetails(hf.module.ModuleBase):
         fig_alloc.savefig(plotname + "_allocation.png", dpi=91)
         fig_maintain.savefig(plotname + "_maintain.png", dpi=91)
         fig_score.savefig(plotname + "_score.png", dpi=91)
+        for fig in (fig_file_size, fig_alloc, fig_maintain, fig_score):
+            plt.close(fig)
 	
         return plotname 
 
@@ -17,16 +17,15 @@
 import hf
 from sqlalchemy import TEXT, INT, Column
 import json
-import numpy as np
 
-import urllib2
 import urllib
 import itertools
-import socket
 import os
 #from counter import Counter # using a backport of collections.Counter for 2.6 
 from collections import Counter
 import logging
+from common.fetcher import fetch_all, ResponseCache
+from common.plotting import pyplot
 
 class AutoVivification(dict):
     """Implementation of perl's autovivification feature."""
@@ -46,7 +45,9 @@ class CacheDistribution(hf.module.ModuleBase):
                    'x_min': ('minimum for x ', '1'),
                    'x_max': ('maximum for x', '10000'),
                    'nbinsx': ('number of bins in x', '10'),
-                   'nbinsy': ('number of bins in y', '10')
+                   'nbinsy': ('number of bins in y', '10'),
+                   'detail_cache': ('File to keep the dataset details between runs, empty to disable', 'tmp/cache_distribution_details.json'),
+                   'detail_cache_ttl': ('Seconds the dataset details are used without asking the cache node again', '3600')
                    }
     table_columns = [
         Column('filename_plot', TEXT),
@@ -57,6 +58,7 @@ class CacheDistribution(hf.module.ModuleBase):
     ], ['filename_plot']
 
     def ideal_dist(self, x, n):
+        import numpy as np
         try:
             dist =  np.sqrt(max(0.0, 1.0/x-1.0/n))
         except RuntimeWarning:
@@ -71,93 +73,64 @@ class CacheDistribution(hf.module.ModuleBase):
         self.nbinsy = int(self.config['nbinsy'])
         self.x_min = float(self.config['x_min'])
         self.x_max = float(self.config['x_max'])
-	
-	self.logger = logging.getLogger(__name__) 
-        self.machines = ['ekpsg01', 'ekpsg02', 'ekpsg03', 'ekpsg04', 'ekpsm01'] 
+
+        self.logger = logging.getLogger(__name__)
+        self.machines = ['ekpsg01', 'ekpsg02', 'ekpsg03', 'ekpsg04', 'ekpsm01']
         self.in_data = {}
-	
-	def load_dslist(url):
-            # to http requests
-            req = urllib2.Request(url)
-            try:
-                response = urllib2.urlopen(req, timeout=2)
-            # handle url error and timeout errors
-            except urllib2.URLError as e:
-                self.logger.error(str(e.reason) + " for " + url)
-                return None
-            except socket.timeout, e:
-                self.logger.error("There was an error while reading " + url + ": %r" % e)
-                return None
-            except socket.timeout:
-                self.logger.error("socket timeout for " + url)
-                return None
-            html = response.read()
-            services = json.loads(html)
-            dslist = list(itertools.chain(*services.values()))
-            for k, entry in enumerate(dslist):
-                dslist[k] = urllib.quote_plus(os.path.dirname(entry))
-            # make list of unique datasets
-            dataset = Counter(dslist)
-            return dataset
-	
-	self.logger.info("Script to acquire datasets form Cache.")
+        cache = None
+        if self.config['detail_cache']:
+            cache = ResponseCache(self.config['detail_cache'], int(self.config['detail_cache_ttl']))
+
+        self.logger.info("Script to acquire datasets form Cache.")
+        base_urls = ["http://" + machine + ".ekp.kit.edu:8080/cache/content/" for machine in self.machines]
+        # one request per machine for the content list ...
+        datasets = {}
+        for machine, response in zip(self.machines, fetch_all(base_urls, timeout=2, deadline=30, logger=self.logger)):
+            datasets[machine] = self.countDatasets(response.body) if response.ok else None
+
+        # ... and the details of all datasets of all machines in one batch
+        requests = [(machine, base_url, entry) for machine, base_url in zip(self.machines, base_urls)
+                    if datasets[machine] is not None for entry in datasets[machine]]
+        responses = fetch_all([base_url + entry for machine, base_url, entry in requests],
+                              timeout=1, per_host=4, max_workers=20, deadline=60, logger=self.logger, cache=cache)
         for machine in self.machines:
-	    url = "http://" + machine + ".ekp.kit.edu:8080/cache/content/"
-            error_count = 0
-            self.in_data[machine] = {}
-            self.logger.info("Reading detailed data from " + machine + '...')
+            self.in_data[machine] = {'error_count': 0}
+        for (machine, base_url, entry), response in zip(requests, responses):
+            if not response.ok:
+                self.in_data[machine]['error_count'] += 1
+                continue
+            services = json.loads(response.body)
+            self.in_data[machine][urllib.unquote_plus(entry)] = {
+                'size': services['size'],
+                'file_count': datasets[machine][entry],
+                'score': services['score']}
+        self.logger.info("Dataset Details Completed")
+        if cache is not None:
             try:
-                dslist = load_dslist(url).keys()
-                dssize = load_dslist(url).values()
-            except AttributeError:
-                dslist = load_dslist(url)
-                dssize = load_dslist(url)
-            # handle error if dslist is empty
-            if dslist == None:
+                cache.save()
+            except (IOError, OSError), e:
+                self.logger.warning("Could not save the dataset details cache: %s" % e)
+
+        # generate Output file
+        for machine in self.machines:
+            if datasets[machine] is None:
                 status = "Aquisition failed"
                 self.logger.error(status + " for " + machine)
-                dslist = []
                 set_count = 0
             else:
-                set_count = len(dslist)
                 status = "Aquisition successful"
-            # loop over every element in dslist
-            for i, entry in enumerate(dslist):
-                url += entry 
-                # html request + error handling
-                dsname = urllib.unquote_plus(entry)
-                req = urllib2.Request(url)
-                try:
-                    response = urllib2.urlopen(req, timeout=1)
-                    html = response.read()
-                except urllib2.URLError as e:
-                    self.logger.error("URLError" + dsname)
-                    error_count += 1
-                    continue
-		except socket.timeout, e:
-                    self.logger.error(("There was an error while reading the dataset details: %r" % e) + ": " + dsname)
-                    error_count += 1
-                    continue
-                except socket.timeout:
-                    self.logger.error("socket timeout for " + dsname)
-                    error_count += 1
-                    continue
-                # load json file and dump data into lists
-                services = json.loads(html)
-                self.in_data[machine][dsname] = {
-                    'size': services['size'],
-                    'file_count': dssize[i],
-                    'score': services['score']}
-            self.logger.info("Dataset Details Completed")
-        # generate Output file
+                set_count = len(datasets[machine])
             self.in_data[machine]['status'] = status
             self.in_data[machine]['ds_count'] = set_count
-            self.in_data[machine]['error_count'] = error_count
 
-	
+    def countDatasets(self, html):
+        # count the files of every dataset, keyed by the quoted dataset directory
+        services = json.loads(html)
+        return Counter(urllib.quote_plus(os.path.dirname(entry)) for entry in itertools.chain(*services.values()))
 
     def extractData(self):
-        import matplotlib.pyplot as plt
+        import numpy as np
+        plt = pyplot()
         data = {}
         data['filename_plot'] = ""
         data['error_msg'] = ""
@@ -256,6 +229,7 @@ class CacheDistribution(hf.module.ModuleBase):
         plt.tight_layout()
         fig.savefig(hf.downloadService.getArchivePath(
             self.run, self.instance_name + "_filesize.png"), dpi=91)
+        plt.close(fig)
         data["filename_plot"] = self.instance_name + "_filesize.png"
         data['datasets'] = len(file_count)
         data['failed_datasets'] = sum(error_count)
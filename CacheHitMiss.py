@@ -20,9 +20,9 @@ import json
 import time
 
 import logging
-import socket
 import datetime
-import urllib2
+from common.fetcher import fetch
+from common.plotting import FigureSpec, submit
 
 class CacheHitMiss(hf.module.ModuleBase):
     config_keys = {'source_url': ('Not used, but filled to avoid warnings', 'http://ekpsg03.ekp.kit.edu:8082/coordinator/stats/'),
@@ -62,21 +62,13 @@ class CacheHitMiss(hf.module.ModuleBase):
 	urltotal = url + "jobs" + "?fields=" + \
 	    "&fields=".join(jobs.keys())  # build url for request
 	self.logger.info("url: " + urltotal)
-	req = urllib2.Request(urltotal)
-	try:
-	    response = urllib2.urlopen(req, timeout=30)
-	    # handle url error and timeout errors
-	except urllib2.URLError as e:
-	    self.logger.error(e.reason)
+	response = fetch(urltotal, timeout=30)
+	if response.ok:
+	    services = json.loads(response.body)
+	else:
+	    self.logger.error("There was an error while reading " + url + ": " + response.error)
 	    self.inp_data['error'] += " Connection problems"
-	except socket.timeout, e:
-	    self.logger.error("There was an error while reading " + url + ": %r" % e)
-	    self.inp_data['error'] += " Connection problems"
-	except socket.timeout:
-	    self.logger.error("socket timeout")
-	    self.inp_data['error'] += " Connection problems"
-	html = response.read()
-	services = json.loads(html)
+	    services = []
 	self.inp_data["jobs"] = []
 	for service in services:
 	    if service[2] > int(self.date):
@@ -89,7 +81,6 @@ class CacheHitMiss(hf.module.ModuleBase):
 
 
     def extractData(self):
-        import matplotlib.pyplot as plt
         import numpy as np
         data = {}
         data['filename_plot'] = ""
@@ -108,17 +99,17 @@ class CacheHitMiss(hf.module.ModuleBase):
         nbins = 1.0/(self.nbins)
         bins = [np.arange(0.0, 1.1, nbins), np.arange(0.0, 1.1, nbins)]
         H, xedges, yedges = np.histogram2d(hit_list, local_list, bins=bins)
-        fig = plt.figure(figsize=(self.plotsize_x, self.plotsize_y))
+        fig = FigureSpec(figsize=(self.plotsize_x, self.plotsize_y))
+        axis = fig.add_subplot(111)
         H = np.rot90(H)
         H = np.flipud(H)
-        plt.pcolor(xedges, yedges, H, cmap='Blues')
-        cbar = plt.colorbar()
-        cbar.ax.set_ylabel('Jobs')
-        plt.ylabel('locality rate')
-        plt.xlabel('cachehit rate')
-        plt.title('Cache Hit Distribution for the last ' + str(self.time_limit) + " days")
-        plt.tight_layout()
-        fig.savefig(hf.downloadService.getArchivePath(
-            self.run, self.instance_name + "_filesize.png"), dpi=91)
+        mesh = axis.pcolor(xedges, yedges, H, cmap='Blues')
+        fig.colorbar(mesh, label='Jobs')
+        axis.set_ylabel('locality rate')
+        axis.set_xlabel('cachehit rate')
+        axis.set_title('Cache Hit Distribution for the last ' + str(self.time_limit) + " days")
+        fig.tight_layout()
+        submit(fig, hf.downloadService.getArchivePath(
+            self.run, self.instance_name + "_filesize.png"), self.logger, dpi=91)
         data["filename_plot"] = self.instance_name + "_filesize.png"
         return data
@@ -21,8 +21,8 @@ import time
 
 import datetime
 import logging
-import socket
-import urllib2
+from common.fetcher import fetch
+from common.plotting import FigureSpec, submit
 
 class CacheLifetime(hf.module.ModuleBase):
     config_keys = {'source_url': ('Source Url', 'http://ekpsg03.ekp.kit.edu:8082/coordinator/stats/'),
@@ -58,25 +58,17 @@ class CacheLifetime(hf.module.ModuleBase):
         urltotal = url + "life_time" + "?fields=" + \
             "&fields=".join(life_time.keys())  # build url for request
         self.logger.info("url: " + urltotal)
-        req = urllib2.Request(urltotal)
-        try:
-            response = urllib2.urlopen(req, timeout=30)
-            # handle url error and timeout errors
-        except urllib2.URLError as e:
-            self.logger.error(e.reason)
+        response = fetch(urltotal, timeout=30)
+        if response.ok:
+            services = json.loads(response.body)
+        else:
+            self.logger.error("There was an error while reading " + url + ": " + response.error)
             self.inp_data['error'] += " Connection problems"
-        except socket.timeout, e:
-            self.logger.error("There was an error while reading " + url + ": %r" % e)
-            self.inp_data['error'] += " Connection problems"
-        except socket.timeout:
-            self.logger.error("socket timeout")
-            self.inp_data['error'] += " Connection problems"
-        html = response.read()
-        services = json.loads(html)
+            services = []
 	self.inp_data['life_time'] = [] 
 	for service in services:
 	    if service[1] > int(self.date):
-		self.inp_data[parameter].append(
+		self.inp_data['life_time'].append(
 					{
 		    			 'time': service[1],
 		    			 'life_time': service[0]
@@ -85,8 +77,6 @@ class CacheLifetime(hf.module.ModuleBase):
 
 
     def extractData(self):
-        import matplotlib.pyplot as plt
-        from matplotlib.font_manager import FontProperties
         data = {}
         data['filename_plot'] = ""
         data['error_msg'] = ""
@@ -106,17 +96,15 @@ class CacheLifetime(hf.module.ModuleBase):
             data['status'] = 0.5
             data['error_msg'] = "No files removed in the last " + str(self.time_limit) + " days."
             return data
-        fig = plt.figure(figsize=(self.plotsize_x, self.plotsize_y))
+        fig = FigureSpec(figsize=(self.plotsize_x, self.plotsize_y))
         axis = fig.add_subplot(111)
         nbins = self.nbins
-        fontLeg = FontProperties()
-        fontLeg.set_size('small')
         axis.hist(plot_lifetime_list, nbins, histtype='bar', log=True)
         axis.set_xlabel('Lifetime in hours')
         axis.set_ylabel('Number of Files')
         axis.set_title('Lifetime of Files in Cache')
-        plt.tight_layout()
-        fig.savefig(hf.downloadService.getArchivePath(
-            self.run, self.instance_name + ".png"), dpi=91)
+        fig.tight_layout()
+        submit(fig, hf.downloadService.getArchivePath(
+            self.run, self.instance_name + ".png"), self.logger, dpi=91)
         data["filename_plot"] = self.instance_name + ".png"
         return data
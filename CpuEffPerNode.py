@@ -2,11 +2,10 @@
 
 import logging
 from sqlalchemy import Column, TEXT, FLOAT
-import numpy as np
 from operator import attrgetter
 
 import hf
-import htcondor
+from common.scheddfanout import ScheddQueries, locate_schedds
 
 class CpuEffPerNode(hf.module.ModuleBase):
     config_keys = {
@@ -16,7 +15,8 @@ class CpuEffPerNode(hf.module.ModuleBase):
             'width': ('The width of one cell.', '7'),
             'cells_per_row': ('The number of cells per row.', '100'),
             'num_threshold': ('Relative number of nodes below eff_threshold above which the status is critical', '0.5'),
-            'eff_threshold': ('Efficiency threshold used for the calculation of the status.', '0.5')
+            'eff_threshold': ('Efficiency threshold used for the calculation of the status.', '0.5'),
+            'schedd_timeout': ('Seconds after which the query of a schedd is given up.', '120')
     }
     table_columns = [], []
     subtable_columns = {
@@ -37,6 +37,7 @@ class CpuEffPerNode(hf.module.ModuleBase):
                  ]
 
     def prepareAcquisition(self):
+        import htcondor
         self.logger = logging.getLogger(__name__)
         self.source_url = self.config['htcondor_collector']
         self.condor_projection = [
@@ -78,20 +79,13 @@ class CpuEffPerNode(hf.module.ModuleBase):
         return data
 
     def get_jobs_from_condor(self):
-        htcondor_schedds_ads = self.htcondor_collector.locateAll(htcondor.DaemonTypes.Schedd)
-        
-        for htcondor_schedd_ad in htcondor_schedds_ads:
-            htcondor_schedd = htcondor.Schedd(htcondor_schedd_ad)
-            htcondor_jobs = htcondor_schedd.xquery(
-                    "JobUniverse =!= 9 && JobStartDate =!= undefined && RemoteHost =!= undefined",
-                    self.condor_projection)
-            try:
-                for htcondor_job in htcondor_jobs:
-                    yield htcondor_job
-            except RuntimeError as message:
-                self.logger.warning('RuntimeError: ' + message)
+        return ScheddQueries(locate_schedds(self.htcondor_collector),
+                "JobUniverse =!= 9 && JobStartDate =!= undefined && RemoteHost =!= undefined",
+                self.condor_projection,
+                timeout=float(self.config['schedd_timeout']), logger=self.logger)
     
     def get_node_information(self):
+        import htcondor
         self.node_dict = {}
         nodes = self.htcondor_collector.query(htcondor.AdTypes.Startd)
         for node in nodes:
@@ -105,46 +99,34 @@ class CpuEffPerNode(hf.module.ModuleBase):
                                 }
 
     def calculate_efficiency(self):
-        for job in self.get_jobs_from_condor():
-            if self.condor_job_status[job['JobStatus']] == 'running':
-                cpu_time = job['RemoteUserCpu'] + job['RemoteSysCpu']
-                # Catch issues with jobs without JobStartDate ClassAd.
-                try:
-                    run_time = job['RequestCpus'] * job['ServerTime'] - job['JobStartDate']
-                except KeyError:
-                    continue
-		try:
-                    efficiency = float(cpu_time) / float(run_time)
-                except ZeroDivisionError:
-                    efficiency = 0.
-                try:
-                    node = job['RemoteHost'].partition('@')[2].partition('.')[0]
-                except KeyError:
-                    print job['MachineAttrCloudSite0']
-                    continue
-                if node in self.node_dict.keys():
-                    if efficiency <= 1.:
-                        self.node_dict[node]['efficiency'].append(efficiency)
-                else:
-                    if efficiency <= 1.:
-                        self.node_dict[node] = {
-                                'site': job['MachineAttrCloudSite0'].lower(),
-                                'efficiency': [efficiency]
-                                }
-        node_list = []
+        from common.jobtable import JobTable
+        import numpy as np
+        jobs = JobTable.from_ads(self.get_jobs_from_condor(),
+                numeric=['JobStatus', 'RemoteUserCpu', 'RemoteSysCpu',
+                         'RequestCpus', 'ServerTime', 'JobStartDate'],
+                categorical=['RemoteHost', 'MachineAttrCloudSite0'],
+                converters={'RemoteHost': lambda host: host.partition('@')[2].partition('.')[0],
+                            'MachineAttrCloudSite0': lambda site: site.lower()})
+        running = jobs['JobStatus'] == 2
+        cpu_time = jobs['RemoteUserCpu'] + jobs['RemoteSysCpu']
+        run_time = jobs['RequestCpus'] * (jobs['ServerTime'] - jobs['JobStartDate'])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            efficiency = np.where(run_time == 0, 0., cpu_time / run_time)
+        selected = running & (efficiency <= 1.)
+        mean_efficiency = jobs.mean_by('RemoteHost', efficiency, selected)
+        # Nodes which are unknown to the collector get the site of their jobs.
+        for (node, site), rows in jobs.groups(['RemoteHost', 'MachineAttrCloudSite0'], selected):
+            self.node_dict.setdefault(node, {'site': site})
+        for node in mean_efficiency:
+            self.node_dict.setdefault(node, {'site': 'undefined'})
         # Build a list of the dictionaries and add the node in that dictionary.
-        for node in self.node_dict.keys():
-            if len(self.node_dict[node]['efficiency']) > 0:
-                self.node_dict[node]['efficiency'] = round(
-                        100*np.mean(self.node_dict[node]['efficiency']),2)
-            else:
-                self.node_dict[node]['efficiency'] = 0
-            keys = self.node_dict[node].keys()
-            values = self.node_dict[node].values()
-            keys.append('node')
-            values.append(node)
-            node_list.append(dict(zip(keys,
-                                    values)))
+        node_list = []
+        for node, node_info in self.node_dict.iteritems():
+            node_list.append({
+                    'node': node,
+                    'site': node_info['site'],
+                    'efficiency': round(100*mean_efficiency[node], 2) if node in mean_efficiency else 0
+                    })
         return node_list
     
     def fillSubtables(self, parent_id):
@@ -15,17 +15,18 @@
 #   limitations under the License.
 
 import hf
-from sqlalchemy import INT, TEXT, FLOAT, Column, create_engine, MetaData, Table
-from sqlalchemy.orm import mapper, sessionmaker
-
-class SiteStatus(object):
-    pass
+from sqlalchemy import INT, TEXT, FLOAT, Column, MetaData, Table
+from sqlalchemy.sql import select, func, and_
 
 
 class CpuHours(hf.module.ModuleBase):
-    config_keys = {'source_url' : ('Not used, but filled to avoid warnings', 'http://monitor.ekp.kit.edu/ganglia/')
+    config_keys = {'source_url' : ('Not used, but filled to avoid warnings', 'http://monitor.ekp.kit.edu/ganglia/'),
+                   'source_table' : ('Cloud site statistics subtable written by HTCondorSiteStatus', 'sub_ht_condor_site_status_statistics'),
+                   'rolling_totals' : ('Update the totals of the previous run instead of summing up the whole time window', 'False')
                   }
-    table_columns = [],[]
+    table_columns = [
+        Column("first_parent_id", INT),
+        Column("last_parent_id", INT)], []
     subtable_columns = {
 		'statistics' : ([
 			Column("cloudsite", TEXT),
@@ -38,33 +39,69 @@ class CpuHours(hf.module.ModuleBase):
     def prepareAcquisition(self):
 	# Setting defaults
 	self.source_url = self.config["source_url"]
+	self.rolling_totals = self.config["rolling_totals"].lower() in ('true', 'yes', '1')
 	self.cloudsites = ['bwforcluster', 'condocker', 'ekpsupermachines']	
 	# Prepare subtable list for database
         self.statistics_db_value_list = []
     
+    def getSourceTable(self):
+        table_name = self.config["source_table"]
+        table = hf.database.metadata.tables.get(table_name)
+        if table is None:
+            table = Table(table_name, MetaData(hf.database.engine), autoload=True)
+        return table
+
+    def sumWindow(self, low, high):
+        """ cpu hours and unused cpu hours per cloud site of the entries with low < parent_id <= high """
+        source = self.source_table
+        query = select([source.c.cloudsite, func.sum(source.c.busy), func.sum(source.c.idle)]).\
+            where(and_(source.c.parent_id > low, source.c.parent_id <= high, source.c.cloudsite.in_(self.cloudsites))).\
+            group_by(source.c.cloudsite)
+        return dict((cloudsite, [0.25 * float(busy or 0), 0.25 * float(idle or 0)])
+            for cloudsite, busy, idle in query.execute().fetchall())
+
+    def rollTotals(self, low, high):
+        """
+        Shift the window of the previous run to (low, high] by adding the entries
+        which are new and subtracting the ones which dropped out. Returns None if
+        there is no usable previous run.
+        """
+        previous = self.module_table.select().where(and_(self.module_table.c.instance == self.instance_name,
+            self.module_table.c.last_parent_id != None)).order_by(self.module_table.c.id.desc()).execute().fetchone()
+        if previous is None or previous['last_parent_id'] > high or high - previous['last_parent_id'] >= high - low:
+            return None
+        totals = dict((row['cloudsite'], [row['cpu_hours'], row['unused_cpu_hours']]) for row in
+            self.subtables['statistics'].select().where(self.subtables['statistics'].c.parent_id == previous['id']).execute().fetchall())
+        for cloudsite, (cpu_hours, unused_cpu_hours) in self.sumWindow(previous['last_parent_id'], high).iteritems():
+            totals.setdefault(cloudsite, [0., 0.])
+            totals[cloudsite][0] += cpu_hours
+            totals[cloudsite][1] += unused_cpu_hours
+        for cloudsite, (cpu_hours, unused_cpu_hours) in self.sumWindow(previous['first_parent_id'], low).iteritems():
+            if cloudsite in totals:
+                totals[cloudsite][0] = max(0., totals[cloudsite][0] - cpu_hours)
+                totals[cloudsite][1] = max(0., totals[cloudsite][1] - unused_cpu_hours)
+        return totals
+
     def extractData(self):
 	# Create data dictionary.
 	data = {}
-	with open('config/password', 'r') as f:
-		engine = create_engine('postgres://hf3_ekplocal:'+ f.read()[:-1] +'@127.0.0.1/hf3_ekplocal', echo=False)
-
-        metadata = MetaData(engine)
-        subtable = Table('sub_ht_condor_site_status_statistics', metadata, autoload=True)
-        mapper(SiteStatus, subtable)
+	self.source_table = self.getSourceTable()
 
-        Session = sessionmaker(bind=engine)
-        session = Session()
-
-        res = session.query(SiteStatus).all()
-        max_parent_id = res[-1].parent_id
 	past_hours = 24
         num_of_parent_ids = past_hours * 4
+	max_parent_id = select([func.max(self.source_table.c.parent_id)]).execute().scalar() or 0
+	data['first_parent_id'] = max_parent_id - num_of_parent_ids
+	data['last_parent_id'] = max_parent_id
+
+	totals = None
+	if self.rolling_totals:
+	    totals = self.rollTotals(data['first_parent_id'], data['last_parent_id'])
+	if totals is None:
+	    totals = self.sumWindow(data['first_parent_id'], data['last_parent_id'])
+
         for cloudsite in self.cloudsites:
-	    cloudsite_dict = {'cloudsite': cloudsite, 'cpu_hours': 0., 'unused_cpu_hours': 0.}
-	    for entry in reversed(res):
-	        if entry.cloudsite == cloudsite and entry.parent_id > max_parent_id - num_of_parent_ids:
-		    cloudsite_dict['cpu_hours'] += 0.25 * entry.busy
-		    cloudsite_dict['unused_cpu_hours'] += 0.25 * entry.idle
+	    cpu_hours, unused_cpu_hours = totals.get(cloudsite, (0., 0.))
+	    cloudsite_dict = {'cloudsite': cloudsite, 'cpu_hours': cpu_hours, 'unused_cpu_hours': unused_cpu_hours}
 	    if cloudsite_dict['unused_cpu_hours'] + cloudsite_dict['cpu_hours'] == 0:
 		cloudsite_dict['usage'] = 0.00
 	    else:
@@ -82,4 +119,3 @@ class CpuHours(hf.module.ModuleBase):
                         where(self.subtables['statistics'].c.parent_id == self.dataset['id']).execute().fetchall()
                 data["statistics"] = map(dict, statistics_list)
                 return data
-
@@ -15,9 +15,10 @@
 #   limitations under the License.
 
 import hf
-import lxml.html
 import StringIO
+from itertools import islice
 from sqlalchemy import Column, TEXT, INT
+from common.htmltable import iter_table_rows
 
 class FTSMonitor(hf.module.ModuleBase):
     
@@ -102,27 +103,24 @@ class FTSMonitor(hf.module.ModuleBase):
         
         # access job statistics information
         data = {'latest_data_id': 0}
-        webpage = open(self.source[0].getTmpPath())
-        strwebpage = webpage.read()
-        tree = lxml.html.parse(StringIO.StringIO(strwebpage))
-        rowlist = tree.findall(".//tr")
+        rowlist = iter_table_rows(self.source[0].getTmpPath(), xpath='//tr', limit=None)
         
         # parse job statistics for individual channels
         iBreachIn = 0
         iBreachOut = 0
-        for irow in range(2,len(rowlist)):
-            if len(rowlist[irow])==2: # rows of main table
-                channel = str(rowlist[irow].get('id'))
+        for row in islice(rowlist, 2, None):
+            if len(row)==2: # rows of main table
+                channel = str(row.get('id'))
                 if self.in_channel_filter_string in channel:
                     in_channel_stats = {'Ready': int(0), 'MembersFrom': int(0),
                                         'MembersTo': int(0), 'Active': int(0),
                                         'Finished': int(0), 'FinishedDirty': int(0),
                                         'Failed': int(0), 'Canceled': int(0)}
                     in_channel_stats['Channel'] = channel
-                    for i in range(0,len(rowlist[irow][1])):
-                        strvalue = str(rowlist[irow][1][i].get('style')).replace(
+                    for i in range(0,len(row[1])):
+                        strvalue = str(row[1][i].get('style')).replace(
                                 'width: ','').replace('%','').replace('None','0')
-                        in_channel_stats[str(rowlist[irow][1][i].get(
+                        in_channel_stats[str(row[1][i].get(
                                 'class'))] += int(strvalue)
                     if in_channel_stats['Failed'] >= self.failed_transfers_threshold:
                         iBreachIn += 1
@@ -133,10 +131,10 @@ class FTSMonitor(hf.module.ModuleBase):
                                          'Finished': int(0), 'FinishedDirty': int(0),
                                          'Failed': int(0), 'Canceled': int(0)}
                     out_channel_stats['Channel'] = channel
-                    for i in range(0,len(rowlist[irow][1])):
-                        strvalue = str(rowlist[irow][1][i].get('style')).replace(
+                    for i in range(0,len(row[1])):
+                        strvalue = str(row[1][i].get('style')).replace(
                                 'width: ','').replace('%','').replace('None','0')
-                        out_channel_stats[str(rowlist[irow][1][i].get(
+                        out_channel_stats[str(row[1][i].get(
                                 'class'))] += int(strvalue)
                     if out_channel_stats['Failed'] >= self.failed_transfers_threshold:
                         iBreachOut += 1
@@ -149,21 +147,20 @@ class FTSMonitor(hf.module.ModuleBase):
         #         'latest_data_id': 0}
         webpage2 = open(self.source[1].getTmpPath())
         strwebpage2 = webpage2.read().replace("<br/>","\n")
-        tree2 = lxml.html.parse(StringIO.StringIO(strwebpage2))
-        rowlist2 = tree2.findall(".//tr")
-        for irow in range(1,len(rowlist2)):
+        rowlist2 = iter_table_rows(StringIO.StringIO(strwebpage2), xpath='//tr', limit=None)
+        for row in islice(rowlist2, 1, None):
             MembersFrom = 0
             MembersTo = 0
-            channel = str(rowlist2[irow].get('id'))
+            channel = str(row.get('id'))
             if self.in_channel_filter_string in channel:
                 # get member numbers on 'to' and 'from' side of channel
                 try:
-                    strMembersFrom = str(rowlist2[irow][1][1].text).split('\n')
+                    strMembersFrom = str(row[1][1].text).split('\n')
                     MembersFrom = len(strMembersFrom)-1
                 except Exception:
                     MembersFrom = 1
                 try:
-                    strMembersTo = str(rowlist2[irow][2][1].text).split('\n')
+                    strMembersTo = str(row[2][1].text).split('\n')
                     MembersTo = len(strMembersTo)-1
                 except Exception:
                     MembersTo = 1
@@ -177,12 +174,12 @@ class FTSMonitor(hf.module.ModuleBase):
             if self.out_channel_filter_string in channel:
                 # get member numbers on 'to' and 'from' side of channel
                 try:
-                    strMembersFrom = str(rowlist2[irow][1][1].text).split('\n')
+                    strMembersFrom = str(row[1][1].text).split('\n')
                     MembersFrom = len(strMembersFrom)-1
                 except Exception:
                     MembersFrom = 1
                 try:
-                    strMembersTo = str(rowlist2[irow][2][1].text).split('\n')
+                    strMembersTo = str(row[2][1].text).split('\n')
                     MembersTo = len(strMembersTo)-1
                 except Exception:
                     MembersTo = 1
@@ -16,8 +16,9 @@
 import hf
 from sqlalchemy import TEXT, TIMESTAMP, Column
 import re
+import os
+from common.htmltable import iter_table_rows, cell_text
 from datetime import datetime
-from BeautifulSoup import BeautifulSoup
 
 class G_Stat(hf.module.ModuleBase):
     config_keys = {
@@ -52,52 +53,43 @@ class G_Stat(hf.module.ModuleBase):
             'status': 1
             }
      
-        data_gstat_html = open(self.gstat_html.getTmpPath()).read().replace('\n',' ').replace('\r',' ')
-
-        if len(data_gstat_html) < 2:
+        if os.path.getsize(self.gstat_html.getTmpPath()) < 2:
             data['status'] = -1
 
-        soup = BeautifulSoup(data_gstat_html)
-          
-        # check whether there is a table
-        if False:
-            print('Error while parsing GStat HTML page: Could not find expected table.')
-            data['status'] = -1
-        else:
-            for table in soup.findAll('table'):
-                for tbody in table.findAll('tbody'):
-                    detail = {}
-                    for index_row, row in enumerate(tbody.findAll('tr')):
-                        if index_row % 2 == 0: # regular row
-                            for index_col, col in enumerate(row.findAll('td')):
-                                if index_col == 0:
-                                    continue
-                                elif index_col == 1:
-                                    detail['bdii_hostname'] = str(col.string).strip()
-                                elif index_col == 2:
-                                    detail['service_name'] = str(col.string).strip()
-                                elif index_col == 3:
-                                    for span in col.findAll('span'):
-                                        detail['current_state'] = str(span.string).strip()
-                                elif index_col == 4:
-                                    detail['information'] = str(col.string).strip()
-                                elif index_col == 5:
-                                    for script in col.findAll('script'):
-                                        time_seconds = re.findall(r'[0-9]+', str(script.string))
-                                        detail['last_check'] = datetime.fromtimestamp(int(time_seconds[0]))
-                            self.details_table_db_value_list.append({})
-                            self.details_table_db_value_list[index_row//2] = detail
-                        else: # hidden row for error info
-                            for col in row.findAll('td'):
-                                for script in col.findAll('script'):
-                                    detail = {}
-                                    error_info = str(script.string[script.string.find('(\'')+2:script.string.find(';')-2])
-                                    #error_info = error_info.replace('%','%%')
-                                    error_info = error_info.replace('\\n','<br>')
-                                    detail['error_info'] = error_info
-                                    #print detail
-                                    #print index_row
-                                    self.details_table_db_value_list[index_row//2]['error_info'] = error_info
+        # the rows of every tbody come in pairs, a regular row and a hidden row for error info
+        tbody = None
+        for row in iter_table_rows(self.gstat_html.getTmpPath(), section='tbody', limit=None):
+            if row.getparent() is not tbody:
+                tbody = row.getparent()
+                index_row = 0
+            cols = [col for col in row if col.tag == 'td']
+            if index_row % 2 == 0: # regular row
+                detail = {}
+                for index_col, col in enumerate(cols):
+                    if index_col == 0:
+                        continue
+                    elif index_col == 1:
+                        detail['bdii_hostname'] = cell_text(col)
+                    elif index_col == 2:
+                        detail['service_name'] = cell_text(col)
+                    elif index_col == 3:
+                        for span in col.iter('span'):
+                            detail['current_state'] = cell_text(span)
+                    elif index_col == 4:
+                        detail['information'] = cell_text(col)
+                    elif index_col == 5:
+                        for script in col.iter('script'):
+                            time_seconds = re.findall(r'[0-9]+', script.text or '')
+                            detail['last_check'] = datetime.fromtimestamp(int(time_seconds[0]))
+                self.details_table_db_value_list.append(detail)
+            else: # hidden row for error info
+                for col in cols:
+                    for script in col.iter('script'):
+                        script_text = (script.text or '').replace('\n',' ').replace('\r',' ')
+                        error_info = str(script_text[script_text.find('(\'')+2:script_text.find(';')-2])
+                        error_info = error_info.replace('\\n','<br>')
+                        detail['error_info'] = error_info
+            index_row += 1
         
         #print self.details_table_db_value_list
         for detail in self.details_table_db_value_list:
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import hf
 from sqlalchemy import FLOAT, Column
-from lxml import etree
 
 
 class Ganglia(hf.module.ModuleBase):
@@ -56,6 +55,7 @@ class Ganglia(hf.module.ModuleBase):
         # ..._res for results
     def extractData(self):
 
+        from lxml import etree
         data = {'source_url': self.ganglia_xml.getSourceUrl(),
                 'status': -1,
                 'LOCALTIME': '',
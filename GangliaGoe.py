@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import hf
 from sqlalchemy import TEXT, Column
-from lxml import etree
 
 class GangliaGoe(hf.module.ModuleBase):
     config_keys = {
@@ -34,6 +33,7 @@ class GangliaGoe(hf.module.ModuleBase):
         self.source = hf.downloadService.addDownload(self.config['source_url'])
 
     def extractData(self):
+        from lxml import etree
         self.details_db_value_list = []
         data = {'source_url': self.source_url,
                 'status': 0,
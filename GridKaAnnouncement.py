@@ -15,9 +15,10 @@
 #   limitations under the License.
 
 import hf
-import lxml.html
 import StringIO
 from sqlalchemy import TEXT, INT, Column
+from common.htmltable import iter_table_rows
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous, store_subtables, subtable_rows
 
 class GridKaAnnouncement(hf.module.ModuleBase):
     
@@ -47,7 +48,7 @@ class GridKaAnnouncement(hf.module.ModuleBase):
         Column('nIncidentsLow', INT),
         Column('nIncidentsInfo', INT),
         Column('nInterventionsOutage', INT),
-        Column('nInterventionsAtRisk', INT)], [])
+        Column('nInterventionsAtRisk', INT)] + reuse_columns(), [])
     
     subtable_columns = {
         'incidents': ([
@@ -86,140 +87,151 @@ class GridKaAnnouncement(hf.module.ModuleBase):
         self.interventions_db_value_list = []
     
     def extractData(self):
-        data = {'source_url': self.source.getSourceUrl()}
+        # the announcements change rarely, keep the previous dataset if the page is unchanged
+        fingerprint = source_fingerprint(self, self.source)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
+        data = {'source_url': self.source.getSourceUrl(), 'source_hash': fingerprint}
         webpage = open(self.source.getTmpPath())
         strwebpage = webpage.read().replace("<br>","\n").replace("<br/>","\n")
-        tree = lxml.html.parse(StringIO.StringIO(strwebpage))
-        itables = 0
+        itables = -1
+        table = None
         nIncidentsHigh = 0
         nIncidentsMedium = 0
         nIncidentsLow = 0
         nIncidentsInfo = 0
         nInterventionsOutage = 0
         nInterventionsAtRisk = 0
-        for tables in tree.iter('table'):
+        # the incidents are listed in the first table, the interventions in the second one
+        for row in iter_table_rows(StringIO.StringIO(strwebpage), limit=2):
+            if row.getparent() is not table:
+                table = row.getparent()
+                itables += 1
+                irows = 0
+            irows += 1
+            # the first two rows are headers
+            if irows <= 2:
+                continue
             if itables == 0:
-                for irows in range(2,len(tables)):
-                    row = tables[irows]
-                    severitylevel = row[0][0][0].get('src').replace(
-                            '/monitoring/status/images/','').replace(
-                            '_dot.gif','')
-                    if severitylevel == 'red':
-                        incident_type = 'critical'
-                        severitylevel = 'high'
-                        nIncidentsHigh += 1
-                    elif severitylevel == 'orange':
-                        incident_type = 'warning'
-                        severitylevel = 'medium'
-                        nIncidentsMedium += 1
-                    elif severitylevel == 'yellow':
-                        incident_type = 'warning'
-                        severitylevel = 'low'
-                        nIncidentsLow += 1
-                    elif severitylevel == 'green':
-                        incident_type = 'ok'
-                        severitylevel = 'info'
-                        nIncidentsInfo += 1
-                    Incident = {}
-                    Incident['row_type'] = incident_type
-                    Incident['severity'] = severitylevel
+                severitylevel = row[0][0][0].get('src').replace(
+                        '/monitoring/status/images/','').replace(
+                        '_dot.gif','')
+                if severitylevel == 'red':
+                    incident_type = 'critical'
+                    severitylevel = 'high'
+                    nIncidentsHigh += 1
+                elif severitylevel == 'orange':
+                    incident_type = 'warning'
+                    severitylevel = 'medium'
+                    nIncidentsMedium += 1
+                elif severitylevel == 'yellow':
+                    incident_type = 'warning'
+                    severitylevel = 'low'
+                    nIncidentsLow += 1
+                elif severitylevel == 'green':
+                    incident_type = 'ok'
+                    severitylevel = 'info'
+                    nIncidentsInfo += 1
+                Incident = {}
+                Incident['row_type'] = incident_type
+                Incident['severity'] = severitylevel
 
-                    time = row[1].text_content()
-                    if '\n' in time:
-                        submit_time = time.split('\n')[0]
-                        update_time = time.split('\n')[1]
-                        Incident['submit_time'] = submit_time if \
-                                (submit_time!='' and not submit_time is None) else 'n/a'
-                        Incident['update_time'] = update_time if \
-                                (update_time!='' and not submit_time is None) else 'n/a'
-                    elif time <> '':
-                        Incident['submit_time'] = time
-                        Incident['update_time'] = 'n/a'
-                    else:
-                        Incident['submit_time'] = 'n/a'
-                        Incident['update_time'] = 'n/a'
+                time = row[1].text_content()
+                if '\n' in time:
+                    submit_time = time.split('\n')[0]
+                    update_time = time.split('\n')[1]
+                    Incident['submit_time'] = submit_time if \
+                            (submit_time!='' and not submit_time is None) else 'n/a'
+                    Incident['update_time'] = update_time if \
+                            (update_time!='' and not submit_time is None) else 'n/a'
+                elif time <> '':
+                    Incident['submit_time'] = time
+                    Incident['update_time'] = 'n/a'
+                else:
+                    Incident['submit_time'] = 'n/a'
+                    Incident['update_time'] = 'n/a'
 
-                    if row[2].text == None:
-                        Incident['description'] = 'n/a'
-                    else:
-                        Incident['description'] = \
-                                row[2].text_content().replace("\n","<br/>")
-                    if row[3].text == None:
-                        Incident['affecting_explanation'] = 'n/a'
-                    else:
-                        Incident['affecting_explanation'] = \
-                                row[3].text_content().replace("\n","<br/>")
-                    self.incidents_db_value_list.append(Incident)
-                data['nIncidentsHigh'] = nIncidentsHigh
-                data['nIncidentsMedium'] = nIncidentsMedium
-                data['nIncidentsLow'] = nIncidentsLow
-                data['nIncidentsInfo'] = nIncidentsInfo
+                if row[2].text == None:
+                    Incident['description'] = 'n/a'
+                else:
+                    Incident['description'] = \
+                            row[2].text_content().replace("\n","<br/>")
+                if row[3].text == None:
+                    Incident['affecting_explanation'] = 'n/a'
+                else:
+                    Incident['affecting_explanation'] = \
+                            row[3].text_content().replace("\n","<br/>")
+                self.incidents_db_value_list.append(Incident)
             elif itables == 1:
-                for irows in range(2,len(tables)):
-                    row = tables[irows]
-                    severitylevel = row[0][0][0].get('src').replace(
-                           '/monitoring/status/images/','').replace('_dot.gif','')
-                    if severitylevel == 'red':
-                        intervention_type = 'critical'
-                        severitylevel = 'outage'
-                        nInterventionsOutage += 1
-                    elif severitylevel == 'green':
-                        intervention_type = 'ok'
-                        severitylevel = 'info/at risk'
-                        nInterventionsAtRisk += 1
-                    Intervention = {}
-                    Intervention['row_type'] = intervention_type
-                    Intervention['severity'] = severitylevel
+                severitylevel = row[0][0][0].get('src').replace(
+                       '/monitoring/status/images/','').replace('_dot.gif','')
+                if severitylevel == 'red':
+                    intervention_type = 'critical'
+                    severitylevel = 'outage'
+                    nInterventionsOutage += 1
+                elif severitylevel == 'green':
+                    intervention_type = 'ok'
+                    severitylevel = 'info/at risk'
+                    nInterventionsAtRisk += 1
+                Intervention = {}
+                Intervention['row_type'] = intervention_type
+                Intervention['severity'] = severitylevel
 
-                    SubmitUpdateTime = row[1].text_content()
-                    if '\n' in SubmitUpdateTime:
-                        submit_time = SubmitUpdateTime.split('\n')[0]
-                        update_time = SubmitUpdateTime.split('\n')[1]
-                        Intervention['submit_time'] = submit_time if (
-                                submit_time!='' and not submit_time is None
-                                ) else 'n/a'
-                        Intervention['update_time'] = update_time if (
-                                update_time!='' and not submit_time is None
-                                ) else 'n/a'
-                    elif SubmitUpdateTime <> '':
-                        Intervention['submit_time'] = SubmitUpdateTime
-                        Intervention['update_time'] = 'n/a'
-                    else:
-                        Intervention['submit_time'] = 'n/a'
-                        Intervention['update_time'] = 'n/a'
+                SubmitUpdateTime = row[1].text_content()
+                if '\n' in SubmitUpdateTime:
+                    submit_time = SubmitUpdateTime.split('\n')[0]
+                    update_time = SubmitUpdateTime.split('\n')[1]
+                    Intervention['submit_time'] = submit_time if (
+                            submit_time!='' and not submit_time is None
+                            ) else 'n/a'
+                    Intervention['update_time'] = update_time if (
+                            update_time!='' and not submit_time is None
+                            ) else 'n/a'
+                elif SubmitUpdateTime <> '':
+                    Intervention['submit_time'] = SubmitUpdateTime
+                    Intervention['update_time'] = 'n/a'
+                else:
+                    Intervention['submit_time'] = 'n/a'
+                    Intervention['update_time'] = 'n/a'
 
-                    StartEnd = row[2].text_content()
-                    if '\n' in StartEnd:
-                        intervention_start = StartEnd.split('\n')[0]
-                        intervention_end = StartEnd.split('\n')[1]
-                        Intervention['intervention_start'] = intervention_start if (
-                                intervention_start!='' and not intervention_start is None
-                                ) else 'n/a'
-                        Intervention['intervention_end'] = intervention_end if (
-                                intervention_end!='' and not intervention_end is None
-                                ) else 'n/a'
-                    elif StartEnd <> '':
-                        Intervention['intervention_start'] = StartEnd
-                        Intervention['intervention_end'] = 'n/a'
-                    else:
-                        Intervention['intervention_start'] = 'n/a'
-                        Intervention['intervention_end'] = 'n/a'
+                StartEnd = row[2].text_content()
+                if '\n' in StartEnd:
+                    intervention_start = StartEnd.split('\n')[0]
+                    intervention_end = StartEnd.split('\n')[1]
+                    Intervention['intervention_start'] = intervention_start if (
+                            intervention_start!='' and not intervention_start is None
+                            ) else 'n/a'
+                    Intervention['intervention_end'] = intervention_end if (
+                            intervention_end!='' and not intervention_end is None
+                            ) else 'n/a'
+                elif StartEnd <> '':
+                    Intervention['intervention_start'] = StartEnd
+                    Intervention['intervention_end'] = 'n/a'
+                else:
+                    Intervention['intervention_start'] = 'n/a'
+                    Intervention['intervention_end'] = 'n/a'
+
+                if row[3].text == None:
+                    Intervention['description'] = 'n/a'
+                else:
+                    Intervention['description'] = \
+                            row[3].text_content().replace("\n","<br/>")
+                if row[4].text == None:
+                    Intervention['affecting_explanation'] = 'n/a'
+                else:
+                    Intervention['affecting_explanation'] = \
+                            row[4].text_content().replace("\n","<br/>")
+                self.interventions_db_value_list.append(Intervention)
+        if itables >= 0:
+            data['nIncidentsHigh'] = nIncidentsHigh
+            data['nIncidentsMedium'] = nIncidentsMedium
+            data['nIncidentsLow'] = nIncidentsLow
+            data['nIncidentsInfo'] = nIncidentsInfo
+        if itables >= 1:
+            data['nInterventionsOutage'] = nInterventionsOutage
+            data['nInterventionsAtRisk'] = nInterventionsAtRisk
 
-                    if row[3].text == None:
-                        Intervention['description'] = 'n/a'
-                    else:
-                        Intervention['description'] = \
-                                row[3].text_content().replace("\n","<br/>")
-                    if row[4].text == None:
-                        Intervention['affecting_explanation'] = 'n/a'
-                    else:
-                        Intervention['affecting_explanation'] = \
-                                row[4].text_content().replace("\n","<br/>")
-                    self.interventions_db_value_list.append(Intervention)
-                data['nInterventionsOutage'] = nInterventionsOutage
-                data['nInterventionsAtRisk'] = nInterventionsAtRisk
-            itables += 1
-            
         # check if numbers of different incidents and interventions
         # exceed the limits and set status accordingly
         if nIncidentsHigh >= self.nCritIncidentsHigh or \
@@ -236,19 +248,14 @@ class GridKaAnnouncement(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['incidents'].insert().execute(
-                [dict(parent_id=parent_id, **row) for row in self.incidents_db_value_list])
-        self.subtables['interventions'].insert().execute(
-                [dict(parent_id=parent_id, **row) for row in self.interventions_db_value_list])
+        store_subtables(self, parent_id, {
+                'incidents': self.incidents_db_value_list,
+                'interventions': self.interventions_db_value_list})
     
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        incident_list = self.subtables['incidents'].select().where(
-                self.subtables['incidents'].c.parent_id==self.dataset['id']
-                ).execute().fetchall()
+        incident_list = subtable_rows(self, 'incidents').execute().fetchall()
         data['incident_list'] = map(dict, incident_list)
-        intervention_list = self.subtables['interventions'].select().where(
-                self.subtables['interventions'].c.parent_id==self.dataset['id']
-                ).execute().fetchall()
+        intervention_list = subtable_rows(self, 'interventions').execute().fetchall()
         data['intervention_list'] = map(dict, intervention_list)
         return data
@@ -16,25 +16,31 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import htcondor
-import classad
 import re
 import copy
 import time
-import numpy as np
 from datetime import timedelta, datetime
+from common.scheddfanout import ScheddFanOut
+from common.jobhistory import CondorHistoryStore
+from common.plotting import pyplot
 class HTCondorJobsHistory(hf.module.ModuleBase):
 
 	config_keys = {
 		'source_url' : ('Not used, but filled to avoid errors','http://google.com'),
 		'plotsize_x' : ('Size of the plot in x', '8.9'),
 		'plotsize_y' : ('Size of the plot in y', '5.8'),
+		'schedd_timeout' : ('Seconds after which the history of a schedd is given up', '300'),
+		'history_db' : ('SQLite file keeping the jobs of the last 7 days between runs, only new jobs are requested from the schedds', 'tmp/htcondor_jobs_history.sqlite'),
 	}
 
 	table_columns = [Column('filename_plot', TEXT)], ['filename_plot']
+
+	# number of jobs requested from the history of a schedd at once, see requestHistory
+	history_page = 60000
 	
 	def prepareAcquisition(self):
 
+		import htcondor
 		# Setting defaults
 		self.source_url = self.config["source_url"]
 
@@ -71,7 +77,6 @@ class HTCondorJobsHistory(hf.module.ModuleBase):
 		}
 
 		self.quantities_list = [quantity for quantity in self.condor_projection if quantity != "GlobalJobId"]
-		self.condor_jobs_information = {}
 		self.jobs_history_statistics = {
 			"removed" : [],
 			"completed" : []
@@ -86,52 +91,92 @@ class HTCondorJobsHistory(hf.module.ModuleBase):
 		# timeold = 86400
 
 	def extractData(self):
+		from common.jobtable import JobTable
+		import htcondor
 		# Initialize the data for the main table
 		data = {
 			'filename_plot' : ''
 		}
 		
-		requirement = "RoutedToJobId =?= undefined && JobStartDate > 0 && (EnteredCurrentStatus >= {NOW} - 604800)".format(NOW = int(time.time()))
-		# Extract job information using htcondor python bindings
+		window_start = int(time.time()) - 604800
+		history = CondorHistoryStore(self.config["history_db"], self.quantities_list)
+		# Extract the jobs which terminated since the last run from all schedds at once using htcondor python bindings
+		schedds = []
 		for classAd in self.collector.query(htcondor.AdTypes.Schedd):
-			ad_index = 0
-			job_id = "undefined"
-			try:
-				for ads in htcondor.Schedd(classAd).history(requirement, self.condor_projection, 60000):
-					job_id = ads.get("GlobalJobId")
-					self.condor_jobs_information[job_id] = {quantity : (ads.get(quantity).eval() if isinstance(ads.get(quantity), classad.ExprTree) else ads.get(quantity)) for quantity in self.quantities_list}
-					ad_index += 1
-			except RuntimeError as err:
-				print "Failed to get ad for scheduler", "after Job ID", job_id,"number",ad_index," --> Aborting"
-                                print "Error: {0}".format(err)
-
-		# Fill the main table and the user statistics information
-		for ids, job in self.condor_jobs_information.iteritems():
-			# Determine user and set up user dependent statistics
-			user = job["User"]
-			# Summarize the status information
-			status = self.jobs_status_dict.get(job["JobStatus"])
-			if status == "completed":
-				# Determine the site where the job was completed
-				if job["MachineAttrCloudSite0"]:
-					self.sites_statistics.setdefault(job["MachineAttrCloudSite0"].lower(),0)
-					self.sites_statistics[job["MachineAttrCloudSite0"].lower()] += 1
-				# Determine the runtime and requested walltime of the completed job
-				if user not in self.walltime_runtime_statistics:
-					self.walltime_runtime_statistics[user] = {}
-				if job["CommittedTime"] - job["CommittedSuspensionTime"] >= 0 and job["ExitStatus"] == 0 and job["RequestWalltime"]:
-					self.walltime_runtime_statistics[user].setdefault(job["RequestWalltime"], []).\
-						append(job["CommittedTime"] - job["CommittedSuspensionTime"])
-			if job["EnteredCurrentStatus"]:
-				self.jobs_history_statistics[status].append(job["EnteredCurrentStatus"])
+			name = classAd.get("Name")
+			since = int(max(window_start, history.cursor(name)))
+			schedds.append((name, (name, htcondor.Schedd(classAd), since)))
+		histories = ScheddFanOut(schedds, self.requestHistory,
+			timeout = float(self.config["schedd_timeout"]), logger = self.logger)
+		latest_entered = {}
+		for name, ads in histories:
+			entered = history.add(name, ads)
+			latest_entered[name] = max(latest_entered.get(name, 0), entered)
+		# Only a completely received history moves the cursor, the history is sorted by descending time
+		for result in histories.results:
+			if result.ok and result.name in latest_entered:
+				history.advance(result.name, latest_entered[result.name])
+		history.commit()
+		history.expire(window_start)
+		jobs = JobTable.from_ads(history.jobs(),
+			numeric = ["JobStatus", "EnteredCurrentStatus", "CommittedTime", "CommittedSuspensionTime", "ExitStatus", "RequestWalltime"],
+			categorical = ["User", "MachineAttrCloudSite0"],
+			converters = {"MachineAttrCloudSite0" : lambda site: site.lower() or None})
+		history.close()
+
+		# Summarize the status information
+		for code, status in self.jobs_status_dict.iteritems():
+			if status in self.jobs_history_statistics:
+				entered = jobs["EnteredCurrentStatus"]
+				self.jobs_history_statistics[status] = entered[(jobs["JobStatus"] == code) & (entered > 0)]
+		completed = jobs["JobStatus"] == 4
+		# Determine the sites where the jobs were completed
+		self.sites_statistics = jobs.count_by("MachineAttrCloudSite0", completed)
+		# Determine the runtime and requested walltime of the completed jobs per user
+		for user in jobs.count_by("User", completed):
+			self.walltime_runtime_statistics[user] = {}
+		runtime = jobs["CommittedTime"] - jobs["CommittedSuspensionTime"]
+		successful = completed & (runtime >= 0) & (jobs["ExitStatus"] == 0) & (jobs["RequestWalltime"] > 0)
+		for (user, walltime), rows in jobs.groups(["User", "RequestWalltime"], successful):
+			self.walltime_runtime_statistics[user][int(walltime)] = runtime[rows]
 
 		# Plot creation for user statistics
 		data["filename_plot"] = self.plot()
 
 		return data
 
+	def requestHistory(self, request):
+		"""
+		Jobs of a schedd which entered their status since the cursor. The history
+		comes newest first and at most history_page jobs at once, a full page is
+		followed by the page before its oldest job until the history is exhausted.
+		"""
+		name, schedd, since = request
+		until = None
+		while True:
+			requirement = "RoutedToJobId =?= undefined && JobStartDate > 0 && (EnteredCurrentStatus >= {SINCE})".\
+				format(SINCE = since)
+			if until is not None:
+				# jobs of the same second may have been cut off, those received twice are stored once
+				requirement += " && (EnteredCurrentStatus <= {UNTIL})".format(UNTIL = until)
+			received = 0
+			oldest = None
+			for ad in schedd.history(requirement, self.condor_projection, self.history_page):
+				received += 1
+				entered = ad.get("EnteredCurrentStatus")
+				if isinstance(entered, (int, long, float)) and (oldest is None or entered < oldest):
+					oldest = int(entered)
+				yield name, ad
+			if received < self.history_page:
+				return
+			if oldest is None or oldest == until:
+				# the history is incomplete, so the cursor of the schedd is not moved
+				raise RuntimeError("more than %i jobs entered their status at %s" % (self.history_page, until))
+			until = oldest
+
 	def plot(self):
-		import matplotlib.pyplot as plt
+		import numpy as np
+		plt = pyplot()
 		import matplotlib.patches as mpatches
 		import matplotlib.markers as markers
 
@@ -164,10 +209,8 @@ class HTCondorJobsHistory(hf.module.ModuleBase):
 		for c,m,user in zip(colors,markers.MarkerStyle.filled_markers,self.walltime_runtime_statistics):
 			user_outliers_walltimes = []
 			user_outliers_runtimes = []
-			for walltime in self.walltime_runtime_statistics[user]:
-				per_down = np.percentile(self.walltime_runtime_statistics[user][walltime], 2.5)
-				per_50 = np.median(self.walltime_runtime_statistics[user][walltime])
-				per_up = np.percentile(self.walltime_runtime_statistics[user][walltime], 97.5)
+			for walltime, runtimes in self.walltime_runtime_statistics[user].iteritems():
+				per_down, per_50, per_up = np.percentile(runtimes, [2.5, 50, 97.5])
 				axis_walltime_runtime.errorbar(
 					[walltime],
 					[per_50],
@@ -183,8 +226,8 @@ class HTCondorJobsHistory(hf.module.ModuleBase):
 					capthick = 1.5, 
 					capsize = 10
 				)
-				outlier_runtimes = [runtime for runtime in self.walltime_runtime_statistics[user][walltime] if (runtime < per_down or runtime > per_up)]
-				outlier_walltimes = [walltime for i in range(len(outlier_runtimes))]
+				outlier_runtimes = list(runtimes[(runtimes < per_down) | (runtimes > per_up)])
+				outlier_walltimes = [walltime] * len(outlier_runtimes)
 				user_outliers_walltimes += outlier_walltimes
 				user_outliers_runtimes += outlier_runtimes
 			if len(self.walltime_runtime_statistics[user]) > 0:
@@ -232,5 +275,7 @@ class HTCondorJobsHistory(hf.module.ModuleBase):
 		fig_jobhistory.savefig(plotname + "_jobs_terminated.png", dpi=91, bbox_inches="tight")
 		fig_walltime_runtime.savefig(plotname + "_walltime_runtime.png", dpi=91, bbox_inches="tight")
 		fig_completedjobs_site.savefig(plotname + "_jobs_site.png", dpi=91, bbox_inches="tight")
+		for fig in (fig_jobhistory, fig_walltime_runtime, fig_completedjobs_site):
+			plt.close(fig)
 		
 		return plotname
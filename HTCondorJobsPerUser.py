@@ -16,13 +16,11 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, BIGINT, Column
-import htcondor
 import re
 import copy
 import time
-import numpy as np
 from datetime import timedelta
-import types
+from common.plotting import FigureSpec, submit
 class HTCondorJobsPerUser(hf.module.ModuleBase):
 
 	config_keys = {
@@ -77,6 +75,7 @@ class HTCondorJobsPerUser(hf.module.ModuleBase):
 
 	def prepareAcquisition(self):
 
+		import htcondor
 		# Setting defaults
 		self.source_url = self.config["source_url"]
 
@@ -149,6 +148,9 @@ class HTCondorJobsPerUser(hf.module.ModuleBase):
 		self.statistics_db_value_list = []
 
 	def extractData(self):
+		from common.jobtable import JobTable
+		import numpy as np
+		import htcondor
 		# Initialize the data for the main table
 		data = {
 			'running': 0,
@@ -172,78 +174,65 @@ class HTCondorJobsPerUser(hf.module.ModuleBase):
 		for query in htcondor.poll(self.queries):
 			for ads in query:
 				job_id = ads.get("GlobalJobId")
-				self.condor_jobs_information[job_id] = {quantity : ads.get(quantity) for quantity in self.quantities_list}
+				self.condor_jobs_information[job_id] = ads
+		jobs = JobTable.from_ads(self.condor_jobs_information.itervalues(),
+			numeric = [quantity for quantity in self.quantities_list if quantity not in ("User", "MachineAttrCloudSite0")],
+			categorical = ["User", "MachineAttrCloudSite0"],
+			converters = {"MachineAttrCloudSite0" : lambda site: site.lower()})
+		for user in jobs.categories["User"]:
+			self.user_statistics[user] = copy.deepcopy(self.user_statistics_dict)
 
-		# Fill the main table and the user statistics information
-		for jobid, job in self.condor_jobs_information.iteritems():
-			# Count remotable jobs
-			if job["RemoteJob"]:
-				data["remote"] += 1
-			# Determine user and set up user dependent statistics
-			user = job["User"]
-			if user not in self.user_statistics:
-				self.user_statistics[user] = copy.deepcopy(self.user_statistics_dict)
-			# Count used RAM in MiB
-			if job["ResidentSetSize"] is None:
-				pass
-			else:
-				self.user_statistics[user]["ram"] += job["ResidentSetSize"]/1024.
-				data["ram"] += job["ResidentSetSize"]/1024.
-			# Count requested RAM in MiB
-			self.user_statistics[user]["requested_memory"] += job["RequestMemory"]
-			data["requested_memory"] += job["RequestMemory"]
-			# Count used cores
-			self.user_statistics[user]["cores"] += job["RequestCpus"]
-			data["cores"] += job["RequestCpus"]
-			
-			# Get information on network traffic.
-			if type(job["NetworkInputMb"]) == types.NoneType:
-				pass
-			else:
-				self.user_statistics[user]["NetworkInputMb"] += job["NetworkInputMb"]
-			if type(job["NetworkOutputMb"]) == types.NoneType:
-				pass
-			else:
-				self.user_statistics[user]["NetworkOutputMb"] += job["NetworkOutputMb"]
-			# Get information on input files.
-			self.user_statistics[user]["transfer"] += job["TransferInputSizeMB"]
-			# Summarize the status information
-			status = self.jobs_status_dict.get(job["JobStatus"])
-			self.user_statistics[user][status] +=1
+		# Count remotable jobs
+		data["remote"] = int(np.sum(jobs["RemoteJob"] > 0))
+		# Count used RAM in MiB
+		ram = jobs["ResidentSetSize"]/1024.
+		for user, value in jobs.sum_by("User", ram).iteritems():
+			self.user_statistics[user]["ram"] = value
+		data["ram"] = np.nansum(ram)
+		# Count requested RAM in MiB and used cores
+		for quantity, attribute in (("requested_memory", "RequestMemory"), ("cores", "RequestCpus")):
+			for user, value in jobs.sum_by("User", jobs[attribute]).iteritems():
+				self.user_statistics[user][quantity] = value
+			data[quantity] = np.nansum(jobs[attribute])
+		data["cores"] = int(data["cores"])
+		# Get information on network traffic.
+		for quantity in ("NetworkInputMb", "NetworkOutputMb"):
+			for user, value in jobs.sum_by("User", jobs[quantity]).iteritems():
+				self.user_statistics[user][quantity] = value
+		# Summarize the status information
+		for code, status in self.jobs_status_dict.iteritems():
+			for user, count in jobs.count_by("User", jobs["JobStatus"] == code).iteritems():
+				self.user_statistics[user][status] = count
 			if status in data:
-				data[status] += 1
-			# Calculate the time in the queue for all jobs in seconds
-			if status == "running": 
-				try:
-					data["qtime"].append(max(0, job["JobStartDate"] - job["QDate"]))
-				except Exception:
-					pass
-			# Determine the sites the user is running his jobs on
-			job["MachineAttrCloudSite0"] = "Undefined" if job["MachineAttrCloudSite0"] is None else job["MachineAttrCloudSite0"]
-			if job["MachineAttrCloudSite0"].lower() not in self.user_statistics[user]["sites"] and status == "running":
-				self.user_statistics[user]["sites"].append(job["MachineAttrCloudSite0"].lower())
-			# Calculate runtimes, cputimes and efficiencies of each job of a user
-			if status == "running":
-				try:	
-					cputime = job["RemoteUserCpu"] + job["RemoteSysCpu"]
-					runtime = job["RequestCpus"] * (job["ServerTime"] - job["JobStartDate"])
-					efficiency = float(cputime)/float(runtime)
-					# Avoiding not up to date values of JobCurrentStartDate, that result in efficiencies bigger than 1
-					if efficiency <= 1.:
-						self.user_statistics[user]["efficiencies"].append(efficiency)
-				except Exception:
-					pass
+				data[status] = int(np.sum(jobs["JobStatus"] == code))
+		running = jobs["JobStatus"] == 2
+		# Calculate the time in the queue for all jobs in seconds
+		qtime = np.maximum(0, jobs["JobStartDate"] - jobs["QDate"])[running]
+		data["qtime"] = qtime[~np.isnan(qtime)]
+		# Determine the sites the user is running his jobs on
+		for (user, site), rows in jobs.groups(["User", "MachineAttrCloudSite0"], running):
+			self.user_statistics[user]["sites"].append(site)
+		for user, count in jobs.count_by("User", running & (jobs["MachineAttrCloudSite0"] < 0)).iteritems():
+			self.user_statistics[user]["sites"].append("undefined")
+		# Calculate runtimes, cputimes and efficiencies of each job of a user
+		with np.errstate(divide = "ignore", invalid = "ignore"):
+			cputime = jobs["RemoteUserCpu"] + jobs["RemoteSysCpu"]
+			runtime = jobs["RequestCpus"] * (jobs["ServerTime"] - jobs["JobStartDate"])
+			efficiency = cputime / runtime
+			# Avoiding not up to date values of JobCurrentStartDate, that result in efficiencies bigger than 1
+			valid_efficiency = running & np.isfinite(efficiency) & (efficiency <= 1.)
+		for (user,), rows in jobs.groups(["User"], valid_efficiency):
+			self.user_statistics[user]["efficiencies"] = efficiency[rows]
+		all_efficiencies = efficiency[valid_efficiency]
 
-		all_efficiencies = []
 		for user in self.user_statistics:
 			user_data = {"batchsystem_user": user}
 			for status in self.jobs_status_dict.itervalues():
 				user_data[status] = self.user_statistics[user][status]
-			user_data["cores"],user_data["ram"] = self.user_statistics[user]["cores"], self.determine_diskspace(self.user_statistics[user]["ram"], given_unit="MiB")
+			user_data["cores"],user_data["ram"] = int(self.user_statistics[user]["cores"]), self.determine_diskspace(self.user_statistics[user]["ram"], given_unit="MiB")
 			user_data["requested_memory"] = max(1,self.determine_diskspace(self.user_statistics[user]["requested_memory"], given_unit = "MiB"))
 			user_data["efficiency"] = round(np.mean(self.user_statistics[user]["efficiencies"]),2) \
 				if len(self.user_statistics[user]["efficiencies"]) > 0 else 1.0
-			all_efficiencies += self.user_statistics[user]["efficiencies"]
 			user_data["sites"] = ",\n".join(self.user_statistics[user]["sites"])
 			user_data["priority"] = round(self.priorities[user],1)
 			user_data["NetworkInputMb"] = round(self.user_statistics[user]["NetworkInputMb"],2)
@@ -292,10 +281,8 @@ class HTCondorJobsPerUser(hf.module.ModuleBase):
 		return int(round(given_number/1024.0**orders_to_transform, 1))
 
 	def plot(self):
-		import matplotlib.pyplot as plt
-		import matplotlib.patches as mpatches
 		# initializing figure
-		fig = plt.figure(figsize=(float(self.config["plotsize_x"]), float(self.config["plotsize_y"])))
+		fig = FigureSpec(figsize=(float(self.config["plotsize_x"]), float(self.config["plotsize_y"])))
 		axis = fig.add_subplot(111)
 		# determining, whether log x-axis is needed
 		max_number = max([user_stats[status] for user_stats in self.user_statistics.itervalues() for status in self.jobs_status_dict.itervalues()])
@@ -313,20 +300,21 @@ class HTCondorJobsPerUser(hf.module.ModuleBase):
 						previous_status_value = 0
 					previous_status_value += float(self.user_statistics[user][jobstatus])
 		# Creating figure legend
-		status_label_objects = []
-		x_max = axis.get_xlim()[1]
+		axis.scale_xlim(upper=30 if log_needed else 1.3)
 		axis.set_ylim(-1, max(3,len(self.user_statistics)))
+		status_label_objects = []
+		status_labels = []
 		for color,jobstatus in zip(self.jobs_status_colors,self.jobs_status_dict.itervalues()):
-			status_label_objects.append(mpatches.Patch(facecolor=color, label=jobstatus, edgecolor="black"))
-		axis.legend(status_label_objects, [o.get_label() for o in status_label_objects], loc="upper right")
+			status_label_objects.append(fig.patch(facecolor=color, label=jobstatus, edgecolor="black"))
+			status_labels.append(jobstatus)
+		axis.legend(status_label_objects, status_labels, loc="upper right")
 		# Optimizing figure
-		x_max *=30 if log_needed else 1.3
-		axis.set_xlim(offset, x_max)
+		axis.set_xlim(left=offset)
 		axis.set_title("jobs per user")
 		axis.set_xlabel("number of jobs")
 		axis.set_ylabel("user")
 		axis.set_yticks([])
-		# save figure
+		# save figure in the background
 		plotname = hf.downloadService.getArchivePath( self.run, self.instance_name + "_userinfo.png")
-		fig.savefig(plotname, dpi=91, bbox_inches="tight")
+		submit(fig, plotname, self.logger, dpi=91, bbox_inches="tight")
 		return plotname
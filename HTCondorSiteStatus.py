@@ -16,9 +16,8 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import numpy as np
-import htcondor
 import copy
+from common.plotting import FigureSpec, submit
 
 class HTCondorSiteStatus(hf.module.ModuleBase):
 
@@ -55,6 +54,7 @@ class HTCondorSiteStatus(hf.module.ModuleBase):
 
         def prepareAcquisition(self):
 
+                import htcondor
                 # Setting defaults
                 self.source_url = self.config["source_url"]
 
@@ -100,6 +100,9 @@ class HTCondorSiteStatus(hf.module.ModuleBase):
 		return
 
         def extractData(self):
+		from common.jobtable import JobTable
+		import htcondor
+		import numpy as np
 		data = {
 			'claimed' : 0,
 			'unclaimed' : 0,
@@ -113,27 +116,31 @@ class HTCondorSiteStatus(hf.module.ModuleBase):
 		# Extract site information using htcondor python bindings
 		result = self.collector.query(ad_type = htcondor.AdTypes.Startd, constraint = "RoutedToJobId =?= undefined && Cpus > 0", projection = self.condor_projection)
 
+		slots = JobTable.from_ads(result,
+			numeric = ["Cpus", "LoadAvg"],
+			categorical = ["CloudSite", "Activity", "State", "Machine"],
+			converters = {"CloudSite" : lambda name: name.lower(), "Activity" : lambda name: name.lower(), "State" : lambda name: name.lower()})
+
 		# Fill the main table and the cloud site statistics information
-		for slot in result:
-			# Determine cloud site and set up cloud site dependent statistics
-			cloudsite = slot["CloudSite"].lower()
-			if cloudsite not in self.cloudsite_statistics:
-				self.cloudsite_statistics[cloudsite] = copy.deepcopy(self.cloudsite_statistics_dict)
-			# Summarize cloud site activity information
-			activity = slot["Activity"].lower()
-			self.cloudsite_statistics[cloudsite][activity] += slot["Cpus"] 
-			# Summarize the different slot states of interest
-			data['total'] += slot["Cpus"]
-			slotstate = slot["State"].lower()
+		for cloudsite in slots.categories["CloudSite"]:
+			self.cloudsite_statistics[cloudsite] = copy.deepcopy(self.cloudsite_statistics_dict)
+		# Summarize cloud site activity information
+		for activity in self.cloudsite_activity_colordict:
+			for cloudsite, cpus in slots.sum_by("CloudSite", slots["Cpus"], slots.isin("Activity", [activity])).iteritems():
+				self.cloudsite_statistics[cloudsite][activity] = int(cpus)
+		# Summarize the different slot states of interest
+		data['total'] = int(np.nansum(slots["Cpus"]))
+		for slotstate, cpus in slots.sum_by("State", slots["Cpus"]).iteritems():
 			if slotstate in data:
-				data[slotstate] += slot["Cpus"]
-			# Determine unique machine names of the slots and add them to the corresponding set of the cloudsite
-			self.cloudsite_statistics[cloudsite]["machines"].add(slot["Machine"])
-			# Determine the average load of the slot
-			load = slot["LoadAvg"] / slot["Cpus"]
-			data['average_load'].append(load) 
-			if load < 0.5 and activity == 'busy':
-				data['underused'] += slot["Cpus"]
+				data[slotstate] = int(cpus)
+		# Determine unique machine names of the slots and add them to the corresponding set of the cloudsite
+		for (cloudsite, machine), rows in slots.groups(["CloudSite", "Machine"]):
+			self.cloudsite_statistics[cloudsite]["machines"].add(machine)
+		# Determine the average load of the slots
+		load = slots["LoadAvg"] / slots["Cpus"]
+		data['average_load'] = list(load)
+		underused = (load < 0.5) & slots.isin("Activity", ["busy"])
+		data['underused'] = int(np.nansum(slots["Cpus"][underused]))
 
 		for cloudsite,cloudsite_stats in self.cloudsite_statistics.iteritems():
 			cloudsite_data = {
@@ -170,10 +177,8 @@ class HTCondorSiteStatus(hf.module.ModuleBase):
                 return data
 
 	def plot(self):
-		import matplotlib.pyplot as plt
-		import matplotlib.patches as mpatches
 		# initializing figure
-		fig = plt.figure(figsize=(float(self.config["plotsize_x"]), float(self.config["plotsize_y"])))
+		fig = FigureSpec(figsize=(float(self.config["plotsize_x"]), float(self.config["plotsize_y"])))
 		axis = fig.add_subplot(111)
 		# determining, whether log x-axis i needed
 		max_number = max([cloudsite_stats[activity] for cloudsite_stats in self.cloudsite_statistics.itervalues() for activity in self.cloudsite_activity_colordict])
@@ -191,20 +196,21 @@ class HTCondorSiteStatus(hf.module.ModuleBase):
 						previous_status_value = 0
 					previous_status_value += float(self.cloudsite_statistics[cloudsite][activity])
 		# Creating figure legend
-		activity_label_objects = []
-		x_max = axis.get_xlim()[1]
+		axis.scale_xlim(upper=30 if log_needed else 1.3)
 		axis.set_ylim(-1,len(self.cloudsite_statistics))
+		activity_label_objects = []
+		activity_labels = []
 		for activity,color in self.cloudsite_activity_colordict.iteritems():
-			activity_label_objects.append(mpatches.Patch(facecolor=color, label=activity, edgecolor="black"))
-		axis.legend(activity_label_objects, [o.get_label() for o in activity_label_objects], loc="upper right")
+			activity_label_objects.append(fig.patch(facecolor=color, label=activity, edgecolor="black"))
+			activity_labels.append(activity)
+		axis.legend(activity_label_objects, activity_labels, loc="upper right")
 		# Optimizing figure
-		x_max *=30 if log_needed else 1.3
-		axis.set_xlim(offset, x_max)
+		axis.set_xlim(left=offset)
 		axis.set_title("cores per site")
 		axis.set_xlabel("number of cores")
 		axis.set_ylabel("site")
 		axis.set_yticks([])
-		# save figure
+		# save figure in the background
 		plotname = hf.downloadService.getArchivePath( self.run, self.instance_name + "_siteinfo.png")
-		fig.savefig(plotname, dpi=91, bbox_inches="tight")
+		submit(fig, plotname, self.logger, dpi=91, bbox_inches="tight")
 		return plotname
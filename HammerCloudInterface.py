@@ -16,8 +16,7 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import lxml.html as lh
-import urllib2 as ul
+from common.fetcher import fetch_all
 
 class HammerCloudInterface(hf.module.ModuleBase):
 	config_keys = {
@@ -46,11 +45,13 @@ class HammerCloudInterface(hf.module.ModuleBase):
 		self.site_names = self.config['sites_of_interest'].split(";")
 		self.running_tests_db_value_list = []
 	def extractData(self):
+		import lxml.html as lh
 		# parsing html page to find ID of tests on the site of interest
 		data = {}
 		hammercloud = lh.parse(self.source_url).getroot()
 		testtypelist = hammercloud.findall(".//div[@class='runningjobs']") # extracting test types
 		efficiency_status_list = []
+		tests = [] # (site name, test type, test id, json url) of the tests on the sites of interest
 		for site_name in self.site_names:
 			for testtype in testtypelist:
 				noentries = False
@@ -82,42 +83,48 @@ class HammerCloudInterface(hf.module.ModuleBase):
 								test_id_value = td.findall(".//a")[0].get("href").replace("/hc/app/cms/test/","").replace("/","")
 						if test_id_value != 'no information':
 							json_url = self.source_url + "xhr/json/?action=results_at_site&test={IDNUMBER}&site={SITE}".format(IDNUMBER = test_id_value, SITE = site) # building appropriate .json url to get detailed information on the test
-							readout = ul.urlopen(json_url).read()
-							# finding and calculating several detailed information on the jobs of the test
-							gsc = readout.count('"ganga_status": "c"')
-							gss = readout.count('"ganga_status": "s"')
-							gsk = readout.count('"ganga_status": "k"')
-							gsr = readout.count('"ganga_status": "r"')
-							gsf = readout.count('"ganga_status": "f"')
-							submitted_jobs_value = gss
-							running_jobs_value = gsr
-							completed_jobs_value = gsc
-							failed_jobs_value = gsf
-							jobs_with_status_k_value = gsk
-							efficiency_value = gsc/(1.*(gsf+gsc)) if gsf > 0 or gsc > 0 else 1
-							jobs_in_total_value = gsc+gss+gsk+gsr+gsf
+							tests.append((site_name, test_type_value, test_id_value, json_url))
+							break
+		# retrieving the detailed information of all tests at once
+		responses = fetch_all([test[3] for test in tests], timeout=30, logger=self.logger)
+		for (site_name, test_type_value, test_id_value, json_url), response in zip(tests, responses):
+			if not response.ok:
+				continue
+			readout = response.body
+			# finding and calculating several detailed information on the jobs of the test
+			gsc = readout.count('"ganga_status": "c"')
+			gss = readout.count('"ganga_status": "s"')
+			gsk = readout.count('"ganga_status": "k"')
+			gsr = readout.count('"ganga_status": "r"')
+			gsf = readout.count('"ganga_status": "f"')
+			submitted_jobs_value = gss
+			running_jobs_value = gsr
+			completed_jobs_value = gsc
+			failed_jobs_value = gsf
+			jobs_with_status_k_value = gsk
+			efficiency_value = gsc/(1.*(gsf+gsc)) if gsf > 0 or gsc > 0 else 1
+			jobs_in_total_value = gsc+gss+gsk+gsr+gsf
 
-							if efficiency_value < float(self.config['critical_threshold']): efficiency_status_list.append(0.0)
-							elif efficiency_value >= float(self.config['critical_threshold']) and \
-								efficiency_value < float(self.config['warning_threshold']):
-								efficiency_status_list.append(0.5)
-							else: efficiency_status_list.append(1.0)
+			if efficiency_value < float(self.config['critical_threshold']): efficiency_status_list.append(0.0)
+			elif efficiency_value >= float(self.config['critical_threshold']) and \
+				efficiency_value < float(self.config['warning_threshold']):
+				efficiency_status_list.append(0.5)
+			else: efficiency_status_list.append(1.0)
 
-							# passing the calculated values to the list used to fill the subtables
-							cat_data = {
-								'site_name' : site_name,
-								'test_type' : test_type_value,
-								'test_id' : test_id_value,
-								'submitted_jobs' : submitted_jobs_value,
-								'running_jobs' : running_jobs_value,
-								'completed_jobs' : completed_jobs_value,
-								'failed_jobs' : failed_jobs_value,
-								'jobs_with_status_k': jobs_with_status_k_value,
-								'efficiency' : round(efficiency_value,3),
-								'jobs_in_total' : jobs_in_total_value
-							}
-							self.running_tests_db_value_list.append(cat_data)
-							break
+			# passing the calculated values to the list used to fill the subtables
+			cat_data = {
+				'site_name' : site_name,
+				'test_type' : test_type_value,
+				'test_id' : test_id_value,
+				'submitted_jobs' : submitted_jobs_value,
+				'running_jobs' : running_jobs_value,
+				'completed_jobs' : completed_jobs_value,
+				'failed_jobs' : failed_jobs_value,
+				'jobs_with_status_k': jobs_with_status_k_value,
+				'efficiency' : round(efficiency_value,3),
+				'jobs_in_total' : jobs_in_total_value
+			}
+			self.running_tests_db_value_list.append(cat_data)
 		data['status'] = min(efficiency_status_list) if len(efficiency_status_list) > 0 else 1.0
 		return data
 	def fillSubtables(self, module_entry_id):
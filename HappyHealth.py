@@ -17,6 +17,8 @@
 import hf
 import os
 from sqlalchemy import FLOAT, Column
+from common.history import recent_average
+from common.rollup import update_rollups
 
 class HappyHealth(hf.module.ModuleBase):
     config_keys = {
@@ -29,6 +31,8 @@ class HappyHealth(hf.module.ModuleBase):
         'load1_stat_crit':('load when status is critical', '6'),
         'load2_stat_warn':('load until status is OK', '2'),
         'load2_stat_crit':('load when status is critical', '4'),
+        'load_runs':('Number of runs whose mean load is compared with the limits, 1 uses the current load only', '1'),
+        'retention':('Days after which datasets are deleted, their values remain in the hourly, daily and weekly rollups, 0 keeps them', '0'),
     }
     config_hint = ''
 
@@ -48,6 +52,10 @@ class HappyHealth(hf.module.ModuleBase):
             data["dataset"][option] = self.config[option]
         return data
 
+    def fillSubtables(self, parent_id):
+        update_rollups(self, parent_id, ['space_free', 'avg_load_last_1min', 'avg_load_last_5min',
+            'avg_load_last_15min', 'status'], retention=self.retention)
+
     def prepareAcquisition(self):
         self.source_url = 'local'
         self.path = self.config["directory"]
@@ -61,6 +69,8 @@ class HappyHealth(hf.module.ModuleBase):
         self.load_limit_crit.append(self.config["load2_stat_crit"])
         self.load_limit_warn = map(float, self.load_limit_warn)
         self.load_limit_crit = map(float, self.load_limit_crit)
+        self.load_runs = max(int(self.config["load_runs"]), 1)
+        self.retention = float(self.config["retention"])
 
     def extractData(self):
         st = os.statvfs(self.path)
@@ -87,6 +97,14 @@ class HappyHealth(hf.module.ModuleBase):
         else:
             sp_status = 1.0
 
+        # the mean over the last runs keeps short load peaks from flipping the status
+        load_columns = ["avg_load_last_1min", "avg_load_last_5min", "avg_load_last_15min"]
+        load = list(load)
+        if self.load_runs > 1:
+            for i, (count, mean) in enumerate(recent_average(self, load_columns, self.load_runs - 1)):
+                if count > 0 and mean is not None:
+                    load[i] = (float(mean) * count + load[i]) / (count + 1)
+
         for i in range(3):
             if load[i] > self.load_limit_crit[i]:
                 load_status[i] = 0.0
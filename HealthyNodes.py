@@ -16,8 +16,6 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-import numpy as np
-import htcondor
 
 class HealthyNodes(hf.module.ModuleBase):
 	
@@ -37,6 +35,7 @@ class HealthyNodes(hf.module.ModuleBase):
 			   }
 	
 	def prepareAcquisition(self):
+		import htcondor
 		# Setting defaults
                 self.source_url = self.config["source_url"]
 		# Define basic structures
@@ -53,6 +52,7 @@ class HealthyNodes(hf.module.ModuleBase):
                 self.statistics_db_value_list = []
 	
 	def extractData(self):
+		import htcondor
 		data = {}
 		result = self.collector.query(htcondor.AdTypes.Startd, self.requirement, self.condor_projection)
 		for node in result:
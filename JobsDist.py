@@ -15,9 +15,9 @@
 #   limitations under the License.
 
 import hf
-import numpy as np
 from sqlalchemy import TEXT, INT, Column
-from lxml import etree
+from common.qstat import load_qstat_report
+from common.plotting import pyplot
 
 class JobsDist(hf.module.ModuleBase):
     config_keys = {
@@ -52,55 +52,37 @@ class JobsDist(hf.module.ModuleBase):
 
 
     def extractData(self):
-        import matplotlib.pyplot as plt
+        import numpy as np
+        plt = pyplot()
         self.plt = plt
         data = {}
         data["filename_eff_plot"] = ""
         data["result_timestamp"] = 0
         data['status'] = 1.0
 
-        source_tree = etree.parse(open(self.qstat_xml.getTmpPath()))
-        root = source_tree.getroot()
+        report = load_qstat_report(self.qstat_xml)
 
         values = []
         variable = self.variable
         nbins = 20
 
-        hierarchy = self.getGroupHierarchy(root)
-
         # Check input file timestamp
-        date = 0
-        for element in root:
-            if element.tag == "header":
-                for child in element:
-                    if child.tag == "date" and child.text is not None:
-                        date = int(float(child.text.strip()))
-
-        data["result_timestamp"] = date
+        data["result_timestamp"] = report.date
         data['status'] = 1.0
 #        if self.timestamp - date > self.old_result_critical_limit*3600:
 #            self.status = 0.0
 #        elif self.timestamp - date > self.old_result_warning_limit*3600:
 #            self.status = 0.5
 
-        for element in root:
-            if element.tag == "jobs":
-                for child in element:
-                    group = job_state = variable_str = ''
-                    # Only count running jobs
-                    for subchild in child:
-                        if subchild.tag == 'group' and subchild.text is not None:
-                            group = subchild.text.strip()
-                        if subchild.tag == 'state' and subchild.text is not None:
-                            job_state = subchild.text.strip()
-                        if subchild.tag == variable and subchild.text is not None:
-                            variable_str = subchild.text.strip()
-
-                    # Check user
-                    if not self.checkGroups(group, self.groups, hierarchy) or job_state != 'running' or variable_str == '':
-                        continue
-
-                    values.append(float(variable_str))
+        for job in report.jobs:
+            # Only count running jobs
+            if job.get('state') != 'running' or job.get(variable) in (None, ''):
+                continue
+            # Check user
+            if not report.in_groups(job.get('group', ''), self.groups):
+                continue
+
+            values.append(float(job[variable]))
 ################################################################
         ### AT THE MOMENT: QUICK AND DIRTY
         ### inspired by: http://matplotlib.sourceforge.net/examples/pylab_examples/bar_stacked.html
@@ -175,39 +157,6 @@ class JobsDist(hf.module.ModuleBase):
             axis.set_yticks(np.arange(0,max_bin_height + 5,scale_value))
 
             fig.savefig(hf.downloadService.getArchivePath(self.run, self.instance_name + "_jobs_dist.png"), dpi=60)
+            self.plt.close(fig)
             data["filename_eff_plot"] = self.instance_name + "_jobs_dist.png"
         return data
-
-    def getGroupHierarchy(self, root):
-        hierarchy = {}
-        for element in root:
-            if element.tag == "summaries":
-                for child in element:
-                    if child.tag == 'summary':
-                        group = 'all'
-                        if 'group' in child.attrib:
-                            group = child.attrib['group']
-
-                        if 'parent' in child.attrib:
-                            hierarchy[group] = child.attrib['parent']
-                        else:
-                            hierarchy[group] = None
-        return hierarchy
-
-    def checkGroup(self, group_chk, group, hierarchy):
-        try:
-            while group_chk != group:
-                if hierarchy[group_chk] == None:
-                    return False
-                group_chk = hierarchy[group_chk]
-            return True
-        except Exception:
-            return False
-
-    def checkGroups(self, group_chk, groups, hierarchy):
-        if len(groups) == 0: return True
-
-        for group in groups:
-            if self.checkGroup(group_chk, group, hierarchy):
-                return True
-        return False
@@ -15,10 +15,9 @@
 #   limitations under the License.
 
 import hf
-import numpy as np 
-from numpy import array
 from sqlalchemy import TEXT, INT, Column
-from lxml import etree
+from common.qstat import load_qstat_report
+from common.plotting import FigureSpec, submit
 
 class JobsEfficiencyPlot(hf.module.ModuleBase):
     config_keys = {
@@ -43,116 +42,60 @@ class JobsEfficiencyPlot(hf.module.ModuleBase):
         self.qstat_xml = hf.downloadService.addDownload(self.config['qstat_xml'])
         self.source_url = self.qstat_xml.getSourceUrl()
 
-    def getGroupHierarchy(self, root):
-        hierarchy = {}
-        for element in root:
-            if element.tag == "summaries":
-                for child in element:
-                    if child.tag == 'summary':
-                        group = 'all'
-                        if 'group' in child.attrib:
-                            group = child.attrib['group']
-
-                        if 'parent' in child.attrib:
-                            hierarchy[group] = child.attrib['parent']
-                        else:
-                            hierarchy[group] = None
-        return hierarchy
-
-    def checkGroup(self, group_chk, group, hierarchy):
-        try:
-            while group_chk != group:
-                if hierarchy[group_chk] == None:
-                    return False
-                group_chk = hierarchy[group_chk]
-            return True
-        except Exception:
-            return False
-
-    def checkGroups(self, group_chk, groups, hierarchy):
-        if len(groups) == 0: return True
-
-        for group in groups:
-            if self.checkGroup(group_chk, group, hierarchy):
-                return True
-        return False
-
     def extractData(self):
-        import matplotlib.pyplot as plt
-        self.plt = plt
+        from numpy import array
+        import numpy as np
         data = {}
         data["filename_eff_plot"] = ""
         data["filename_rel_eff_plot"] = ""
         data["result_timestamp"] = 0
         data['status'] = 1.0
-        source_tree = etree.parse(open(self.qstat_xml.getTmpPath()))
-
-        root = source_tree.getroot()
-        hierarchy = self.getGroupHierarchy(root)
+        report = load_qstat_report(self.qstat_xml)
 
         # Check input file timestamp
-        date = 0
-        for element in root:
-            if element.tag == "header":
-                for child in element:
-                    if child.tag == "date":
-                        date = int(float(child.text.strip()))
-
-        data["result_timestamp"] = date
+        data["result_timestamp"] = report.date
 
-        # TODO: Provide a common base class which constructs the users array
-        # and the arrays required for JobsDist...
         users = {}
-        for element in root:
-            if element.tag == "jobs":
-                for child in element:
-
-                    user = group = job_state = cpuwallratio = ''
-                    for subchild in child:
-                        if subchild.tag == 'user':
-                            user = subchild.text.strip()
-                        if subchild.tag == 'state':
-                            job_state = subchild.text.strip()
-                        if subchild.tag == 'cpueff':
-                            cpuwallratio = subchild.text.strip()
-                        if subchild.tag == 'group':
-                            group = subchild.text.strip()
-
-                    if user == '':
-                        continue
-
-                    # Check group
-                    if not self.checkGroups(group, self.groups, hierarchy):
-                        continue
-
-                    if user not in users:
-                        users[user] = {}
-
-                        users[user]["total"] = 0
-                        users[user]["running"] = 0
-                        users[user]["waiting"] = 0
-                        users[user]["queue"] = 0
-                        users[user]["ratio100"] = 0
-                        users[user]["ratio80"] = 0
-                        users[user]["ratio30"] = 0
-                        users[user]["ratio10"] = 0
-
-                    users[user]["total"] += 1
-
-                    if job_state == 'pending': users[user]["queue"] = users[user]["queue"] + 1
-                    if job_state == 'waiting': users[user]["waiting"] = users[user]["waiting"] + 1
-                    if job_state == 'running':
-                        users[user]["running"] += 1
-                        # sometimes there is no "cpuwallratio" variable for running jobs
-                        if cpuwallratio != '':
-                            if float(cpuwallratio) > 80:
-                                users[user]["ratio100"] += 1
-                            elif float(cpuwallratio) > 30:
-                                users[user]["ratio80"] += 1
-                            elif float(cpuwallratio) > 10:
-                                users[user]["ratio30"] += 1
-                            else:
-                                users[user]["ratio10"] += 1
+        for job in report.jobs:
+            user = job.get('user', '')
+            job_state = job.get('state', '')
+            cpuwallratio = job.get('cpueff')
+
+            if user == '':
+                continue
+
+            # Check group
+            if not report.in_groups(job.get('group', ''), self.groups):
+                continue
+
+            if user not in users:
+                users[user] = {}
+
+                users[user]["total"] = 0
+                users[user]["running"] = 0
+                users[user]["waiting"] = 0
+                users[user]["queue"] = 0
+                users[user]["ratio100"] = 0
+                users[user]["ratio80"] = 0
+                users[user]["ratio30"] = 0
+                users[user]["ratio10"] = 0
+
+            users[user]["total"] += 1
+
+            if job_state == 'pending': users[user]["queue"] = users[user]["queue"] + 1
+            if job_state == 'waiting': users[user]["waiting"] = users[user]["waiting"] + 1
+            if job_state == 'running':
+                users[user]["running"] += 1
+                # sometimes there is no "cpuwallratio" variable for running jobs
+                if cpuwallratio is not None:
+                    if cpuwallratio > 80:
+                        users[user]["ratio100"] += 1
+                    elif cpuwallratio > 30:
+                        users[user]["ratio80"] += 1
+                    elif cpuwallratio > 10:
+                        users[user]["ratio30"] += 1
+                    else:
+                        users[user]["ratio10"] += 1
 
         ################################################################
         ### AT THE MOMENT: QUICK AND DIRTY
@@ -214,8 +157,8 @@ class JobsEfficiencyPlot(hf.module.ModuleBase):
         ind = np.arange(N)    # the x locations for the groups
         width = 0.36       # the width of the bars: can also be len(x) sequence
 
-        fig_abs = self.plt.figure()
-        fig_rel = self.plt.figure()
+        fig_abs = FigureSpec()
+        fig_rel = FigureSpec()
 
         #canvas_abs = FigureCanvas(fig_abs)
         #canvas_rel = FigureCanvas(fig_rel)
@@ -245,7 +188,7 @@ class JobsEfficiencyPlot(hf.module.ModuleBase):
             ('queue', 'ratio < 10%', '10% < ratio < 30%', '30% < ratio < 80%', 'ratio > 80%') )
 
 
-        fig_abs.savefig(hf.downloadService.getArchivePath(self.run, self.instance_name + "_jobs_eff.png"), dpi=60)
+        submit(fig_abs, hf.downloadService.getArchivePath(self.run, self.instance_name + "_jobs_eff.png"), self.logger, dpi=60)
         data["filename_eff_plot"] = self.instance_name + "_jobs_eff.png"
 
         ##########################################################
@@ -267,7 +210,7 @@ class JobsEfficiencyPlot(hf.module.ModuleBase):
         axis_rel.legend( (rel_p0[0], rel_p1[0], rel_p2[0], rel_p3[0], rel_p4[0]),
             ('queue', 'ratio < 10%', '10% < ratio < 30%', '30% < ratio < 80%', 'ratio > 80%') )
 
-        fig_rel.savefig(hf.downloadService.getArchivePath(self.run, self.instance_name + "_jobs_rel_eff.png"), dpi=60)
+        submit(fig_rel, hf.downloadService.getArchivePath(self.run, self.instance_name + "_jobs_rel_eff.png"), self.logger, dpi=60)
         data["filename_rel_eff_plot"] = self.instance_name + "_jobs_rel_eff.png"
 
         return data
@@ -16,7 +16,7 @@
 
 import hf, datetime
 from sqlalchemy import Column, TEXT, INT, FLOAT
-from lxml import etree
+from common.qstat import load_qstat_report
 
 class JobsStatistics(hf.module.ModuleBase):
     config_keys = {
@@ -96,16 +96,10 @@ class JobsStatistics(hf.module.ModuleBase):
     def extractData(self):
         data = {'result_timestamp': 0, 'details_group': ''}
 
-        source_tree = etree.parse(open(self.qstat_xml.getTmpPath()))
-        root = source_tree.getroot()
+        report = load_qstat_report(self.qstat_xml)
 
         # Check input file timestamp
-        date = 0
-        for element in root:
-            if element.tag == "header":
-                for child in element:
-                    if child.tag == "date" and child.text is not None:
-                        date = int(float(child.text.strip()))
+        date = report.date
         self.logger.debug('Date in header %i' % date)
         data['result_timestamp'] = date
         data['status'] = 1.0
@@ -114,114 +108,60 @@ class JobsStatistics(hf.module.ModuleBase):
         elif self.run['time']  >  datetime.datetime.fromtimestamp(date + self.old_result_warning_limit*3600):
             data['status'] = 0.5
 
-        for element in root:
-            if element.tag == "summaries":
-                for child in element:
-                    if child.tag == "summary":
-                        group = 'all'
-                        parent = ''
-                        if 'group' in child.attrib:
-                            group = child.attrib['group']
-                        if 'parent' in child.attrib:
-                            parent = child.attrib['parent']
-
-                        if self.groups is not None and group not in self.groups:
-                            continue
-
-                        total = 0
-                        ncpus = 0
-                        running = 0
-                        pending = 0
-                        waiting = 0
-                        ratio10 = 0
-                        for subchild in child:
-                            try:
-                                if subchild.tag == 'jobs' and subchild.text is not None:
-                                    total = int(subchild.text.strip())
-                                if subchild.tag == 'ncpus' and subchild.text is not None:
-                                    ncpus = int(subchild.text.strip())
-                                if subchild.tag == 'running' and subchild.text is not None:
-                                    running = int(subchild.text.strip())
-                                if subchild.tag == 'pending' and subchild.text is not None:
-                                    pending = int(subchild.text.strip())
-                                if subchild.tag == 'waiting' and subchild.text is not None:
-                                    waiting = int(subchild.text.strip())
-                                if subchild.tag == 'ratio10' and subchild.text is not None:
-                                    ratio10 = int(subchild.text.strip())
-                            except ValueError:
-                                # in case int() conversion fails
-                                pass
-
-                        status = 1.0
-                        if running >= self.min_jobs and ratio10 >= running*self.warning_limit:
-                            status = 0.5
-                        if running >= self.min_jobs and ratio10 >= running*self.critical_limit:
-                            status = 0.0
-
-                        if self.rating_groups is None or group in self.rating_groups:
-                            if status < data['status']:
-                                data['status'] = status
-
-                        groups_db_values = {}
-                        groups_db_values["group"] = group
-                        groups_db_values["parentgroup"] = parent
-                        groups_db_values["total"] = total
-                        groups_db_values["running"] = running
-                        groups_db_values["ncpus"] = ncpus
-                        groups_db_values["pending"] = pending
-                        groups_db_values["waiting"] = waiting
-                        groups_db_values["ratio10"] = ratio10
-                        groups_db_values["status"] = status
-                        self.groups_db_value_list.append(groups_db_values)
+        for summary in report.summaries:
+            group = summary['group']
+            if self.groups is not None and group not in self.groups:
+                continue
+
+            running = summary['running']
+            ratio10 = summary['ratio10']
+            status = 1.0
+            if running >= self.min_jobs and ratio10 >= running*self.warning_limit:
+                status = 0.5
+            if running >= self.min_jobs and ratio10 >= running*self.critical_limit:
+                status = 0.0
+
+            if self.rating_groups is None or group in self.rating_groups:
+                if status < data['status']:
+                    data['status'] = status
+
+            groups_db_values = {}
+            groups_db_values["group"] = group
+            groups_db_values["parentgroup"] = summary['parent']
+            groups_db_values["total"] = summary['jobs']
+            groups_db_values["running"] = running
+            groups_db_values["ncpus"] = summary['ncpus']
+            groups_db_values["pending"] = summary['pending']
+            groups_db_values["waiting"] = summary['waiting']
+            groups_db_values["ratio10"] = ratio10
+            groups_db_values["status"] = status
+            self.groups_db_value_list.append(groups_db_values)
 
         users = {}
-        for element in root:
-            if element.tag == "jobs":
-                group = ''
-                if 'group' in element.attrib:
-                    group = element.attrib['group']
-                data["details_group"] = group
-
-                for child in element:
-                    if child.tag == "job":
-                        user = ''
-                        state = ''
-                        cpueff = 0.0
-
-                        for subchild in child:
-                            try:
-                                if subchild.tag == 'user' and subchild.text is not None:
-                                    user = subchild.text.strip()
-                                if subchild.tag == 'state' and subchild.text is not None:
-                                    state = subchild.text.strip()
-                                if subchild.tag == 'cpueff' and subchild.text is not None:
-                                    cpueff = float(subchild.text.strip())
-                                if subchild.tag == 'ncpus' and subchild.text is not None:
-                                    ncpus = int(subchild.text.strip())
-                            except ValueError:
-                                # in case conversion fails
-                                pass
-
-                        if user == '' or state == '': continue
-                        if user not in users:
-                            users[user] = { 'total': 0, 'ncpus': 0, 'running': 0, 'pending': 0,
-                                'waiting': 0, 'ratio100': 0, 'ratio80': 0, 'ratio30': 0, 'ratio10': 0 };
-
-                        users[user]['total'] += 1
-                        if state == 'running':
-                            users[user]['running'] += 1
-                            users[user]['ncpus'] += ncpus
-                        elif state == 'pending': users[user]['pending'] += 1
-                        elif state == 'waiting': users[user]['waiting'] += 1
-
-                        if state == 'running':
-                            if cpueff > 80: users[user]['ratio100'] += 1
-                            elif cpueff > 30: users[user]['ratio80'] += 1
-                            elif cpueff > 10: users[user]['ratio30'] += 1
-                            else: users[user]['ratio10'] += 1
-
-                # There should only be one jobs entry
-                break
+        data["details_group"] = report.jobs_group
+        for job in report.jobs:
+            user = job.get('user', '')
+            state = job.get('state', '')
+            cpueff = job.get('cpueff') or 0.0
+            ncpus = job.get('ncpus') or 0
+
+            if user == '' or state == '': continue
+            if user not in users:
+                users[user] = { 'total': 0, 'ncpus': 0, 'running': 0, 'pending': 0,
+                    'waiting': 0, 'ratio100': 0, 'ratio80': 0, 'ratio30': 0, 'ratio10': 0 };
+
+            users[user]['total'] += 1
+            if state == 'running':
+                users[user]['running'] += 1
+                users[user]['ncpus'] += ncpus
+            elif state == 'pending': users[user]['pending'] += 1
+            elif state == 'waiting': users[user]['waiting'] += 1
+
+            if state == 'running':
+                if cpueff > 80: users[user]['ratio100'] += 1
+                elif cpueff > 30: users[user]['ratio80'] += 1
+                elif cpueff > 10: users[user]['ratio30'] += 1
+                else: users[user]['ratio10'] += 1
 
         # Do user rating
         for user in users:
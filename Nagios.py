@@ -17,7 +17,8 @@ import hf
 from sqlalchemy import TEXT, INT, TIMESTAMP, Column
 import re
 from datetime import datetime
-from HTMLParser import HTMLParser
+from common.htmltable import iter_table_rows, cell_text
+from common.templatecache import cached_template_data
 
 class Nagios(hf.module.ModuleBase):
     config_keys = {
@@ -72,17 +73,12 @@ class Nagios(hf.module.ModuleBase):
 
         #data['source_url'] = self.source.getSourceUrl()
 
-        # open resource and prepare for parsing
-        self.resource = open(self.source.getTmpPath()).read().replace('\n',' ').replace('\r',' ')
-
-        # all content of the table with class 'status' is parsed into arrays
-        tableParser = TableParser(self.resource, 'status')
-
-        # fetch the arrays' content
+        # fetch the rows of the table with class 'status'
         curhost_name = ''
         curhost_link = ''
 
-        for entry in tableParser.table:
+        for row in iter_table_rows(self.source.getTmpPath(), table_class='status'):
+            entry = [cell for cell in row if cell.tag == 'td']
             # too short entries are not valid
             if len(entry) < 7:
                 continue
@@ -92,31 +88,28 @@ class Nagios(hf.module.ModuleBase):
 
             # read info about host from first column
             # if first column is empty, keep old host's info
-            if len(entry[0]) > 1:
-                host = ContentParser(entry[0][0])
-                if host.content.strip() != '':
-                    curhost_name = host.content.strip()
-                    curhost_link = host.url[0]
+            host_name, host_link = _cell_link(entry[0])
+            if host_name != '':
+                curhost_name = host_name
+                curhost_link = host_link
 
             service['host_name'] = curhost_name
             service['host_link'] = nagios_url_bin+curhost_link
 
             # read info about service from second column
-            ser = ContentParser(entry[1][0])
-
-            service['service_name'] = ser.content.strip()
-            service['service_link'] = nagios_url_bin+ser.url[0]
+            service['service_name'], service_link = _cell_link(entry[1])
+            service['service_link'] = nagios_url_bin+service_link
 
             # read info about service status from third and seventh column
-            service['status_short'] = entry[2]
-            service['status_long'] = entry[6]
+            service['status_short'] = cell_text(entry[2])
+            service['status_long'] = cell_text(entry[6])
 
             # read more info about state
-            time_lastcheck = entry[3]
+            time_lastcheck = cell_text(entry[3])
             service['lastcheck'] = datetime.utcfromtimestamp(float((datetime.strptime(time_lastcheck, '%m-%d-%Y %H:%M:%S')).\
                 strftime('%s'))) # convert from local time to UTC
-            service['lastcheck_duration'] = entry[4]
-            service['attempt'] = entry[5]
+            service['lastcheck_duration'] = cell_text(entry[4])
+            service['attempt'] = cell_text(entry[5])
 
             # generate a machine readable column, therefore take first number of status_long
             number = 0
@@ -154,6 +147,7 @@ class Nagios(hf.module.ModuleBase):
     def fillSubtables(self, parent_id):
         self.subtables['services'].insert().execute([dict(parent_id=parent_id, **row) for row in self.services_db_value_list])
 
+    @cached_template_data
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
         service_info = self.subtables['services'].select().where(self.subtables['services'].c.parent_id==self.dataset['id']).execute().fetchall()
@@ -161,144 +155,11 @@ class Nagios(hf.module.ModuleBase):
         return data
 
 
-class TableParser(HTMLParser):
-
-    def __init__(self, s, tclass):
-        # parse given string s, seaching for first table with class tclass
-        # all rows and within these all columns will be saved into the array
-        # table. This will be done recursively with all subtables.
-        # if a table only contains one row, indexing for rows will be skipped
-        # if a row only contains one column, indexing for columns will be skipped
-        # if no table is found, the full input is returned
-
-        # if no tclass is given, the first table found will be used
-
-        HTMLParser.__init__(self)
-        self.tstart = 0
-        self.tend = 0
-        self.foundTable = False
-        self.TableDepth = 0
-
-        self.tclass = tclass
-        self.tstring = s
-        self.table = []
-        self.trow = []
-        self.tdstart = 0
-        self.tdend = 0
-
-        self.feed(s)
-
-        # check if given html string is complete
-        self.incomplete = False
-        try:
-            self.close()
-        except Exception:
-            self.incomplete = True
-        
-        if len(self.table) == 0:
-            if self.foundTable:
-                # empty table found
-                self.table = ''
-            else:
-                # if no table found, then return full input string
-                self.table = self.tstring
-
-        elif len(self.table) == 1:
-            # if only one row, then skip indexing rows
-            self.table = self.table[0]
-
-
-    def handle_starttag(self, tag, attributes):
-
-        if tag == 'table':
-
-            if self.foundTable:
-                if self.TableDepth >= 0:
-                    self.TableDepth += 1
-                else:
-                    self.TableDepth = -1
-
-            else:
-                # we search for table of class tclass
-                if self.tclass != '':
-                    for name, value in attributes:
-                        if name == 'class' and value == self.tclass:
-                            self.foundTable = True
-                            self.tstart = self.getpos()[1] + len(self.get_starttag_text())
-                else:
-                    self.foundTable = True
-
-        elif tag == 'tr':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.trow = []
-
-        elif tag == 'td':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.tdstart = self.getpos()[1] + len(self.get_starttag_text())
-
-
-    def handle_endtag(self, tag):
-
-        if tag == 'table':
-
-            if self.foundTable:
-                if self.TableDepth >= 0:
-                    self.TableDepth -= 1
-
-                    if self.TableDepth == -1:
-                        self.tend = self.getpos()[1]
-                        #self.tstring[self.tstart:self.tend]
-
-                else:
-                    self.TableDepth = -1
-
-
-        elif tag == 'tr':
-            if self.foundTable == True and self.TableDepth == 0:
-                # if tr did not contain any td, it will not be added
-                if len(self.trow) == 1:
-                    # if tr does only contain one td, skip indexing tds
-                    self.table.append(self.trow[0])
-                elif len(self.trow) > 1:
-                    self.table.append(self.trow)
-
-        elif tag == 'td':
-            if self.foundTable == True and self.TableDepth == 0:
-                self.tdend = self.getpos()[1]
-                td = self.tstring[self.tdstart:self.tdend]
-                td = TableParser(td, '').table
-                self.trow.append(td)
-
-
-
-class ContentParser(HTMLParser):
-
-    def __init__(self, s):
-        # parse given string s, adding all content into self.content, adding all
-        # hrefs to self.url and adding all img.srcs to self.img and all alts to
-        # self.alt
-
-        HTMLParser.__init__(self)
-        self.cstring = s
-
-        self.content = ''
-        self.url = []
-        self.img = []
-        self.alt = []
-
-        self.feed(s)
-        self.close()
-
-    def handle_starttag(self, tag, attributes):
-
-        for name, value in attributes:
-            if name == 'href':
-                self.url.append(value)
-            elif tag == 'img' and name == 'src':
-                self.img.append(value)
-            elif tag == 'alt':
-                self.alt.append(value)
-
-    def handle_data(self, data):
-        self.content += data
 
+def _cell_link(cell):
+    # host and service cells hold a table with the link in its first cell
+    inner = cell.find('.//td')
+    if inner is None:
+        inner = cell
+    links = [link for element, attribute, link, pos in inner.iterlinks() if attribute == 'href']
+    return cell_text(inner), links[0] if links else ''
@@ -16,10 +16,9 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-import numpy as np 
 from datetime import datetime,timedelta
-import pytz
 import json
+from common.plotting import pyplot
 
 state_colors = {
         'submitted': '#5CADFF',
@@ -142,6 +141,8 @@ class NodeMonitoring(hf.module.ModuleBase):
   
     def extractData(self):
 
+        import pytz
+        import numpy as np
         # set rack names and associated clusters
         rack_001_010 = {
             'rack_string': 'gridka_rack001-010',
@@ -160,7 +161,7 @@ class NodeMonitoring(hf.module.ModuleBase):
             'clusters': map(lambda x: '%03d' % (x+1), range(110,120))}
         racks = [rack_001_010, rack_011_020, rack_021_030, rack_101_110, rack_111_120]
 
-        import matplotlib.pyplot as plt
+        plt = pyplot()
         import matplotlib.cm as cm
         from matplotlib.font_manager import FontProperties
         self.plt = plt
@@ -438,6 +439,7 @@ class NodeMonitoring(hf.module.ModuleBase):
 
             fig.savefig(hf.downloadService.getArchivePath(self.run, 
                     self.instance_name + "_jobs_dist.png"), dpi=91)
+            self.plt.close(fig)
             data["filename_plot"] = self.instance_name + "_jobs_dist.png"
             data['PrimaryKey'] = self.primary_key
             data['SecondaryKey'] = self.secondary_key
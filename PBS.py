@@ -2,10 +2,13 @@ import hf
 from sqlalchemy import TEXT, INT, Column
 from sqlalchemy.sql import and_
 import datetime
+from string import strip
+from common.pbsqstat import count_qstat_jobs
 
 class PBS(hf.module.ModuleBase):
 	config_keys = {
-		'qstat_log_url': ('qstat log file', '')
+		'qstat_log_url': ('qstat log file', ''),
+		'summary_attributes': ('further job attributes which are summarised like queue and owner, comma separated', ''),
 	}
 
 	table_columns = [
@@ -31,64 +34,14 @@ class PBS(hf.module.ModuleBase):
 		self.source_url = self.source.getSourceUrl()
 
 		self.summary={}
+		self.attributes = [a for a in map(strip, self.config.get('summary_attributes', '').split(',')) if a]
 		self.type_db_values = [{'type':'Q', 'name':'Queued'}, {'type':'R', 'name':'Running'}, {'type':'H', 'name':'Held'}]
 
-	def extractJobs(self):
+	def extractData(self):
 		with open(self.source.getTmpPath(), 'r') as f:
-			jobs = {}
-			Id = ""
-			Key = ""
-			for line in f:
-				sline=line.lstrip()
-				depth=(len(line)-len(sline))/4
-				sline=sline.rstrip()
-
-				if line[0]=='\t':
-					jobs[Id][Key]+=sline
-				elif depth==0:
-					k=sline.split(": ", 2)
-					if k[0]=="Job Id":
-						Id = k[1]
-						jobs[Id] = {}
-				elif depth==1:
-					k, val=sline.split(" = ", 2)
-					Key = k
-					jobs[Id][Key] = val
-
-		return jobs
-
-	def getJobSummary(self,jobs,keys):
-		summary = {}
+			self.summary, total = count_qstat_jobs(f, ['queue', 'Job_Owner'] + self.attributes)
 		self.total = {'Q':0, 'R':0, 'H':0}
-
-		for k in keys:
-			summary[k]={}
-
-		for j in jobs:
-
-			state = jobs[j]['job_state']
-
-			for k in keys:
-				name = jobs[j][k].split('@')[0]
-
-				if not name in summary[k]:
-					summary[k][name]={}
-
-				if not state in summary[k][name]:
-					summary[k][name][state]=0
-
-				summary[k][name][state]+=1
-
-			if not state in self.total:
-				self.total[state]=0
-
-			self.total[state]+=1
-
-		return summary
-
-	def extractData(self):
-		jobs = self.extractJobs()
-		self.summary = self.getJobSummary(jobs,['queue','Job_Owner'])
+		self.total.update(total)
 
 		end = datetime.datetime.now()
 		begin = end - datetime.timedelta(hours=24)
@@ -116,19 +69,16 @@ class PBS(hf.module.ModuleBase):
 		return {'url':url}
 
 	def fillSubtables(self, parent_id):
-		queue = []
-		user = []
-
-		for q in self.summary['queue']:
-			for i in self.summary['queue'][q]:
-				queue.append(dict(parent_id=parent_id, type='queue', name=q, status=i, count=self.summary['queue'][q][i]))
+		status = []
+		types = [('queue', 'queue'), ('Job_Owner', 'user')] + [(a, a) for a in self.attributes]
 
-		for u in self.summary['Job_Owner']:
-			for i in self.summary['Job_Owner'][u]:
-				queue.append(dict(parent_id=parent_id, type='user', name=u, status=i, count=self.summary['Job_Owner'][u][i]))
+		for key, type in types:
+			for name in self.summary[key]:
+				for i in self.summary[key][name]:
+					status.append(dict(parent_id=parent_id, type=type, name=name, status=i, count=self.summary[key][name][i]))
 
-		self.subtables['status'].insert().execute(queue)
-		self.subtables['status'].insert().execute(user)
+		if status:
+			self.subtables['status'].insert().execute(status)
 
 		self.subtables['total'].insert().execute([dict(parent_id=parent_id, type=row, count=self.total[row]) for row in self.total])
 
@@ -156,6 +106,8 @@ class PBS(hf.module.ModuleBase):
 
 		data['queue_list'] = self.getTemplateJobData('queue')
 		data['user_list'] = self.getTemplateJobData('user')
+		attributes = [a for a in map(strip, self.config.get('summary_attributes', '').split(',')) if a]
+		data['attribute_lists'] = [(a, self.getTemplateJobData(a)) for a in attributes]
 		data['type_list'] = [{'type':'Q', 'name':'Queued'}, {'type':'R', 'name':'Running'}, {'type':'H', 'name':'Held'}]
 
 		return data
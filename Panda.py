@@ -15,7 +15,6 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from BeautifulSoup import BeautifulSoup
 import json
 
 class Panda(hf.module.ModuleBase):
@@ -310,6 +309,7 @@ class cloud_class(object):
         self.resource=[]
 
     def panda_info_preprocessing(self,html_content):
+        from BeautifulSoup import BeautifulSoup
         src=html_content
         l=True
         while l:
@@ -15,9 +15,9 @@
 #   limitations under the License.
 
 import hf
-import json
 import time
 from sqlalchemy import TEXT, INT, FLOAT, Column
+from common.ingest import iter_json_items
 
 class PendingPhedexTransferRequests(hf.module.ModuleBase):
 	
@@ -51,12 +51,9 @@ class PendingPhedexTransferRequests(hf.module.ModuleBase):
 		
 		data = {"tier_name":self.config["tier_name"]}
 		
-		with open(self.source.getTmpPath(), 'r') as f:
-			request_list = json.loads(f.read())
-		
 		current_time = time.time()
 		request_time_list = [0.0]
-		for request in request_list["phedex"]["request"]:
+		for request in iter_json_items(self.source.getTmpPath(), 'phedex.request'):
 			period = current_time - request["time_create"]
 			request_time_list.append(period)
 		data["pending_transfer_requests"] = len(request_time_list)-1
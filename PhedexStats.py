@@ -16,7 +16,8 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-from lxml import etree
+from common.ingest import iter_xml_elements, xml_root_attributes
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 class PhedexStats(hf.module.ModuleBase):
     config_keys = {
@@ -29,7 +30,7 @@ class PhedexStats(hf.module.ModuleBase):
         Column('startlocaltime', TEXT),
         Column('endlocaltime', TEXT),
         Column('failed_transfers', INT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {'details': ([
         Column('site_name', TEXT),
@@ -49,30 +50,38 @@ class PhedexStats(hf.module.ModuleBase):
         self.details_db_value_list = []
 
     def extractData(self):
+        from lxml import etree
         data = {'startlocaltime': '',
                 'endlocaltime': '',
                 'failed_transfers': '',
                 'status': 1.0}
 
-        # Workaround for a broken XML, where a '<none>' entry in the error message is interpreted as XML keyword
-        root = None
         try:
-            source_tree = etree.parse(open(self.phedex_xml.getTmpPath()))
-            root = source_tree.getroot()
+            attributes = xml_root_attributes(self.phedex_xml.getTmpPath())
+            fromsites = iter_xml_elements(self.phedex_xml.getTmpPath(), 'fromsite', depth=1)
+            failed_transfers = self.extractFailedTransfers(fromsites)
         except Exception:
+            # Workaround for a broken XML, where a '<none>' entry in the error message is interpreted as XML keyword
             xml_file = open(self.phedex_xml.getTmpPath()).read().replace("<none>","'none'")
             root = etree.fromstring(xml_file)
+            attributes = root.attrib
+            self.details_db_value_list = []
+            failed_transfers = self.extractFailedTransfers(root.findall('fromsite'))
 
-
-        self.startlocaltime = root.get('startlocaltime')
-        self.endlocaltime = root.get('endlocaltime')
+        self.startlocaltime = attributes.get('startlocaltime')
+        self.endlocaltime = attributes.get('endlocaltime')
 
         data['startlocaltime'] = self.startlocaltime
         data['endlocaltime'] = self.endlocaltime
 
+        data['failed_transfers'] = failed_transfers
+
+        return data
+
+    def extractFailedTransfers(self, fromsites):
         failed_transfers = 0
 
-        for fromsite in root.findall('fromsite'):
+        for fromsite in fromsites:
             for tosite in fromsite:
                 for reason in tosite:
                     details_db_values = {}
@@ -84,17 +93,15 @@ class PhedexStats(hf.module.ModuleBase):
                     failed_transfers += int(reason.get('n'))
                     self.details_db_value_list.append(details_db_values)
 
-        data['failed_transfers'] = failed_transfers
-
-        return data
+        return failed_transfers
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        info_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+        info_list = subtable_rows(self, 'details').execute().fetchall()
         data['info_list'] = map(dict, info_list)
 
         return data
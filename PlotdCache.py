@@ -20,6 +20,7 @@ from sqlalchemy import Column, TEXT
 import urllib
 
 import hf
+from common.plotting import FigureSpec, submit
 
 
 class PlotdCache(hf.module.ModuleBase):
@@ -105,9 +106,6 @@ class PlotdCache(hf.module.ModuleBase):
 
     def plot(self):
         import numpy as np
-        import matplotlib
-        matplotlib.use("agg")
-        import matplotlib.pyplot
         color = {
             'dcap-3|0': '#ff0000',
             'dcap-3|1': '#bb0000',
@@ -126,15 +124,15 @@ class PlotdCache(hf.module.ModuleBase):
         }
         # Create Plot.
         plot_height = max(len(self.plot_objects),1) * 10. / 12
-        fig = matplotlib.pyplot.figure(figsize=(7, plot_height))
+        fig = FigureSpec(figsize=(7, plot_height))
         fig.subplots_adjust(left=0.03, right=0.97, top=0.99, bottom=0.075, wspace=0.95)
 
         ax = {}
         ax['in'] = fig.add_subplot(121)
         ax['out'] = fig.add_subplot(122)
-        ax['in'].yaxis.set_ticks([])
-        ax['out'].yaxis.set_ticks(np.array(range(len(self.plot_objects))))
-        ax['out'].yaxis.set_ticklabels(self.plot_objects)
+        ax['in'].set_yticks([])
+        ax['out'].set_yticks(np.array(range(len(self.plot_objects))))
+        ax['out'].set_yticklabels(self.plot_objects)
         ax['in'].set_xlabel('Incoming [MB/s]')
         ax['out'].set_xlabel('Outgoing [MB/s]')
         ax['in'].set_xlim((max(self.sum_pool.get('in', {None: 0}).values()) / 1.e3 + 10, 0))
@@ -163,29 +161,30 @@ class PlotdCache(hf.module.ModuleBase):
                     if self.sum_prot.get('in', {}).get(prot, 0):
                         item += '\nwrite: %.1f MB/s' % (self.sum_prot['in'][prot] / 1e3)
                     if item:
-                        patches.append(matplotlib.patches.Rectangle((0, 0), 1, 1, color=color['%s|0' % prot]))
+                        patches.append(fig.patch(color=color['%s|0' % prot]))
                         labels.append(item)
-                ax[direction].set_xticklabels(map(lambda x: '%d' % x, ax[direction].xaxis.get_ticklocs()), rotation=45)
+                ax[direction].format_ticklabels('x', '%d', rotation=45)
             else:
-                ax[direction].set_xticklabels(map(lambda x: '%d' % x, ax[direction].xaxis.get_ticklocs()), rotation=-45)
+                ax[direction].format_ticklabels('x', '%d', rotation=-45)
             ax[direction].set_ylim((-0.5, len(self.plot_objects) - 0.5))
             ax[direction].grid(axis='x')
 
-        ax['in'].legend(patches, labels, labelspacing=1, prop=matplotlib.font_manager.FontProperties(size=9),
+        ax['in'].legend(patches, labels, labelspacing=1, prop={'size': 9},
                         loc='best')
 
-        fig_diff = matplotlib.pyplot.figure(figsize=(7, 7))
+        fig_diff = FigureSpec(figsize=(7, 7))
         ax_diff = fig_diff.add_subplot(111)
         maximum = max(self.difference) if len(self.difference) > 0 else 0
-        n, bins, _ = ax_diff.hist(self.difference, maximum + 1, range=(-0.5, maximum + 0.5),
-                                  color="slateblue", fill=True, histtype='bar', align='mid')
+        ax_diff.hist(self.difference, maximum + 1, range=(-0.5, maximum + 0.5),
+                     color="slateblue", fill=True, histtype='bar', align='mid')
         ax_diff.set_xlabel('difference in s')
         ax_diff.set_ylabel('number of transfers')
         ax_diff.set_title('Difference between waiting and starting time of transfers')
-        ax_diff.set_xlim(min(bins), max(bins))
+        # the outer bin edges are given by the range of the histogram
+        ax_diff.set_xlim(-0.5, maximum + 0.5)
 
-        # save figure
+        # save figures in the background
         plotname = hf.downloadService.getArchivePath( self.run, self.instance_name + "_dcacheinfo.png")
-        fig.savefig(plotname, dpi=91, bbox_inches="tight")
-        fig_diff.savefig(plotname.replace(".png", "_timedifferences.png"), dpi=91, bbox_inches="tight")
+        submit(fig, plotname, self.logger, dpi=91, bbox_inches="tight")
+        submit(fig_diff, plotname.replace(".png", "_timedifferences.png"), self.logger, dpi=91, bbox_inches="tight")
         return plotname
@@ -16,6 +16,7 @@
 
 import hf
 from sqlalchemy import TEXT, FLOAT, Column
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 
 class PoolCosts(hf.module.ModuleBase):
@@ -30,7 +31,7 @@ class PoolCosts(hf.module.ModuleBase):
         Column('avg_sum', FLOAT),
         Column('avg_cost1', FLOAT),
         Column('avg_cost2', FLOAT)
-        ], []
+        ] + reuse_columns(), []
 
     subtable_columns = {
         'details': ([
@@ -80,13 +81,12 @@ class PoolCosts(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute(
-            [dict(parent_id=parent_id, **row) for row in self.details_list])
+        store_subtables(self, parent_id, {'details': self.details_list})
     
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         details_list = map(dict, details_list)
         
         avg_cost = self.dataset['avg_sum']
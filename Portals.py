@@ -18,9 +18,9 @@ import hf
 from sqlalchemy import TEXT, Column
 import json
 import time
-import socket
 import logging
-import urllib2
+import base64
+from common.fetcher import fetch_all
 from string import strip
 from ConfigParser import RawConfigParser
 
@@ -50,16 +50,11 @@ class Portals(hf.module.ModuleBase):
         self.portals = map(strip, self.config['portals'].split(','))
         self.infos = ['mem', 'load']
 	
-        top_url = 'http://monitor.ekp.kit.edu/ganglia/'
 	cfg_parser = RawConfigParser()
         cfg_parser.read('config/ganglia.cfg')
         username = cfg_parser.get('login', 'username')
         passwd = cfg_parser.get('login', 'passwd')
-        pass_mgr = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        pass_mgr.add_password(None, top_url, username, passwd)
-        authhandler = urllib2.HTTPBasicAuthHandler(pass_mgr)
-	opener = urllib2.build_opener(authhandler)
-	urllib2.install_opener(opener)
+        self.auth_headers = {'Authorization': 'Basic ' + base64.b64encode(username + ':' + passwd)}
 	
 	# Prepare subtable list for database
         self.statistics_db_value_list = []
@@ -74,16 +69,21 @@ class Portals(hf.module.ModuleBase):
 		'CPUs ': 'CPUs',
 		'1-min': '1-min'
 		}
-        # Build url for all machines.
+        # Build url for all machines and fetch them concurrently.
+        urls = ['http://monitor.ekp.kit.edu/ganglia/graph.php?h=' \
+                + portal + '&m=load_one&r=hour&s=by%20name&hc=4&mc=2&g=' \
+                + info + '_report&z=large&c=Portals&json=1'
+                for portal in self.portals for info in self.infos]
+        responses = iter(fetch_all(urls, timeout=30, headers=self.auth_headers, logger=self.logger))
+        failed = 0
         for portal in self.portals:
 	    portal_dict = {'Portal': portal}
             for info in self.infos:
-                url = 'http://monitor.ekp.kit.edu/ganglia/graph.php?h=' \
-                      + portal + '&m=load_one&r=hour&s=by%20name&hc=4&mc=2&g=' \
-                      + info + '_report&z=large&c=Portals&json=1'
-                handle = urllib2.urlopen(url)
-		html = handle.read()
-		in_file = json.loads(html)
+                response = responses.next()
+                if not response.ok:
+                    failed += 1
+                    continue
+		in_file = json.loads(response.body)
 		for entry in in_file:
 			if entry['metric_name'] in entry_dict.keys():
 				for datapoint in reversed(entry['datapoints']):
@@ -125,6 +125,9 @@ class Portals(hf.module.ModuleBase):
 		data['status'] = 0.5
 	else:
 		data['status'] = 1. 
+        if failed > 0 and data['status'] > 0.5:
+            # some of the values are missing, the numbers above are incomplete
+            data['status'] = 0.5
         try:
 	    sum_dict['use_perc'] = int(sum_dict['use'] / sum_dict['total'] * 100)
         except ZeroDivisionError:
@@ -2,7 +2,7 @@ import hf
 from sqlalchemy import TEXT, INT, Column
 from datetime import timedelta
 from time import mktime,time
-import feedparser
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous, store_subtables, subtable_rows
 
 class RSSFeed(hf.module.ModuleBase):
     config_keys = {
@@ -15,7 +15,7 @@ class RSSFeed(hf.module.ModuleBase):
 
     table_columns = [
         Column('title', TEXT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {'feeds': ([
         Column('author', TEXT),
@@ -53,7 +53,20 @@ class RSSFeed(hf.module.ModuleBase):
 
     def extractData(self):
 
-        data = {'status': self.status}
+        if int(self.days) != -1:
+            time_diff = timedelta(days=int(self.days)).total_seconds()
+            best_before_time = time()-time_diff
+        else:
+            best_before_time = -1
+
+        # entries drop out of the time window, so an unchanged feed is reparsed once per hour
+        fingerprint = source_fingerprint(self, self.source, hour=int(best_before_time)//3600)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
+
+        import feedparser
+        data = {'status': self.status, 'source_hash': fingerprint}
 
         feed = feedparser.parse(self.source.getTmpPath())
 
@@ -65,12 +78,6 @@ class RSSFeed(hf.module.ModuleBase):
         except Exception:
             pass
 
-        if int(self.days) != -1:
-            time_diff = timedelta(days=int(self.days)).total_seconds()
-            best_before_time = time()-time_diff
-        else:
-            best_before_time = -1
-
         entries = 0
         detail_help_list = []
         for entry in feed.entries:
@@ -108,12 +115,12 @@ class RSSFeed(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['feeds'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'feeds': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        info_list = self.subtables['feeds'].select().where(self.subtables['feeds'].c.parent_id==self.dataset['id']).execute().fetchall()
+        info_list = subtable_rows(self, 'feeds').execute().fetchall()
         data['feed_list'] = map(dict, info_list)
         data['days'] = self.config['days']
         return data
@@ -17,6 +17,7 @@
 import hf
 from sqlalchemy import TEXT, FLOAT, Column
 import json
+from common.templatecache import cached_template_data
 
 class Sam(hf.module.ModuleBase):
     config_keys = {
@@ -232,6 +233,7 @@ class Sam(hf.module.ModuleBase):
         self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
         self.subtables['individual'].insert().execute([dict(parent_id=parent_id, **row) for row in self.individual_db_value_list])
 
+    @cached_template_data
     def getTemplateData(self):
 
         data = hf.module.ModuleBase.getTemplateData(self)
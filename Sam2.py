@@ -18,6 +18,38 @@ import hf
 from sqlalchemy import TEXT, Column
 import json
 from string import strip
+from common.rules import Rules, compiled_rules
+
+
+class Sam2Rules(Rules):
+    """ Services, blacklists and the thresholds of every service type """
+
+    def __init__(self, config):
+        self.base_url = config['report_url']
+        self.service_flavour = tuple(map(strip, str(config['service_flavour']).split(',')))
+        self.service_type = tuple(map(strip, str(config['service_type']).split(',')))
+        self.blacklist = frozenset(map(strip, config['blacklist'].split(',')))
+        self.ce_blacklist = frozenset(map(strip, config['ce_blacklist'].split(',')))
+        # (min_jobs, warnings, errors) per service type, for warning and critical
+        self.warning = {}
+        self.critical = {}
+        for stype in self.service_type:
+            service = str(stype.replace('-','_').lower())
+            self.warning[stype] = (int(config[service + '_hf_warning_sam_min_jobs']),
+                int(config[service + '_hf_warning_sam_warnings']),
+                int(config[service + '_hf_warning_sam_errors']))
+            self.critical[stype] = (int(config[service + '_hf_critical_sam_min_jobs']),
+                int(config[service + '_hf_critical_sam_warnings']),
+                int(config[service + '_hf_critical_sam_errors']))
+
+    def host_status(self, service_type, tests, warnings, errors):
+        min_jobs, max_warnings, max_errors = self.critical[service_type]
+        if tests < min_jobs or errors >= max_errors or warnings >= max_warnings:
+            return 'critical'
+        min_jobs, max_warnings, max_errors = self.warning[service_type]
+        if tests < min_jobs or errors >= max_errors or warnings >= max_warnings:
+            return 'warning'
+        return 'ok'
 
 
 class Sam2(hf.module.ModuleBase):
@@ -70,34 +102,16 @@ class Sam2(hf.module.ModuleBase):
             Column("hostName", TEXT),
             Column("timeStamp", TEXT),
             Column("metric", TEXT),
-            Column("status", TEXT)
+            Column("status", TEXT),
+            # status of the host evaluated at acquisition, only set in the summary rows
+            Column("hf_status", TEXT)
         ], [])
     }
 
 
     def prepareAcquisition(self):
         ## get config information
-        self.service_flavour = map(strip, str(self.config['service_flavour']).split(','))
-        self.service_type = map(strip, str(self.config['service_type']).split(','))
-
-        self.service_warning_min_jobs = {}
-        self.service_error_min_jobs = {}
-        self.service_warning_warnings = {}
-        self.service_error_warnings = {}
-        self.service_warning_errors = {}
-        self.service_error_errors = {}
-
-        for stype in self.service_type:
-            service = stype.replace('-','_').lower()
-            self.service_warning_min_jobs[stype] = int(self.config[str(service) + '_hf_warning_sam_min_jobs'])
-            self.service_error_min_jobs[stype] = int(self.config[str(service) + '_hf_critical_sam_min_jobs'])
-            self.service_warning_warnings[stype] = int(self.config[str(service) + '_hf_warning_sam_warnings'])
-            self.service_error_warnings[stype] = int(self.config[str(service) + '_hf_critical_sam_warnings'])
-            self.service_warning_errors[stype] = int(self.config[str(service) + '_hf_warning_sam_errors'])
-            self.service_error_errors[stype] = int(self.config[str(service) + '_hf_critical_sam_errors'])
-
-        self.blacklist = map(strip, self.config['blacklist'].split(','))
-        self.ce_blacklist = map(strip, self.config['ce_blacklist'].split(','))
+        self.rules = compiled_rules(self, Sam2Rules)
         ## add download tyo queue
         self.source = hf.downloadService.addDownload(self.config['source_url'])
         self.source_url = self.source.getSourceUrl()
@@ -115,8 +129,9 @@ class Sam2(hf.module.ModuleBase):
         services = services['data']['results'][0]['flavours']
 
         ##parse your group and get all the tests
+        rules = self.rules
         for service in services:
-            if service['flavourname'] in self.service_flavour and service['servicename'] in self.service_type:
+            if service['flavourname'] in rules.service_flavour and service['servicename'] in rules.service_type:
                 for host in service['hosts']:
                     service_host = host['hostname']
                     host_status = host['hostStatus']
@@ -127,7 +142,7 @@ class Sam2(hf.module.ModuleBase):
                     test = None
                     for test in host['metric']:
                         status_str = str(test['status']).lower()
-                        if test['metric_name'] not in self.blacklist:
+                        if test['metric_name'] not in rules.blacklist:
                             if str(status_str) == 'warning':
                                 warnings += 1
                             elif str(status_str) == 'critical':
@@ -137,22 +152,14 @@ class Sam2(hf.module.ModuleBase):
                             'hostName':service_host, 'timeStamp':test['timestamp'], \
                             'metric':test['metric_name'], 'status':status_str} \
                             )
+                    hf_status = rules.host_status(service_type, tests, warnings, errors)
                     self.details_db_value_list.append({'type':service_type, \
                         'hostName':service_host, 'timeStamp': '', \
                         'metric':'summary_%s' % test['metric_name'], \
-                        'status':host_status})
-                    if service_host in self.ce_blacklist:
+                        'status':host_status, 'hf_status':hf_status})
+                    if service_host in rules.ce_blacklist:
                         continue
-                    if tests < self.service_error_min_jobs[service_type] or \
-                        errors >= self.service_error_errors[service_type] or \
-                        warnings >= self.service_error_warnings[service_type]:
-                        help_stati.append('critical')
-                    elif tests < self.service_warning_min_jobs[service_type] or \
-                        errors >= self.service_warning_errors[service_type] or \
-                        warnings >= self.service_warning_warnings[service_type]:
-                        help_stati.append('warning')
-                    else:
-                        help_stati.append('ok')
+                    help_stati.append(hf_status)
         ##parsing of the file is done, now evaluate everything
         if 'critical' in help_stati:
             data['status'] = 0
@@ -166,34 +173,14 @@ class Sam2(hf.module.ModuleBase):
         self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
 
     def getTemplateData(self):
-        ## you need the configuration again, because you must evaluate your summary again!
-        self.base_url = self.config['report_url']
-        self.service_flavour = map(strip, str(self.config['service_flavour']).split(','))
-        self.service_type = map(strip, str(self.config['service_type']).split(','))
-        self.blacklist = map(strip, self.config['blacklist'].split(','))
-        self.ce_blacklist = map(strip, self.config['ce_blacklist'].split(','))
-        self.service_warning_min_jobs = {}
-        self.service_error_min_jobs = {}
-        self.service_warning_warnings = {}
-        self.service_error_warnings = {}
-        self.service_warning_errors = {}
-        self.service_error_errors = {}
-
-        for stype in self.service_type:
-            service = stype.replace('-','_').lower()
-            self.service_warning_min_jobs[stype] = int(self.config[str(service) + '_hf_warning_sam_min_jobs'])
-            self.service_error_min_jobs[stype] = int(self.config[str(service) + '_hf_critical_sam_min_jobs'])
-            self.service_warning_warnings[stype] = int(self.config[str(service) + '_hf_warning_sam_warnings'])
-            self.service_error_warnings[stype] = int(self.config[str(service) + '_hf_critical_sam_warnings'])
-            self.service_warning_errors[stype] = int(self.config[str(service) + '_hf_warning_sam_errors'])
-            self.service_error_errors[stype] = int(self.config[str(service) + '_hf_critical_sam_errors'])
+        ## the status of the hosts was evaluated at acquisition, only the blacklists are needed
+        rules = compiled_rules(self, Sam2Rules)
 
         data = hf.module.ModuleBase.getTemplateData(self)
         ok_test = []
         summary_list = []
         warning_test = []
         black_test = []
-        hosts = {}
         host_ordered = []
         details_list = self.subtables['details'].select()\
             .where(self.subtables['details'].c.parent_id==self.dataset['id'])\
@@ -202,41 +189,21 @@ class Sam2(hf.module.ModuleBase):
 
         for test in map(dict, details_list):
             test['metricfqan'] = test['metric'].replace(' ', '%20').replace('/', '_')
-            if test['hostName'] not in hosts and str(test['metric'][0:7]) != 'summary':
-                hosts[test['hostName']]={'ok': 0, 'warn':0, 'status':'ok', 'sum':0, 'crit':0, 'type':test['type']}
-            if test['metric'] in self.blacklist or test['hostName'] in self.ce_blacklist:
+            if test['metric'] in rules.blacklist or test['hostName'] in rules.ce_blacklist:
                 black_test.append(test)
             elif str(test['metric'][0:7]) == 'summary':
                 summary_list.append(test)
-                host_ordered.append({'name':test['hostName'], 'status': test['status'].lower(), 'hostStatus': test['status'], 'type':test['type']})
+                host_ordered.append({'name':test['hostName'], 'status': test['status'].lower(), 'hostStatus': test['status'],
+                    'type':test['type'], 'hf_status':test['hf_status']})
             elif str(test['status']) == 'warning':
                 warning_test.append(test)
-                hosts[test['hostName']]['warn'] += 1
-                hosts[test['hostName']]['sum'] += 1
             elif str(test['status']) == 'critical':
                 warning_test.append(test)
-                hosts[test['hostName']]['crit'] += 1
-                hosts[test['hostName']]['sum'] += 1
             elif str(test['status']) == 'ok':
                 ok_test.append(test)
-                hosts[test['hostName']]['ok'] += 1
-                hosts[test['hostName']]['sum'] += 1
-
-        for host in hosts.itervalues():
-            service_type = host['type']
-            if host['sum'] < self.service_error_min_jobs[service_type] or \
-                host['crit'] >= self.service_error_errors[service_type] or \
-                host['warn'] >= self.service_error_warnings[service_type]:
-                host['status'] = 'critical'
-            elif host['sum'] < self.service_warning_min_jobs[service_type] or \
-                host['crit'] >= self.service_warning_errors[service_type] or \
-                host['warn'] >= self.service_warning_warnings[service_type]:
-                host['status'] = 'warning'
-            else:
-                host['status'] = 'ok'
 
         data['hosts'] = host_ordered
-        data['url'] = self.base_url
+        data['url'] = rules.base_url
         data['ok_test'] = ok_test
         data['warning_test'] = warning_test
         data['black_test'] = black_test
@@ -18,15 +18,20 @@ import hf
 from sqlalchemy import TEXT, Column
 import json
 import time
-import socket
 import logging
-import urllib2
+import base64
+from common.fetcher import fetch_all
+from common.statusrules import status_rules
 from ConfigParser import RawConfigParser
 
 class Storages(hf.module.ModuleBase):
     config_keys = {'source_url': ('Source Url', 'http://monitor.ekp.kit.edu/ganglia/'),
 		   'use_perc_warning': ('Lower treshold for use percentage of the disk space above which a warning is given', '80'),
-                   'use_perc_critical': ('Lower treshold for use percentage of the disk space above which the status is critical', '90')
+                   'use_perc_critical': ('Lower treshold for use percentage of the disk space above which the status is critical', '90'),
+                   'storage_status_rules': ('rules for the status of a storage, see common/statusrules.py',
+                       'critical: use_perc >= use_perc_critical; warning: use_perc >= use_perc_warning'),
+                   'status_rules': ('rules for the module status, critical and warning are the numbers of such storages, failed the number of failed requests',
+                       'critical: critical > 0; warning: warning > 0; warning: failed > 0')
                   }
     table_columns = [], []
     subtable_columns = {
@@ -51,16 +56,11 @@ class Storages(hf.module.ModuleBase):
                          'ekpfsc'
                        ]
         self.infos = ['disk_total', 'disk_free']
-        top_url = 'http://monitor.ekp.kit.edu/ganglia/'
 	cfg_parser = RawConfigParser()
 	cfg_parser.read('config/ganglia.cfg')
         username = cfg_parser.get('login', 'username')
         passwd = cfg_parser.get('login', 'passwd')
-        pass_mgr = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        pass_mgr.add_password(None, top_url, username, passwd)
-        authhandler = urllib2.HTTPBasicAuthHandler(pass_mgr)
-	opener = urllib2.build_opener(authhandler)
-	urllib2.install_opener(opener)
+        self.auth_headers = {'Authorization': 'Basic ' + base64.b64encode(username + ':' + passwd)}
 	
 	# Prepare subtable list for database
         self.statistics_db_value_list = []
@@ -73,15 +73,20 @@ class Storages(hf.module.ModuleBase):
 		'disk_total': 'total',
 		'disk_free': 'available'
 		}
-        # Build url for all machines.
+        # Build url for all machines and fetch them concurrently.
+        urls = ['http://monitor.ekp.kit.edu/ganglia/graph.php?c=Storages&h=' \
+                + storage + '.ekp.kit.edu&m=' + info + '&vl=GB&ti=Total%20Disk%20Space&json=1'
+                for storage in self.storages for info in self.infos]
+        responses = iter(fetch_all(urls, timeout=30, headers=self.auth_headers, logger=self.logger))
+        failed = 0
         for storage in self.storages:
 	    storage_dict = {'Storage': storage}
             for info in self.infos:
-                url = 'http://monitor.ekp.kit.edu/ganglia/graph.php?c=Storages&h=' \
-                      + storage + '.ekp.kit.edu&m=' + info + '&vl=GB&ti=Total%20Disk%20Space&json=1'
-                handle = urllib2.urlopen(url)
-		html = handle.read()
-		in_file = json.loads(html)[0]
+                response = responses.next()
+                if not response.ok:
+                    failed += 1
+                    continue
+		in_file = json.loads(response.body)[0]
 		for datapoint in reversed(in_file['datapoints']):
 			if datapoint[0] != 'NaN':
 				storage_dict[entry_dict[info]] = datapoint[0] / 1024.
@@ -99,14 +104,10 @@ class Storages(hf.module.ModuleBase):
 	    else:
 	        storage_dict['use_perc'] = int(storage_dict['used']/storage_dict['total']*100)
 	    self.statistics_db_value_list.append(storage_dict)
-	red_use = [1 for dictionary in self.statistics_db_value_list if dictionary['use_perc'] >= int(self.config['use_perc_critical'])]
-	yellow_use = [1 for dictionary in self.statistics_db_value_list if dictionary['use_perc'] >= int(self.config['use_perc_warning'])]
-	if red_use:
-		data['status'] = 0.
-	elif yellow_use:
-		data['status'] = 0.5
-	else:
-		data['status'] = 1.
+	rules = status_rules(self, 'storage_status_rules', 'status_rules')
+	use_perc = [dictionary['use_perc'] for dictionary in self.statistics_db_value_list]
+	# a failed request leaves the numbers above incomplete
+	data['status'] = rules.evaluate({'use_perc': use_perc}, {'failed': failed}).status
 	# Loop over all entries in the statistics list and calculate the sum.
 	sum_dict = {key: 0 for key in iter(storage_dict)}
 	sum_dict['Storage'] = 'all'
@@ -16,7 +16,6 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from lxml import etree
 from string import strip
 
 class Summary(hf.module.ModuleBase):
@@ -62,6 +61,7 @@ class Summary(hf.module.ModuleBase):
             self.cats.append(map(strip, self.config[str(site) + '_cat'].split(',')))
 
     def extractData(self):
+        from lxml import etree
         data = {}
         data['status'] = 1
         for i,source_key in enumerate(self.sites):
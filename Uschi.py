@@ -16,7 +16,6 @@
 
 import hf
 from sqlalchemy import TEXT, INT, Column
-from lxml import etree
 
 class Uschi(hf.module.ModuleBase):
     config_keys = {
@@ -48,6 +47,7 @@ class Uschi(hf.module.ModuleBase):
         self.source_url = self.uschi_xml.getSourceUrl()
 
     def extractData(self):
+        from lxml import etree
         data = {'uschi_timestamp': '',
                 'uschi_timestamp_module': '',
                 'frequency': -1,
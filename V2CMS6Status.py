@@ -20,6 +20,7 @@ import json
 from operator import add
 import ast
 from math import ceil
+from common.plotting import pyplot
 
 
 class V2CMS6Status(hf.module.ModuleBase):
@@ -101,7 +102,7 @@ class V2CMS6Status(hf.module.ModuleBase):
         self.jobs_db_value_list = []
 
     def extractData(self):
-        import matplotlib.pyplot as plt
+        plt = pyplot()
         import numpy as np
         from matplotlib.font_manager import FontProperties
         #  define default values
@@ -433,6 +434,7 @@ class V2CMS6Status(hf.module.ModuleBase):
         # save data as Output
         fig.savefig(hf.downloadService.getArchivePath(
             self.run, self.instance_name + "_jobs2.png"), dpi=91)
+        plt.close(fig)
         data["filename_plot"] = self.instance_name + "_jobs2.png"
         # remove Undefined efficiencys from list to calc mean efficiency
         while "Undefined" in efficiency_list:
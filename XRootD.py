@@ -16,14 +16,16 @@
 
 import hf
 import time
-import numpy as np
 from sqlalchemy import TEXT, FLOAT, Column
-import json
+from common.ingest import iter_json_items
+from common.plotting import FigureSpec, submit
+from common.rollup import update_rollups
 
 class XRootD(hf.module.ModuleBase):
     config_keys = {
         'source_url': ('Source File', ''),
-        'tier_name': ('Tier to be monitored', '')
+        'tier_name': ('Tier to be monitored', ''),
+        'retention': ('Days after which datasets are deleted, their values remain in the hourly, daily and weekly rollups, 0 keeps them', '0')
     }
     config_hint = ''
 
@@ -47,17 +49,14 @@ class XRootD(hf.module.ModuleBase):
         self.details_list = []
 
     def extractData(self):
-        #Imports for matplotlib & scipy must be made here, otherwise the module wouldn't be threadsafe.
+        import numpy as np
+        #Imports for scipy must be made here, otherwise the module wouldn't be threadsafe.
         #This would lead to server problems.
-        import matplotlib.pyplot as plt
         from scipy.interpolate import spline
         
         data = {}
         list_of_details = []
-        with open(self.source.getTmpPath(), 'r') as f:
-            data_object = json.loads(f.read())
-
-        for group in data_object['transfers']:
+        for group in iter_json_items(self.source.getTmpPath(), 'transfers'):
             if str(group['name']) == self.config['tier_name']:
                 for jobs in group['bins']:
                     details = {}
@@ -91,24 +90,22 @@ class XRootD(hf.module.ModuleBase):
             running_list.append(job['plot_data_active'] - job['plot_data_finished'])
             datetime_list.append(job['date'])
         
-        fig, ax1 = plt.subplots()
+        fig = FigureSpec()
+        ax1 = fig.add_subplot(111)
         index_list = np.arange(len(rate_list))
         ax1.set_title(self.config['tier_name'])
         ax1.set_xticks(index_list+0.5)
         ax1.set_xticklabels(datetime_list, rotation='vertical')
-        pos1_old = ax1.get_position()
-        ax1.set_position([pos1_old.x0,pos1_old.y0+0.2,pos1_old.width,pos1_old.height-0.2])
+        ax1.shift_position(0.2)
         ax2 = ax1.twinx()
-        pos2_old = ax2.get_position()
-        ax2.set_position([pos2_old.x0,pos2_old.y0+0.2,pos2_old.width,pos2_old.height-0.2])
+        ax2.shift_position(0.2)
 
         ax1.bar(index_list, finished_list, 1.0, color='mediumslateblue', label='finished')
         ax1.bar(index_list, running_list, 1.0, color='cornflowerblue',bottom=finished_list, label='running')
         ax1.set_ylabel('active = finished + running transfers', color='darkslateblue')
-        y1lim = ax1.get_ylim() # (y_min, y_max)
-        ax1.set_ylim(0., y1lim[1]*1.25) #Try to avoid histogram overlapping with legend.
-        for tl in ax1.get_yticklabels():
-            tl.set_color('darkslateblue')
+        ax1.scale_ylim(upper=1.25) #Try to avoid histogram overlapping with legend.
+        ax1.set_ylim(bottom=0.)
+        ax1.tick_params(axis='y', labelcolor='darkslateblue')
         # Legend for histograms only when data available
         if len(datetime_list) > 0:
             ax1.legend(loc='upper left')
@@ -128,13 +125,12 @@ class XRootD(hf.module.ModuleBase):
         else:
             ax2.plot(index_list+0.5,rate_list, 'r-')
         
-        y2lim = ax2.get_ylim() # (y_min, y_max)
-        ax2.set_ylim(0., y2lim[1]*1.25) #Try to avoid curve overlapping with legend.
-        for tl in ax2.get_yticklabels():
-            tl.set_color('r')
+        ax2.scale_ylim(upper=1.25) #Try to avoid curve overlapping with legend.
+        ax2.set_ylim(bottom=0.)
+        ax2.tick_params(axis='y', labelcolor='r')
         ax2.set_ylabel('Average transfer rate per file (MB/s)', color='r')
-        fig.savefig(hf.downloadService.getArchivePath(
-            self.run, self.instance_name + '_xrootd.png'), dpi=60)
+        submit(fig, hf.downloadService.getArchivePath(
+            self.run, self.instance_name + '_xrootd.png'), self.logger, dpi=60)
         data['filename_plot'] = self.instance_name + '_xrootd.png'
         
         return data
@@ -142,6 +138,12 @@ class XRootD(hf.module.ModuleBase):
     def fillSubtables(self, parent_id):
         self.subtables['details'].insert().execute(
             [dict(parent_id=parent_id, **row) for row in self.details_list])
+        # the rate of the latest bin, the bins of consecutive runs overlap
+        rates = {}
+        if self.details_list:
+            rates['rate'] = self.details_list[-1]['plot_data']
+            rates['active'] = self.details_list[-1]['plot_data_active']
+        update_rollups(self, parent_id, [], values=rates, retention=float(self.config['retention']))
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Helpers shared by the benchmarks in this directory.
+
+Every benchmark compares the former implementation of a task with the
+current one on generated input. Each variant runs in an interpreter of its
+own, so the maximum resident set size reported by the operating system
+belongs to that variant alone. The scripts are run with the Python 2 of
+HappyFace from any directory, e.g. ``python benchmarks/qstat_summary.py``;
+those importing HappyFace modules also need ``--happyface`` with the
+directory of the HappyFace installation.
+"""
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# root of the modules repository, where the modules and common/ live
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_path(happyface=None):
+    """ Make the modules, and with *happyface* the hf package, importable """
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    if happyface:
+        sys.path.insert(0, os.path.abspath(happyface))
+
+
+def max_rss_mb():
+    """ Maximum resident set size of this process so far, Linux reports kilobytes """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def best_time(function, repeat=3):
+    """ (seconds, result) of the fastest of *repeat* calls of *function* """
+    best = result = None
+    for i in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def run_variant(script, variant, arguments=()):
+    """
+    Run *script* with ``--variant`` *variant* in a new interpreter and return
+    the dictionary it passed to ``emit``.
+    """
+    output = subprocess.check_output([sys.executable, '-B', script, '--variant', variant] + list(arguments))
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def emit(result):
+    """ Hand the *result* dictionary of a variant to run_variant, adding the maximum RSS """
+    result = dict(result, max_rss_mb=round(max_rss_mb(), 1))
+    print json.dumps(result)
+
+
+def print_table(rows, columns):
+    """ Print the dictionaries in *rows* as a table of *columns*, (key, title, format) tuples """
+    cells = [[title for key, title, format in columns]]
+    for row in rows:
+        cells.append([format % row[key] if row.get(key) is not None else '-' for key, title, format in columns])
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    for line in cells:
+        print '  '.join(cell.rjust(width) for cell, width in zip(line, widths))
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Cold import of every module of this repository, as HappyFace does at start.
+
+Each measurement runs in a new interpreter that first imports the hf
+package, like a HappyFace worker, and then every module file in the root
+of a tree of this repository. It reports the time of the module imports,
+the resident set size before and after them and which of the heavy
+libraries were pulled in. With ``--compare`` an older revision is exported
+with git archive and measured the same way, e.g. the one before the heavy
+imports were moved to the acquisition paths::
+
+    python benchmarks/import_time.py --happyface /path/to/HappyFace --compare a0db05e~1
+"""
+
+import argparse
+import glob
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchutil import ROOT, run_variant, emit, print_table
+
+HEAVY = ['numpy', 'matplotlib', 'scipy', 'htcondor', 'lxml.etree', 'BeautifulSoup', 'feedparser', 'pytz']
+
+
+def import_all(tree, happyface):
+    sys.path.insert(0, os.path.abspath(happyface))
+    sys.path.insert(0, tree)
+    import hf
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    names = sorted(os.path.basename(path)[:-3] for path in glob.glob(os.path.join(tree, '*.py'))
+                   if os.path.basename(path) != '__init__.py')
+    failed = []
+    start = time.time()
+    for name in names:
+        try:
+            __import__(name)
+        except ImportError:
+            failed.append(name)
+    elapsed = time.time() - start
+    emit({'seconds': elapsed, 'modules': len(names), 'failed': failed, 'hf_rss_mb': rss,
+          'heavy': [name for name in HEAVY if name in sys.modules]})
+
+
+def measure(tree, happyface, repeat):
+    """ the run with the fastest import of *repeat* runs over *tree* """
+    results = [run_variant(os.path.abspath(__file__), 'import', ['--tree', tree, '--happyface', happyface])
+               for i in range(repeat)]
+    return min(results, key=lambda result: result['seconds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--happyface', required=True, help='directory of the HappyFace installation, for the hf package')
+    parser.add_argument('--compare', metavar='REVISION', help='git revision of this repository to measure as well')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per tree, the fastest is reported')
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    parser.add_argument('--tree', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.variant:
+        import_all(options.tree, options.happyface)
+        return
+
+    directory = tempfile.mkdtemp(prefix='import_time')
+    rows = []
+    try:
+        trees = [('current', ROOT)]
+        if options.compare:
+            archive = subprocess.Popen(['git', 'archive', options.compare], cwd=ROOT, stdout=subprocess.PIPE)
+            subprocess.check_call(['tar', '-x', '-C', directory], stdin=archive.stdout)
+            if archive.wait():
+                raise RuntimeError('git archive %s failed' % options.compare)
+            trees.insert(0, (options.compare, directory))
+        for label, tree in trees:
+            result = measure(tree, options.happyface, options.repeat)
+            result.update(tree=label, added_mb=result['max_rss_mb'] - result['hf_rss_mb'],
+                          imported=result['modules'] - len(result['failed']))
+            rows.append(result)
+    finally:
+        shutil.rmtree(directory)
+    print_table(rows, [('tree', 'tree', '%s'), ('modules', 'modules', '%i'), ('imported', 'imported', '%i'),
+                       ('seconds', 'seconds', '%.3f'), ('hf_rss_mb', 'RSS with hf MB', '%.1f'),
+                       ('max_rss_mb', 'RSS after MB', '%.1f'), ('added_mb', 'added MB', '%.1f')])
+    for row in rows:
+        print
+        print '%s: heavy libraries loaded: %s' % (row['tree'], ', '.join(row['heavy']) or 'none')
+        if row['failed']:
+            print '%s: import failed, dependency missing: %s' % (row['tree'], ', '.join(row['failed']))
+
+
+if __name__ == '__main__':
+    main()
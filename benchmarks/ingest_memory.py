@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Peak memory of reading large JSON and XML downloads, see common.ingest.
+
+Formerly the modules read a download into a string and parsed it into a
+complete document, holding both at once. Now they iterate over the records
+with ``iter_json_items`` and ``iter_xml_elements``. The benchmark writes a
+PhEDEx style link list in JSON and a block/file listing in XML of the given
+size and reads each in a separate interpreter both ways, reporting time and
+maximum RSS::
+
+    python benchmarks/ingest_memory.py --size 300
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchutil import setup_path, run_variant, emit, print_table
+
+
+def write_json(path, size):
+    """ {"phedex": {"link": [...]}} with 24 transfers per link, about *size* bytes """
+    with open(path, 'w') as f:
+        f.write('{"phedex": {"request_timestamp": 1700000000, "link": [')
+        index = 0
+        while f.tell() < size:
+            if index:
+                f.write(', ')
+            transfers = ', '.join('{"timebin": %i, "done_files": %i, "fail_files": %i, "rate": %i, "quality": %.3f}' %
+                (1700000000 - hour * 3600, index % 50, hour % 3, 1000 + index, (index % 100) / 100.0) for hour in range(24))
+            f.write('{"from": "T2_XX_Site%05i", "to": "T1_DE_KIT_Buffer", "transfer": [%s]}' % (index, transfers))
+            index += 1
+        f.write(']}}')
+
+
+def write_xml(path, size):
+    """ <phedex><block><file/>...</block>...</phedex> with 20 files per block, about *size* bytes """
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<phedex request_timestamp="1700000000">\n')
+        index = 0
+        while f.tell() < size:
+            f.write('<block name="/Primary%05i/Processed-v1/AOD#%08x" files="20" bytes="%i">\n' % (index % 1000, index, index * 20))
+            for number in range(20):
+                f.write('  <file name="/store/data/Primary%05i/AOD/%08x/%02i.root" bytes="%i" checksum="adler32:%08x"/>\n' %
+                    (index % 1000, index, number, index + number, index * 20 + number))
+            f.write('</block>\n')
+            index += 1
+        f.write('</phedex>\n')
+
+
+def read_json_before(path):
+    import json
+    content = json.loads(open(path).read())
+    links = transfers = 0
+    for link in content['phedex']['link']:
+        links += 1
+        transfers += sum(transfer['done_files'] for transfer in link['transfer'])
+    return links, transfers
+
+
+def read_json_after(path):
+    from common.ingest import iter_json_items
+    links = transfers = 0
+    for link in iter_json_items(path, 'phedex.link'):
+        links += 1
+        transfers += sum(transfer['done_files'] for transfer in link['transfer'])
+    return links, transfers
+
+
+def read_xml_before(path):
+    from lxml import etree
+    root = etree.fromstring(open(path).read())
+    blocks = files = 0
+    for block in root.findall('block'):
+        blocks += 1
+        files += sum(int(file.get('bytes')) for file in block.findall('file'))
+    return blocks, files
+
+
+def read_xml_after(path):
+    from common.ingest import iter_xml_elements
+    blocks = files = 0
+    for block in iter_xml_elements(path, 'block'):
+        blocks += 1
+        files += sum(int(file.get('bytes')) for file in block.findall('file'))
+    return blocks, files
+
+
+VARIANTS = [
+    ('json before', 'json', read_json_before),
+    ('json after', 'json', read_json_after),
+    ('xml before', 'xml', read_xml_before),
+    ('xml after', 'xml', read_xml_after),
+]
+
+
+def ijson_backend():
+    try:
+        import ijson
+    except ImportError:
+        return 'not installed, json module'
+    return ijson.items.__module__
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=float, default=300, help='size of each file in MB')
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    setup_path()
+
+    if options.variant:
+        name, kind, read = [variant for variant in VARIANTS if variant[0] == options.variant][0]
+        start = time.time()
+        records, total = read(options.path)
+        emit({'variant': name, 'seconds': time.time() - start, 'records': records, 'total': total})
+        return
+
+    directory = tempfile.mkdtemp(prefix='ingest_memory')
+    try:
+        paths = {'json': os.path.join(directory, 'links.json'), 'xml': os.path.join(directory, 'blocks.xml')}
+        write_json(paths['json'], int(options.size * 1024 * 1024))
+        write_xml(paths['xml'], int(options.size * 1024 * 1024))
+        print 'files: JSON %.0f MB, XML %.0f MB, ijson backend: %s' % (os.path.getsize(paths['json']) / 1048576.0,
+            os.path.getsize(paths['xml']) / 1048576.0, ijson_backend())
+        rows = [run_variant(os.path.abspath(__file__), name, ['--path', paths[kind]]) for name, kind, read in VARIANTS]
+    finally:
+        shutil.rmtree(directory)
+    print_table(rows, [('variant', 'variant', '%s'), ('seconds', 'seconds', '%.1f'),
+                       ('max_rss_mb', 'max RSS MB', '%.0f'), ('records', 'records', '%i'), ('total', 'checksum', '%i')])
+
+
+if __name__ == '__main__':
+    main()
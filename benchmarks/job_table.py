@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Per-user job statistics of the HTCondor modules, see common.jobtable.
+
+Formerly the modules copied every ClassAd into a dictionary of dictionaries
+and aggregated per user, site and walltime with loops over it. Now the ads
+are loaded into a JobTable of NumPy columns once and aggregated with its
+vectorized helpers. The benchmark computes the statistics both ways on
+synthetic ads, the cores, running jobs, mean CPU efficiency, sites and
+CPU time percentiles per walltime of every user, and checks that both
+agree::
+
+    python benchmarks/job_table.py --ads 100000,500000
+"""
+
+import argparse
+import random
+
+import numpy as np
+
+from benchutil import setup_path, best_time, print_table
+
+ATTRIBUTES = ['User', 'JobStatus', 'RequestCpus', 'RemoteUserCpu', 'RemoteSysCpu', 'ServerTime',
+              'JobStartDate', 'MachineAttrCloudSite0', 'RequestWalltime']
+NUMERIC = ['JobStatus', 'RequestCpus', 'RemoteUserCpu', 'RemoteSysCpu', 'ServerTime', 'JobStartDate',
+           'RequestWalltime']
+PERCENTILES = [2.5, 50, 97.5]
+NOW = 1700000000
+
+
+def make_ads(count, users):
+    """ *count* ads of *users* users, running jobs without a start date are possible as in the pool """
+    rng = random.Random(count)
+    names = ['user%02i' % index for index in range(users)]
+    sites = ['bwforcluster', 'condocker', 'ekpsupermachines', 'GridKa', None]
+    ads = []
+    for index in xrange(count):
+        ads.append({'User': rng.choice(names), 'JobStatus': rng.choice([1, 2, 2, 2, 4, 5]),
+                    'RequestCpus': rng.choice([1, 1, 4, 8]), 'RemoteUserCpu': rng.random() * 3600,
+                    'RemoteSysCpu': rng.random() * 60, 'ServerTime': NOW,
+                    'JobStartDate': rng.choice([None, NOW - rng.randint(1, 7200)]),
+                    'MachineAttrCloudSite0': rng.choice(sites),
+                    'RequestWalltime': rng.choice([3600, 7200, 86400])})
+    return ads
+
+
+def statistics_before(ads):
+    """ the former dictionary loops """
+    info = dict((index, dict((key, ad.get(key)) for key in ATTRIBUTES)) for index, ad in enumerate(ads))
+    stats = {}
+    for job in info.itervalues():
+        user = stats.setdefault(job['User'], {'cores': 0, 'running': 0, 'efficiency': [],
+                                              'sites': [], 'walltime': {}})
+        user['cores'] += job['RequestCpus']
+        if job['JobStatus'] != 2:
+            continue
+        user['running'] += 1
+        site = (job['MachineAttrCloudSite0'] or 'Undefined').lower()
+        if site not in user['sites']:
+            user['sites'].append(site)
+        try:
+            efficiency = (job['RemoteUserCpu'] + job['RemoteSysCpu']) / float(
+                job['RequestCpus'] * (job['ServerTime'] - job['JobStartDate']))
+            if efficiency <= 1:
+                user['efficiency'].append(efficiency)
+        except (TypeError, ZeroDivisionError):
+            pass
+        user['walltime'].setdefault(job['RequestWalltime'], []).append(job['RemoteUserCpu'])
+    result = {}
+    for name, user in stats.iteritems():
+        result[name] = (user['cores'], user['running'], np.mean(user['efficiency']), sorted(user['sites']),
+                        dict((walltime, np.percentile(values, PERCENTILES))
+                             for walltime, values in user['walltime'].iteritems()))
+    return result
+
+
+def statistics_after(ads):
+    """ the same with a JobTable """
+    from common.jobtable import JobTable
+    jobs = JobTable.from_ads(ads, numeric=NUMERIC, categorical=['User', 'MachineAttrCloudSite0'],
+                             converters={'MachineAttrCloudSite0': lambda site: site.lower()})
+    running = jobs['JobStatus'] == 2
+    cores = jobs.sum_by('User', jobs['RequestCpus'])
+    count = jobs.count_by('User', running)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = (jobs['RemoteUserCpu'] + jobs['RemoteSysCpu']) / (
+            jobs['RequestCpus'] * (jobs['ServerTime'] - jobs['JobStartDate']))
+        efficiency = jobs.mean_by('User', efficiency, running & np.isfinite(efficiency) & (efficiency <= 1))
+    sites = {}
+    for (name, site), rows in jobs.groups(['User', 'MachineAttrCloudSite0'], running):
+        sites.setdefault(name, []).append(site)
+    for name in jobs.count_by('User', running & (jobs['MachineAttrCloudSite0'] < 0)):
+        sites.setdefault(name, []).append('undefined')
+    percentiles = jobs.percentiles_by(['User', 'RequestWalltime'], jobs['RemoteUserCpu'], PERCENTILES, running)
+    result = {}
+    for name in cores:
+        walltime = dict((key[1], value) for key, value in percentiles.iteritems() if key[0] == name)
+        result[name] = (cores[name], count.get(name, 0), efficiency.get(name), sorted(sites.get(name, [])),
+                        walltime)
+    return result
+
+
+def same(before, after):
+    if sorted(before) != sorted(after):
+        return False
+    for name, (cores, running, efficiency, sites, walltime) in before.iteritems():
+        other = after[name]
+        if (cores, running, sites) != (other[0], other[1], other[3]) or abs(efficiency - other[2]) > 1e-9:
+            return False
+        if sorted(walltime) != sorted(other[4]):
+            return False
+        if not all(np.allclose(values, other[4][key]) for key, values in walltime.iteritems()):
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--ads', default='100000,500000', help='numbers of ads, comma separated')
+    parser.add_argument('--users', type=int, default=40, help='number of distinct users')
+    options = parser.parse_args()
+    setup_path()
+
+    rows = []
+    for count in map(int, options.ads.split(',')):
+        ads = make_ads(count, options.users)
+        before, old = best_time(lambda: statistics_before(ads))
+        after, new = best_time(lambda: statistics_after(ads))
+        rows.append({'ads': count, 'before': before, 'after': after, 'speedup': before / after,
+                     'same': 'yes' if same(old, new) else 'NO'})
+    print_table(rows, [('ads', 'ads', '%i'), ('before', 'dict loops s', '%.2f'), ('after', 'JobTable s', '%.2f'),
+                       ('speedup', 'speedup', '%.1f'), ('same', 'same statistics', '%s')])
+
+
+if __name__ == '__main__':
+    main()
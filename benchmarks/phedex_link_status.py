@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Link status confirmation of CMSPhedexDataExtract on a synthetic linktest file.
+
+extractData confirms the status of a link for every time bin of bad quality.
+Formerly every confirmation parsed the whole linktest download again, so the
+run time grew with the number of links times the number of bad bins, on top
+of the file growing with the links. Now the file is indexed once per run.
+The benchmark makes both confirm every bad bin of every link and reports the
+time for increasing numbers of links and bad bins::
+
+    python benchmarks/phedex_link_status.py --happyface /path/to/HappyFace
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+
+from benchutil import setup_path, best_time, print_table
+
+SITE = 'T1_DE_KIT_Buffer'
+TIME = 1700000000 // 3600 * 3600
+
+
+def write_linktest(path, links, bins, bad):
+    """ linktest file of *links* links with *bins* hourly bins, the first *bad* of them of low quality """
+    rng = random.Random(links * 1000 + bad)
+    content = {'phedex': {'link': []}}
+    for index in range(links):
+        remote = 'T%i_XX_Site%03i' % (1 + index % 3, index)
+        transfers = []
+        for position in range(bins):
+            quality = rng.uniform(0.0, 0.4) if position < bad else rng.uniform(0.8, 1.0)
+            transfers.append({'timebin': TIME - position * 3600, 'quality': quality,
+                              'done_files': 10, 'fail_files': 1, 'rate': 1000})
+        content['phedex']['link'].append({'from': remote, 'to': SITE, 'transfer': transfers})
+    with open(path, 'w') as f:
+        json.dump(content, f)
+    return ['T%i_XX_Site%03i' % (1 + index % 3, index) for index in range(links)]
+
+
+def confirm_link_status_reparse(module, link_name):
+    """ confirmLinkStatus before the index, it parsed the linktest file on every call """
+    fobj1 = json.load(open(module.source1.getTmpPath(), 'r'))['phedex']['link']
+
+    i = 0
+    avg_quality = 0.0
+    for links in fobj1:
+        if links[module.parse_direction].startswith(link_name) and module.your_name not in links[module.link_direction]:
+            for transfer in links['transfer']:
+                if transfer['quality'] != None and transfer['timebin'] >= module.quality_x_line:
+                    i += 1
+                    avg_quality += float(transfer['quality'])
+    if i > 0:
+        avg_quality = avg_quality/float(i)
+        if avg_quality < module.critical_average_quality:
+            link_status = 0
+        else:
+            link_status = 1
+    else:
+        link_status = 1
+
+    return link_status
+
+
+class Download(object):
+    def __init__(self, path):
+        self.path = path
+
+    def getTmpPath(self):
+        return self.path
+
+
+def make_module(path, bins):
+    from CMSPhedexDataExtract import CMSPhedexDataExtract
+    module = CMSPhedexDataExtract.__new__(CMSPhedexDataExtract)
+    module.source1 = Download(path)
+    module.your_name = 'T1_DE_KIT'
+    module.link_direction = 'to'
+    module.parse_direction = 'from'
+    module.quality_x_line = TIME - bins * 3600
+    module.critical_average_quality = 0.5
+    module.link_quality_index = None
+    module.link_status_cache = {}
+    return module
+
+
+def run(path, names, bins, bad, reparse):
+    # one confirmation per bad bin of every link, as in extractData
+    module = make_module(path, bins)
+    confirm = (lambda name: confirm_link_status_reparse(module, name)) if reparse else module.confirmLinkStatus
+    return [confirm(name) for name in names for position in range(bad)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--happyface', help='directory of the HappyFace installation, for the hf package')
+    parser.add_argument('--links', default='50,100,200', help='numbers of links, comma separated')
+    parser.add_argument('--bad', default='2,8', help='numbers of bad time bins per link, comma separated')
+    parser.add_argument('--bins', type=int, default=24, help='time bins per link')
+    options = parser.parse_args()
+    setup_path(options.happyface)
+
+    directory = tempfile.mkdtemp(prefix='phedex_link_status')
+    rows = []
+    try:
+        for links in map(int, options.links.split(',')):
+            for bad in map(int, options.bad.split(',')):
+                path = os.path.join(directory, 'linktest_%i_%i.json' % (links, bad))
+                names = write_linktest(path, links, options.bins, bad)
+                before, old = best_time(lambda: run(path, names, options.bins, bad, True), repeat=1)
+                after, new = best_time(lambda: run(path, names, options.bins, bad, False))
+                rows.append({'links': links, 'bad': bad, 'calls': links * bad,
+                             'size': os.path.getsize(path) / 1024.0 / 1024.0,
+                             'before': before, 'after': after, 'same': 'yes' if old == new else 'NO'})
+    finally:
+        shutil.rmtree(directory)
+    print_table(rows, [('links', 'links', '%i'), ('bad', 'bad bins', '%i'), ('calls', 'confirmations', '%i'),
+                       ('size', 'file MB', '%.1f'), ('before', 'before s', '%.3f'), ('after', 'after s', '%.4f'),
+                       ('same', 'same status', '%s')])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Job summary of the PBS module on a generated qstat dump, see common.pbsqstat.
+
+Formerly PBS read the ``qstat -f`` output into a dictionary holding every
+attribute of every job before counting the jobs per queue and owner. Now
+count_qstat_jobs keeps only the attributes it counts by while reading the
+lines. The benchmark generates a dump of --size MB with long attribute
+values and continuation lines, summarises it both ways, each in a
+separate interpreter, and reports time and maximum RSS::
+
+    python benchmarks/qstat_summary.py --size 200
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from benchutil import setup_path, run_variant, emit, print_table
+
+KEYS = ['queue', 'Job_Owner']
+
+
+def write_dump(path, size):
+    """ qstat -f output of at least *size* MB, returns the number of jobs """
+    rng = random.Random(3)
+    queues = ['short', 'long', 'cms', 'atlas', 'ops']
+    users = ['user%03i' % index for index in range(300)]
+    variables = ','.join('PBS_O_VAR%i=/some/long/path/value/%i' % (index, index) for index in range(30))
+    variables = '\n\t'.join(variables[index:index + 70] for index in range(0, len(variables), 70))
+    jobs = 0
+    with open(path, 'w') as f:
+        while f.tell() < size * 1024 * 1024:
+            jobs += 1
+            user = rng.choice(users)
+            f.write('Job Id: %i.batch.example.org\n' % jobs)
+            f.write('    Job_Name = job_%i\n    Job_Owner = %s@ui%i.example.org\n' % (jobs, user, rng.randint(1, 4)))
+            f.write('    resources_used.cput = 01:02:03\n    resources_used.mem = 123456kb\n'
+                    '    resources_used.walltime = 02:00:00\n')
+            f.write('    job_state = %s\n    queue = %s\n    server = batch.example.org\n' %
+                    (rng.choice('QRRRRH'), rng.choice(queues)))
+            f.write('    Checkpoint = u\n    ctime = Mon Oct 12 10:00:00 2026\n'
+                    '    Error_Path = ui.example.org:/home/%s/\n\tjob_%i.err\n' % (user, jobs))
+            f.write('    exec_host = %s\n' % '+'.join('node%02i/%i' % (rng.randint(1, 60), index)
+                                                     for index in range(8)))
+            f.write('    Hold_Types = n\n    Join_Path = n\n    Keep_Files = n\n    Mail_Points = a\n'
+                    '    mtime = Mon Oct 12 10:00:00 2026\n')
+            f.write('    Output_Path = ui.example.org:/home/%s/job_%i.out\n    Priority = 0\n'
+                    '    qtime = Mon Oct 12 10:00:00 2026\n' % (user, jobs))
+            f.write('    Rerunable = True\n    Resource_List.nodes = 1:ppn=8\n'
+                    '    Resource_List.walltime = 48:00:00\n')
+            f.write('    Variable_List = %s\n' % variables)
+            f.write('    euser = %s\n    egroup = cms\n    queue_rank = %i\n    queue_type = E\n'
+                    '    etime = Mon Oct 12 10:00:00 2026\n\n' % (user, jobs))
+    return jobs
+
+
+def extract_jobs(path):
+    """ the former PBS.extractJobs """
+    with open(path, 'r') as f:
+        jobs = {}
+        Id = ""
+        Key = ""
+        for line in f:
+            sline = line.lstrip()
+            depth = (len(line) - len(sline)) / 4
+            sline = sline.rstrip()
+
+            if line[0] == '\t':
+                jobs[Id][Key] += sline
+            elif depth == 0:
+                k = sline.split(": ", 2)
+                if k[0] == "Job Id":
+                    Id = k[1]
+                    jobs[Id] = {}
+            elif depth == 1:
+                k, val = sline.split(" = ", 2)
+                Key = k
+                jobs[Id][Key] = val
+
+    return jobs
+
+
+def get_job_summary(jobs, keys):
+    """ the former PBS.getJobSummary """
+    summary = {}
+    total = {'Q': 0, 'R': 0, 'H': 0}
+
+    for k in keys:
+        summary[k] = {}
+
+    for j in jobs:
+        state = jobs[j]['job_state']
+
+        for k in keys:
+            name = jobs[j][k].split('@')[0]
+            if not name in summary[k]:
+                summary[k][name] = {}
+            if not state in summary[k][name]:
+                summary[k][name][state] = 0
+            summary[k][name][state] += 1
+
+        if not state in total:
+            total[state] = 0
+        total[state] += 1
+
+    return summary, total
+
+
+def summarise(variant, path):
+    start = time.time()
+    if variant == 'before':
+        summary, total = get_job_summary(extract_jobs(path), KEYS)
+    else:
+        from common.pbsqstat import count_qstat_jobs
+        with open(path, 'r') as f:
+            summary, total = count_qstat_jobs(f, KEYS)
+    emit({'variant': variant, 'seconds': time.time() - start, 'jobs': sum(total.values()),
+          'summary': [summary, total]})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=200, help='size of the generated dump in MB')
+    parser.add_argument('--variant', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+    setup_path()
+
+    if options.variant:
+        summarise(options.variant, options.path)
+        return
+
+    directory = tempfile.mkdtemp(prefix='qstat_summary')
+    try:
+        path = os.path.join(directory, 'qstat.txt')
+        jobs = write_dump(path, options.size)
+        print 'qstat dump of %.0f MB with %i jobs' % (os.path.getsize(path) / 1024.0 / 1024.0, jobs)
+        results = [run_variant(os.path.abspath(__file__), variant, ['--path', path])
+                   for variant in ('before', 'after')]
+    finally:
+        shutil.rmtree(directory)
+    same = results[0]['summary'] == results[1]['summary']
+    for result in results:
+        result['same'] = 'yes' if same else 'NO'
+    print_table(results, [('variant', 'variant', '%s'), ('seconds', 'seconds', '%.1f'),
+                          ('max_rss_mb', 'max RSS MB', '%.0f'), ('jobs', 'jobs', '%i'),
+                          ('same', 'same summary', '%s')])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Bulk writer for module subtables.
+
+``bulk_insert(self.subtables['details'], rows, parent_id)`` replaces the
+usual ``insert().execute([dict(parent_id=parent_id, **row) ...])``. Rows are
+consumed lazily in chunks of *chunk_size*. They are written on the
+connection of the caller if one is passed, so they belong to its
+transaction, otherwise on the bind of the table like ``insert().execute()``.
+On PostgreSQL with psycopg2 the rows are streamed with ``COPY ... FROM
+STDIN``, on other backends every chunk is written with one ``executemany``.
+"""
+
+import itertools
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def bulk_insert(table, rows, parent_id=None, chunk_size=DEFAULT_CHUNK_SIZE, connection=None):
+    """
+    Insert the dicts in *rows* into *table*, adding *parent_id* to every row
+    if given. Like ``executemany`` the columns are those of the first row,
+    the Python side defaults of the table fill in the others. Runs on
+    *connection* if given, else on the bind of the table. Returns the number
+    of rows written.
+    """
+    if parent_id is not None:
+        rows = (dict(row, parent_id=parent_id) for row in rows)
+    connectable = connection if connection is not None else table.bind
+    if _supports_copy(connectable):
+        if connection is not None:
+            return _copy_rows(connection, table, rows, chunk_size)
+        # a single statement, committed on its own like implicit execution
+        with connectable.begin() as connection:
+            return _copy_rows(connection, table, rows, chunk_size)
+    count = 0
+    for chunk in _chunks(rows, chunk_size):
+        connectable.execute(table.insert(), chunk)
+        count += len(chunk)
+    return count
+
+
+def _chunks(rows, chunk_size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _supports_copy(connectable):
+    return connectable.dialect.name == 'postgresql' and connectable.dialect.driver == 'psycopg2'
+
+
+def _python_defaults(table):
+    """ Column defaults which COPY does not apply, by column name """
+    return dict((column.name, column.default) for column in table.columns
+                if column.default is not None and (column.default.is_scalar or column.default.is_callable))
+
+
+def _copy_rows(connection, table, rows, chunk_size):
+    chunks = _chunks(rows, chunk_size)
+    first = next(chunks, None)
+    if first is None:
+        return 0
+    defaults = _python_defaults(table)
+    columns = [column.name for column in table.columns if column.name in first[0] or column.name in defaults]
+    preparer = connection.dialect.identifier_preparer
+    statement = 'COPY %s (%s) FROM STDIN' % (preparer.format_table(table),
+        ', '.join(preparer.quote(name) for name in columns))
+    stream = _CopyStream(itertools.chain([first], chunks), columns, defaults)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(statement, stream)
+    finally:
+        cursor.close()
+    return stream.count
+
+
+class _CopyStream(object):
+    """ File-like object that renders chunks of rows in the text format of COPY """
+
+    def __init__(self, chunks, columns, defaults):
+        self.chunks = chunks
+        self.columns = columns
+        self.defaults = defaults
+        self.count = 0
+
+    def read(self, size=-1):
+        # psycopg2 sends whatever is returned, so hand out one chunk per call
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return ''
+        self.count += len(chunk)
+        return ''.join(self.formatRow(row) for row in chunk)
+
+    def formatRow(self, row):
+        return '\t'.join(_copy_value(row[name] if name in row else self.default(name)) for name in self.columns) + '\n'
+
+    def default(self, name):
+        default = self.defaults.get(name)
+        if default is None:
+            return None
+        if default.is_callable:
+            return default.arg(None)
+        return default.arg
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        value = repr(value)
+    elif isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
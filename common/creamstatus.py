@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Latest status of every job of a CREAM CE, kept in an SQLite file between runs.
+
+The job_status table of the CREAM database only grows, every status change
+of a job adds a row with a higher id. The store remembers this id as a high
+water mark per CREAM database, so a run only reads the status rows added
+since the previous one and replaces the status of the jobs they belong to.
+Finished jobs are expired once they are no longer shown, which keeps the
+store at the size of the active jobs, and the summaries are computed from it.
+"""
+
+import os
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS marks (
+    source TEXT PRIMARY KEY,
+    status_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    source TEXT NOT NULL,
+    job_id TEXT NOT NULL,
+    status_id INTEGER NOT NULL,
+    type INTEGER NOT NULL,
+    time_stamp timestamp,
+    queue TEXT,
+    user_id TEXT,
+    local_user TEXT,
+    worker_node TEXT,
+    lrms_job_id TEXT,
+    PRIMARY KEY (source, job_id)
+);
+CREATE INDEX IF NOT EXISTS jobs_type ON jobs (source, type);
+"""
+
+# columns of the rows passed to CreamStatusStore.update
+JOB_COLUMNS = ('job_id', 'status_id', 'type', 'time_stamp', 'queue', 'user_id', 'local_user',
+               'worker_node', 'lrms_job_id')
+
+
+def _in(values):
+    return '(%s)' % ', '.join('?' * len(values))
+
+
+def _seconds(time_stamp):
+    # the timestamps are compared as text, which only works if all have the same precision
+    if time_stamp is None:
+        return None
+    return time_stamp.replace(microsecond=0)
+
+
+class CreamStatusStore(object):
+    """
+    Jobs of the CREAM databases identified by *source*, e.g. a hash of their
+    URL, which must not end up in the file as it holds the password. Several
+    module instances can share a file as long as their sources differ.
+    """
+
+    def __init__(self, path, source, timeout=60):
+        self.source = source
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES)
+        self.connection.executescript(_SCHEMA)
+
+    def mark(self):
+        """ Highest job_status id which has been read, 0 for a new source """
+        row = self.connection.execute('SELECT status_id FROM marks WHERE source = ?', (self.source,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def adopt(self, source):
+        """
+        Take over the jobs and the mark stored under the former key *source*
+        and remove it from the file. Returns whether there were any.
+        """
+        with self.connection:
+            if self.connection.execute('SELECT 1 FROM marks WHERE source = ?', (source,)).fetchone() is None:
+                return False
+            for table in ('jobs', 'marks'):
+                self.connection.execute('DELETE FROM %s WHERE source = ?' % table, (self.source,))
+                self.connection.execute('UPDATE %s SET source = ? WHERE source = ?' % table, (self.source, source))
+        # overwrite the pages which held the former key
+        self.connection.execute('VACUUM')
+        return True
+
+    def reset(self):
+        """ Forget all jobs of the source, e.g. after the CREAM database was recreated """
+        with self.connection:
+            self.connection.execute('DELETE FROM jobs WHERE source = ?', (self.source,))
+            self.connection.execute('DELETE FROM marks WHERE source = ?', (self.source,))
+
+    def update(self, rows, mark):
+        """
+        Replace the status of the jobs in *rows*, sequences of the values of
+        JOB_COLUMNS holding the latest status of each job, and move the mark
+        to *mark*.
+        """
+        time_stamp = JOB_COLUMNS.index('time_stamp')
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO jobs (source, %s) VALUES (?, %s)' %
+                (', '.join(JOB_COLUMNS), ', '.join('?' * len(JOB_COLUMNS))),
+                ([self.source] + list(row[:time_stamp]) + [_seconds(row[time_stamp])] + list(row[time_stamp + 1:])
+                 for row in rows))
+            self.connection.execute('INSERT OR REPLACE INTO marks (source, status_id) VALUES (?, ?)',
+                (self.source, mark))
+
+    def expire(self, running, since):
+        """
+        Forget the jobs in a state not in *running* which entered it before
+        *since* or at an unknown time
+        """
+        running = list(running)
+        with self.connection:
+            self.connection.execute('DELETE FROM jobs WHERE source = ? AND type NOT IN %s '
+                'AND (time_stamp <= ? OR time_stamp IS NULL)' % _in(running), [self.source] + running + [_seconds(since)])
+
+    def summaries(self, running, since):
+        """
+        Number of jobs per queue, user and worker node and status, counting
+        the jobs in a state of *running* and the others which entered their
+        state after *since*. Returns three lists of (name, status, count)
+        tuples, those of the users with the local user name appended.
+        """
+        running = list(running)
+        # SQLite has no GROUPING SETS, the three groupings share the filtered jobs instead
+        query = """
+            WITH shown AS (
+                SELECT queue, user_id, local_user, worker_node, type FROM jobs
+                WHERE source = ? AND (type IN %s OR time_stamp > ?)
+            )
+            SELECT 'queue', queue, type, count(*), NULL FROM shown GROUP BY queue, type
+            UNION ALL
+            SELECT 'user', user_id, type, count(*), max(local_user) FROM shown GROUP BY user_id, type
+            UNION ALL
+            SELECT 'node', worker_node, type, count(*), NULL FROM shown GROUP BY worker_node, type
+        """ % _in(running)
+        summaries = {'queue': [], 'user': [], 'node': []}
+        for grouping, name, status, count, local_name in self.connection.execute(query,
+                [self.source] + running + [_seconds(since)]):
+            if grouping == 'user':
+                summaries[grouping].append((name, status, count, local_name))
+            else:
+                summaries[grouping].append((name, status, count))
+        return summaries['queue'], summaries['user'], summaries['node']
+
+    def jobs(self, types):
+        """ Yield (job_id, lrms_job_id, worker_node, type, time_stamp) of the jobs in a state of *types* """
+        types = list(types)
+        query = ('SELECT job_id, lrms_job_id, worker_node, type, time_stamp FROM jobs '
+            'WHERE source = ? AND type IN %s' % _in(types))
+        for row in self.connection.execute(query, [self.source] + types):
+            yield row
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Append-only store of per-job CPU efficiency samples, kept in an SQLite file.
+
+Every run adds one sample per running job, identified by the job's walltime,
+so the cost of a run depends on the number of running jobs only and not on
+the size of the history. Jobs not seen for longer than a time to live are
+removed by ``compact``. Readers select the jobs seen within a time window,
+optionally restricted to some job ids.
+
+Older versions kept the history in a JSON file. ``import_legacy_json``
+fills a new store from such a file once. ``export_legacy_json`` writes it
+for consumers on other hosts which cannot read the store; it rewrites all
+jobs of the window, so it is only done where such consumers exist.
+"""
+
+import json
+import os
+import sqlite3
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    ncpus INTEGER NOT NULL,
+    last REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_last ON jobs (last);
+CREATE TABLE IF NOT EXISTS samples (
+    job_id TEXT NOT NULL,
+    walltime INTEGER NOT NULL,
+    time REAL NOT NULL,
+    cputime REAL NOT NULL,
+    input REAL NOT NULL,
+    output REAL NOT NULL,
+    PRIMARY KEY (job_id, walltime)
+);
+"""
+
+
+class EfficiencyHistoryStore(object):
+    def __init__(self, path, timeout=60):
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.executescript(_SCHEMA)
+        self.pending_jobs = {}
+        self.pending_samples = []
+
+    def add_sample(self, job_id, ncpus, walltime, cputime, input=0.0, output=0.0, now=None):
+        """ Queue a sample of a job, it is written by the next commit """
+        now = time.time() if now is None else now
+        self.pending_jobs[job_id] = (job_id, ncpus, now)
+        self.pending_samples.append((job_id, int(walltime), now, cputime, input, output))
+
+    def commit(self):
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO jobs (job_id, ncpus, last) VALUES (?, ?, ?)',
+                self.pending_jobs.itervalues())
+            self.connection.executemany('INSERT OR REPLACE INTO samples (job_id, walltime, time, cputime, input, output) '
+                'VALUES (?, ?, ?, ?, ?, ?)', self.pending_samples)
+        self.pending_jobs = {}
+        self.pending_samples = []
+
+    def compact(self, ttl, now=None):
+        """ Forget all jobs which were not seen within the last *ttl* seconds """
+        limit = (time.time() if now is None else now) - ttl
+        with self.connection:
+            self.connection.execute('DELETE FROM samples WHERE job_id IN (SELECT job_id FROM jobs WHERE last < ?)', (limit,))
+            self.connection.execute('DELETE FROM jobs WHERE last < ?', (limit,))
+
+    def last_update(self):
+        return self.connection.execute('SELECT max(last) FROM jobs').fetchone()[0] or 0
+
+    def history(self, since, job_ids=None):
+        """
+        Yield (job_id, ncpus, last, samples) for every job seen after *since*,
+        samples being a list of (walltime, cputime, input, output) tuples
+        sorted by walltime.
+        """
+        query = ('SELECT jobs.job_id, jobs.ncpus, jobs.last, samples.walltime, samples.cputime, samples.input, samples.output '
+            'FROM jobs JOIN samples ON samples.job_id = jobs.job_id WHERE jobs.last >= ?')
+        parameters = [since]
+        if job_ids is not None:
+            job_ids = list(job_ids)
+            query += ' AND jobs.job_id IN (%s)' % ', '.join('?' * len(job_ids))
+            parameters.extend(job_ids)
+        query += ' ORDER BY jobs.job_id, samples.walltime'
+
+        current = None
+        for job_id, ncpus, last, walltime, cputime, input, output in self.connection.execute(query, parameters):
+            if current is None or current[0] != job_id:
+                if current is not None:
+                    yield current
+                current = (job_id, ncpus, last, [])
+            current[3].append((walltime, cputime, input, output))
+        if current is not None:
+            yield current
+
+    def close(self):
+        self.connection.close()
+
+
+def legacy_history(content):
+    """
+    Jobs of the JSON history *content* of older versions in the format of
+    EfficiencyHistoryStore.history
+    """
+    jobs = []
+    for job_id, entry in content.iteritems():
+        entry = dict(entry)
+        last = entry.pop('last', 0)
+        ncpus = entry.pop('ncpus', 1)
+        samples = []
+        for walltime, values in entry.iteritems():
+            if isinstance(values, (int, long, float)):
+                samples.append((int(walltime), values, 0, 0))
+            else:
+                samples.append((int(walltime), values[0], values[1], values[2] if len(values) > 2 else 0))
+        jobs.append((job_id, ncpus, last, sorted(samples)))
+    return jobs
+
+
+def import_legacy_json(store, path):
+    """
+    Add the jobs of the JSON history at *path* to *store* if the store is
+    still empty. Returns the number of imported jobs.
+    """
+    if store.last_update() or not os.path.exists(path):
+        return 0
+    try:
+        with open(path, 'r') as f:
+            jobs = legacy_history(json.load(f))
+    except (ValueError, TypeError, AttributeError, IndexError):
+        return 0
+    for job_id, ncpus, last, samples in jobs:
+        for walltime, cputime, input, output in samples:
+            store.add_sample(job_id, ncpus, walltime, cputime, input, output, now=last)
+    store.commit()
+    return len(jobs)
+
+
+def export_legacy_json(store, path, since):
+    """ Write the jobs seen after *since* to *path* in the JSON format of older versions """
+    content = {}
+    for job_id, ncpus, last, samples in store.history(since):
+        entry = content[job_id] = {'last': last, 'ncpus': ncpus}
+        for walltime, cputime, input, output in samples:
+            entry[str(walltime)] = (cputime, input, output)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(content, f)
+    os.rename(path + '.tmp', path)
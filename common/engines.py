@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Database engines for modules which read an external database.
+
+``create_engine`` in every run opens new connections and reflects the tables
+again. ``pooled_engine(url)`` returns one engine per URL and process, whose
+connections are kept in a pool between runs, and ``reflected_tables``
+reflects the tables of an engine once::
+
+    engine = pooled_engine(self.config['database'])
+    job, job_status = reflected_tables(engine, 'job', 'job_status')
+"""
+
+import threading
+
+# servers close idle connections, e.g. MySQL after wait_timeout (8 hours by default)
+POOL_RECYCLE = 3600
+
+_engines = {}
+_tables = {}
+_lock = threading.Lock()
+
+
+def pooled_engine(url, **options):
+    """ The engine of *url*, created with *options* on the first call only """
+    from sqlalchemy import create_engine
+    with _lock:
+        engine = _engines.get(url)
+        if engine is None:
+            options.setdefault('pool_recycle', POOL_RECYCLE)
+            engine = _engines[url] = create_engine(url, **options)
+        return engine
+
+
+def reflected_tables(engine, *names):
+    """ The Table objects of *names* in the database of *engine*, reflected once """
+    from sqlalchemy import MetaData, Table
+    with _lock:
+        entry = _tables.get(engine)
+        if entry is None:
+            metadata = MetaData()
+            metadata.bind = engine
+            entry = _tables[engine] = (metadata, {})
+        metadata, tables = entry
+        for name in names:
+            if name not in tables:
+                tables[name] = Table(name, metadata, autoload=True)
+        return [tables[name] for name in names]
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Concurrent HTTP fetching for modules that query services directly instead of
+going through ``hf.downloadService``.
+
+``fetch_all(urls)`` requests all URLs in parallel, with at most *per_host*
+concurrent requests against the same host and *max_workers* requests in
+total. Every worker keeps its HTTP/1.1 connection to the host open, so
+consecutive requests against a host reuse it. After *deadline* seconds all
+requests still waiting or running are given up, so the wall time is bounded
+by the slowest host instead of the sum of all requests. Errors never raise,
+each ``FetchResult`` carries either the response body or an error message.
+
+Passing a ``ResponseCache`` keeps response bodies between runs: URLs fetched
+less than *ttl* seconds ago are not requested at all, older ones are
+revalidated with their ETag and only transferred again if they changed.
+"""
+
+import base64
+import httplib
+import json
+import os
+import socket
+import threading
+import time
+import urlparse
+from Queue import Queue, Empty
+
+MAX_REDIRECTS = 5
+
+
+class FetchResult(object):
+    def __init__(self, url):
+        self.url = url
+        self.body = None
+        self.error = 'not fetched'
+        self.elapsed = 0.0
+        self.status = None
+        self.etag = None
+        self.cached = False
+        self.request_headers = {}
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<FetchResult %s %s>' % (self.url, 'ok' if self.ok else self.error)
+
+
+def fetch(url, timeout=10, headers=None):
+    """ Fetch a single URL, see fetch_all. """
+    return fetch_all([url], timeout=timeout, headers=headers)[0]
+
+
+def fetch_all(urls, timeout=10, max_workers=8, per_host=2, deadline=None, headers=None, logger=None, cache=None):
+    """
+    Fetch all *urls* concurrently and return a list of FetchResult objects in
+    the same order. *timeout* applies to every single socket operation,
+    *deadline* to the whole batch. *headers* are sent with every request,
+    e.g. an Authorization header. If a ResponseCache is given as *cache*,
+    it is consulted before and updated after the requests.
+    """
+    results = [FetchResult(url) for url in urls]
+    deadline_at = time.time() + deadline if deadline is not None else None
+    slots = threading.BoundedSemaphore(max_workers)
+
+    queues = {}
+    for result in results:
+        result.request_headers = dict(headers or {})
+        if cache is not None:
+            body = cache.fresh(result.url)
+            if body is not None:
+                result.body, result.error, result.cached = body, None, True
+                continue
+            result.request_headers.update(cache.validators(result.url))
+        queues.setdefault(_host_key(result.url), Queue()).put(result)
+
+    workers = []
+    for key, queue in queues.iteritems():
+        for i in xrange(min(per_host, queue.qsize())):
+            worker = threading.Thread(target=_work, args=(queue, slots, timeout, deadline_at))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+
+    for worker in workers:
+        if deadline_at is None:
+            worker.join()
+        else:
+            worker.join(max(0.0, deadline_at - time.time()))
+    for result in results:
+        if result.body is None and result.error == 'not fetched':
+            result.error = 'deadline of %ss exceeded' % deadline
+        if cache is not None and result.ok and not result.cached:
+            if result.status == 304:
+                result.body, result.cached = cache.revalidated(result.url), True
+            else:
+                cache.store(result.url, result.body, result.etag)
+        if logger is not None and not result.ok:
+            logger.error('Fetching %s failed: %s' % (result.url, result.error))
+    return results
+
+
+def _host_key(url):
+    parts = urlparse.urlsplit(url)
+    return parts.scheme, parts.netloc
+
+
+def _work(queue, slots, timeout, deadline_at):
+    connections = {}
+    try:
+        while True:
+            try:
+                result = queue.get_nowait()
+            except Empty:
+                return
+            if deadline_at is not None and time.time() >= deadline_at:
+                continue
+            slots.acquire()
+            try:
+                start = time.time()
+                status, body, etag, error = _request(result.url, connections, timeout, deadline_at, result.request_headers)
+                if deadline_at is None or time.time() < deadline_at:
+                    # results of requests finishing after the deadline are already given up
+                    result.status, result.body, result.etag, result.error = status, body, etag, error
+                    result.elapsed = time.time() - start
+            finally:
+                slots.release()
+    finally:
+        for connection in connections.itervalues():
+            connection.close()
+
+
+def _request(url, connections, timeout, deadline_at, headers):
+    try:
+        for i in xrange(MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(url)
+            if deadline_at is not None:
+                timeout = max(0.1, min(timeout, deadline_at - time.time()))
+            connection = _connection(connections, parts, timeout)
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except socket.timeout:
+                raise
+            except (httplib.HTTPException, socket.error):
+                # the server may have closed a kept-alive connection, retry once on a new one
+                connection.close()
+                del connections[(parts.scheme, parts.netloc)]
+                connection = _connection(connections, parts, timeout)
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            if response.status in (301, 302, 303, 307, 308) and response.getheader('location'):
+                url = urlparse.urljoin(url, response.getheader('location'))
+                continue
+            if response.status == 304:
+                return response.status, None, response.getheader('etag'), None
+            if response.status >= 400:
+                return response.status, None, None, 'HTTP %i %s' % (response.status, response.reason)
+            return response.status, body, response.getheader('etag'), None
+        return None, None, None, 'too many redirects'
+    except socket.timeout:
+        return None, None, None, 'timeout after %ss' % timeout
+    except (httplib.HTTPException, socket.error), e:
+        return None, None, None, '%s: %s' % (e.__class__.__name__, e)
+
+
+def _connection(connections, parts, timeout):
+    key = (parts.scheme, parts.netloc)
+    if key not in connections:
+        if parts.scheme == 'https':
+            connections[key] = httplib.HTTPSConnection(parts.netloc, timeout=timeout)
+        else:
+            connections[key] = httplib.HTTPConnection(parts.netloc, timeout=timeout)
+    connection = connections[key]
+    connection.timeout = timeout
+    if connection.sock is not None:
+        connection.sock.settimeout(timeout)
+    return connection
+
+
+class ResponseCache(object):
+    """
+    Response bodies of earlier runs, stored as JSON in the file *path*, the
+    bodies base64 encoded so any bytes survive. Entries younger than *ttl*
+    seconds are used without asking the server, entries not used for
+    *expire* seconds are dropped when saving.
+    """
+
+    def __init__(self, path, ttl, expire=7*24*3600):
+        self.path = path
+        self.ttl = ttl
+        self.expire = expire
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    entries = json.load(f)
+                for url, entry in entries.iteritems():
+                    # entries of older versions kept the body as text and are fetched again
+                    if 'data' in entry:
+                        entry['body'] = base64.b64decode(entry.pop('data'))
+                        self.entries[url] = entry
+            except (ValueError, TypeError, AttributeError):
+                # a broken cache file is simply started over
+                self.entries = {}
+
+    def fresh(self, url):
+        entry = self.entries.get(url)
+        if entry is not None and time.time() - entry['time'] < self.ttl:
+            entry['used'] = time.time()
+            return entry['body']
+        return None
+
+    def validators(self, url):
+        entry = self.entries.get(url)
+        if entry is not None and entry.get('etag'):
+            return {'If-None-Match': entry['etag']}
+        return {}
+
+    def revalidated(self, url):
+        entry = self.entries[url]
+        entry['time'] = entry['used'] = time.time()
+        return entry['body']
+
+    def store(self, url, body, etag):
+        now = time.time()
+        self.entries[url] = {'body': body, 'etag': etag, 'time': now, 'used': now}
+
+    def save(self):
+        limit = time.time() - self.expire
+        self.entries = dict((url, entry) for url, entry in self.entries.iteritems() if entry['used'] >= limit)
+        stored = {}
+        for url, entry in self.entries.iteritems():
+            stored[url] = dict((key, value) for key, value in entry.iteritems() if key != 'body')
+            stored[url]['data'] = base64.b64encode(entry['body'])
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(stored, f)
+        os.rename(self.path + '.tmp', self.path)
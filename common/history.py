@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Values of earlier runs of a module instance, for trend plots and status
+smoothing.
+
+The queries select the datasets of the instance within the last *hours*
+or the last *runs* runs and leave the work to the database::
+
+    # one (time, load) pair per hour of the last two days
+    history = column_history(self, ['avg_load_last_1min'], hours=48, step=3600)
+
+    # total size of the detail rows of every dataset of the last 10 runs
+    totals = subtable_history(self, 'details', 'total', aggregate=func.sum, runs=10)
+
+    # number of values and mean load of the last 4 runs
+    [(count, load)] = recent_average(self, ['avg_load_last_1min'], runs=4)
+
+With a *step* (in seconds) the datasets are grouped into time intervals of
+that length. Each interval yields the time of its first run and the
+*aggregate* of the values. ``extractData`` runs before its own dataset is
+written, so the history only contains earlier runs. Subtable rows shared
+through ``common.reuse`` are counted for every dataset referring to them.
+"""
+
+import datetime
+
+from sqlalchemy import Integer
+from sqlalchemy.sql import select, func, and_, cast, extract
+
+
+def _runs_table():
+    import hf
+    return hf.module.database.hf_runs
+
+
+def _bucket(time, step, dialect):
+    """ number of the *step* seconds interval containing *time* """
+    if dialect == 'sqlite':
+        return cast(func.strftime('%s', time), Integer) / step
+    if dialect == 'mysql':
+        return func.floor(func.unix_timestamp(time) / step)
+    return func.floor(extract('epoch', time) / step)
+
+
+def _window(module, hours, runs, until):
+    """ conditions selecting the datasets of the instance in the window """
+    table = module.module_table
+    runs_table = _runs_table()
+    conditions = [table.c.instance == module.instance_name, table.c.run_id == runs_table.c.id]
+    if hours is not None and until is None:
+        until = datetime.datetime.now()
+    if hours is not None:
+        conditions.append(runs_table.c.time >= until - datetime.timedelta(hours=hours))
+    if until is not None:
+        conditions.append(runs_table.c.time <= until)
+    if runs is not None:
+        # id of the oldest of the last *runs* datasets, aliases keep the
+        # subquery from being correlated with the outer query
+        previous = table.alias()
+        oldest = select([previous.c.id]).where(previous.c.instance == module.instance_name)
+        if until is not None:
+            previous_runs = runs_table.alias()
+            oldest = oldest.where(and_(previous.c.run_id == previous_runs.c.id, previous_runs.c.time <= until))
+        oldest = oldest.order_by(previous.c.id.desc()).limit(1).offset(max(runs - 1, 0)).as_scalar()
+        conditions.append(table.c.id >= func.coalesce(oldest, 0))
+    return conditions, runs_table
+
+
+def _grouped(query, values, time, step, aggregate, dialect):
+    if step is None:
+        return select([time] + values, from_obj=query).order_by(time)
+    bucket = _bucket(time, step, dialect)
+    return select([func.min(time)] + [aggregate(value) for value in values], from_obj=query).\
+        group_by(bucket).order_by(bucket)
+
+
+def column_history(module, columns, hours=None, runs=None, step=None, aggregate=func.avg, until=None):
+    """
+    List of (time, value, ...) tuples of the module table *columns* of the
+    instance, ordered by time. The datasets are those of the last *hours*
+    before *until* (default now) or of the last *runs* runs, both limits
+    may be combined. *step* groups them into intervals of that many
+    seconds, the values of an interval are combined by *aggregate*.
+    """
+    table = module.module_table
+    conditions, runs_table = _window(module, hours, runs, until)
+    query = select([runs_table.c.time.label('time')] + [table.c[name] for name in columns]).\
+        where(and_(*conditions)).alias('history')
+    values = [query.c[name] for name in columns]
+    dialect = table.bind.dialect.name
+    statement = _grouped(query, values, query.c.time, step, aggregate, dialect)
+    return [tuple(row) for row in table.bind.execute(statement)]
+
+
+def subtable_history(module, name, column, aggregate=func.sum, hours=None, runs=None, step=None,
+                     step_aggregate=func.avg, until=None):
+    """
+    List of (time, value) tuples with the *aggregate* of the *column* of
+    the subtable *name* for every dataset in the window, see
+    ``column_history``. With a *step* the values of the datasets in an
+    interval are combined by *step_aggregate*.
+    """
+    table = module.module_table
+    subtable = module.subtables[name]
+    conditions, runs_table = _window(module, hours, runs, until)
+    owner = func.coalesce(table.c.data_id, table.c.id) if 'data_id' in table.c else table.c.id
+    query = select([runs_table.c.time.label('time'), aggregate(subtable.c[column]).label('value')]).\
+        where(and_(subtable.c.parent_id == owner, *conditions)).\
+        group_by(table.c.id, runs_table.c.time).alias('history')
+    dialect = table.bind.dialect.name
+    statement = _grouped(query, [query.c.value], query.c.time, step, step_aggregate, dialect)
+    return [tuple(row) for row in table.bind.execute(statement)]
+
+
+def recent_average(module, columns, runs, hours=None):
+    """
+    [(count, mean), ...]: for each of the *columns* the number of values
+    among the last *runs* runs (within the last *hours*, if given) and
+    their mean, None without values. Failed runs leave the columns NULL,
+    so the counts of the columns may differ.
+    """
+    table = module.module_table
+    conditions, runs_table = _window(module, hours, runs, None)
+    statement = select([func.count(table.c[name]) for name in columns] +
+                       [func.avg(table.c[name]) for name in columns]).where(and_(*conditions))
+    row = table.bind.execute(statement).fetchone()
+    return zip(row[:len(columns)], row[len(columns):])
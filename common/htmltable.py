@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Extraction of tables from HTML pages.
+
+``iter_table_rows`` yields the ``tr`` elements of the tables selected by
+class, id or XPath, ``iter_table_records`` turns them into lists of cell
+values or, with a header, into dictionaries::
+
+    for service in iter_table_records(path, table_class='status', header={
+            'Host': 'host_name', 'Service': 'service_name', 'Status': 'status_short'}):
+        ...
+
+Tables selected by class or id are read with a pull parser which only reports
+tables and rows. Rows are handed out as soon as they are complete and released
+afterwards, other tables are dropped once they are complete, and the rest of
+the page is not parsed once *limit* tables have been read. Selection by XPath needs the whole
+document and parses it completely.
+
+Rows belong to the selected table itself, rows of tables nested in its cells
+are part of the cell content. The rows are lxml.html elements, so
+``text_content()``, ``iterlinks()`` etc. are available.
+"""
+
+from common.ingest import release_element
+
+CHUNK_SIZE = 1 << 16
+
+
+def cell_text(element):
+    """ text of a cell, whitespace collapsed to single blanks """
+    return ' '.join(element.text_content().split())
+
+
+def _events(source):
+    from lxml import etree
+    import lxml.html
+    # only events of tables and rows are reported, which avoids most of the element proxies
+    parser = etree.HTMLPullParser(events=('start', 'end'), tag=('table', 'tr'))
+    # all elements are lxml.html elements, the tag specific classes of
+    # lxml.html.HtmlElementClassLookup are not needed and the lookup is much slower
+    parser.set_element_class_lookup(etree.ElementDefaultClassLookup(
+        element=lxml.html.HtmlElement, comment=lxml.html.HtmlComment))
+    f = open(source, 'rb') if isinstance(source, basestring) else source
+    try:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), ''):
+            parser.feed(chunk)
+            for event in parser.read_events():
+                yield event
+        try:
+            parser.close()
+        except etree.XMLSyntaxError:
+            # empty document
+            return
+        for event in parser.read_events():
+            yield event
+    finally:
+        if f is not source:
+            f.close()
+
+
+def _matches(table, table_class, table_id):
+    if table_id is not None and table.get('id') != table_id:
+        return False
+    if table_class is not None and table_class not in table.get('class', '').split():
+        return False
+    return True
+
+
+def _own_rows(element):
+    table = element if element.tag == 'table' else next(element.iterancestors('table'), None)
+    for row in element.iter('tr'):
+        if next(row.iterancestors('table'), None) is table:
+            yield row
+
+
+def _xpath_rows(source, xpath, variables, section, limit):
+    import lxml.html
+    tree = lxml.html.parse(source)
+    for index, element in enumerate(tree.xpath(xpath, **(variables or {}))):
+        if limit is not None and index >= limit:
+            break
+        rows = [element] if element.tag == 'tr' else _own_rows(element)
+        for row in rows:
+            if section is None or row.getparent().tag == section:
+                yield row
+
+
+def iter_table_rows(source, table_class=None, table_id=None, xpath=None, variables=None,
+                    section=None, limit=1):
+    """
+    Yield the rows of the tables in the HTML file *source* (a path or a file object).
+
+    Tables are selected by *table_class* (one of the classes of the table),
+    *table_id* or both, without either every table matches. Alternatively
+    *xpath* selects tables, table sections or single rows, *variables* are
+    passed to the XPath expression. Only the first *limit* selected tables
+    (or XPath matches) are read, None reads all of them. *section* restricts
+    the rows to those of a table section, e.g. 'tbody'.
+
+    A yielded row is released as soon as the caller asks for the next one,
+    except when selecting by XPath.
+    """
+    if xpath is not None:
+        for row in _xpath_rows(source, xpath, variables, section, limit):
+            yield row
+        return
+
+    # nesting level of tables inside the selected one, None outside of it
+    level = None
+    found = 0
+    for event, element in _events(source):
+        if element.tag == 'table':
+            if level is None:
+                if event == 'start' and _matches(element, table_class, table_id):
+                    level = 0
+                elif event == 'end':
+                    release_element(element)
+            elif event == 'start':
+                level += 1
+            elif level > 0:
+                level -= 1
+            else:
+                release_element(element)
+                level = None
+                found += 1
+                if limit is not None and found >= limit:
+                    return
+        elif event == 'end':
+            # rows of nested tables stay with the cell containing them
+            if level == 0:
+                if section is None or element.getparent().tag == section:
+                    yield element
+                release_element(element)
+            elif level is None:
+                release_element(element)
+
+
+def iter_table_records(source, header=None, cell=cell_text, cell_tags=('td', 'th'), **selection):
+    """
+    Yield the rows selected by iter_table_rows(source, **selection) as lists
+    of cell values, rows without cells are skipped.
+
+    Only the cells with a tag in *cell_tags* count. *cell* converts a cell
+    element to its value, None keeps the element. With a *header* the rows are
+    yielded as dictionaries:
+
+    - True: the first row holds the keys
+    - a dictionary: the first row holds column titles, which are mapped to
+      the keys, columns without a key are dropped
+    - a list: the keys by position, None drops a column
+    """
+    keys = None
+    if header is not None and header is not True and not isinstance(header, dict):
+        keys = list(header)
+    for row in iter_table_rows(source, **selection):
+        cells = [element for element in row if element.tag in cell_tags]
+        if not cells:
+            continue
+        if header is None:
+            yield [cell(element) for element in cells] if cell is not None else cells
+            continue
+        if keys is None:
+            titles = [cell_text(element) for element in cells]
+            keys = titles if header is True else [header.get(title) for title in titles]
+            continue
+        yield dict((key, cell(element) if cell is not None else element)
+                   for key, element in zip(keys, cells) if key is not None)
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Declarative indexes of module tables and subtables.
+
+A module declares its indexes next to its columns::
+
+    table_indexes = [IndexSpec('instance', 'id')]
+    subtable_indexes = {
+        'details': [IndexSpec('parent_id', 'poolname')],
+        'jobs': [IndexSpec('parent_id'), IndexSpec('node', where="status = 'running'")],
+    }
+
+An IndexSpec lists the columns of a composite index. *where* (SQL text)
+makes it a partial index on backends which support them, i.e. PostgreSQL
+and SQLite. The other backends index all rows. Tables without a
+declaration get the defaults: ``parent_id`` for subtables, and for
+module tables ``(instance, id)`` and ``(instance, run_id)``, as used by the
+queries of ``common.reuse`` and ``common.history``. A module table with
+the ``data_id`` column of ``common.reuse`` also gets a partial index on it.
+
+The indexes are created by the migration command, which is run from the
+HappyFace directory after installing or updating modules::
+
+    python -m common.indexes [--dry-run]
+
+The framework creates the tables of a module when they do not exist, but
+leaves existing tables alone. So the command first brings the tables of all
+modules up to date with their declarations: missing tables are created,
+missing columns are added (e.g. those of ``common.reuse.reuse_columns``),
+and text columns which are now declared as integers are converted, values
+which are no integers, like the text 'NULL' of older versions, become
+NULL. On SQLite the column types stay as they are, only the values are
+converted. Other differences of the column types are reported and not
+changed.
+
+Then it creates the missing indexes of all modules and of every other
+``mod_`` and ``sub_`` table in the database. An index is missing if no
+index with the same columns exists, whatever its name. Running it again
+changes nothing.
+"""
+
+import hashlib
+import sys
+
+from sqlalchemy import Index
+from sqlalchemy.sql import text
+from sqlalchemy.types import Integer, NullType, String
+
+# identifiers longer than this are shortened, PostgreSQL allows 63 characters
+MAX_NAME_LENGTH = 60
+
+
+class IndexSpec(object):
+    """ Index on *columns*, optionally restricted to the rows matching *where* """
+
+    def __init__(self, *columns, **options):
+        if not columns:
+            raise ValueError('an index needs at least one column')
+        self.columns = tuple(columns)
+        self.where = options.pop('where', None)
+        self.unique = options.pop('unique', False)
+        if options:
+            raise TypeError('unknown options %s' % ', '.join(sorted(options)))
+
+    def name(self, table_name):
+        name = 'ix_%s_%s' % (table_name, '_'.join(self.columns))
+        if self.where is not None:
+            name += '_partial'
+        if len(name) > MAX_NAME_LENGTH:
+            digest = hashlib.sha1(name).hexdigest()[:8]
+            name = '%s_%s' % (name[:MAX_NAME_LENGTH - 9], digest)
+        return name
+
+    def index(self, table):
+        """ sqlalchemy Index of this spec on *table* """
+        options = {}
+        if self.where is not None:
+            options['postgresql_where'] = text(self.where)
+            options['sqlite_where'] = text(self.where)
+        return Index(self.name(table.name), *[table.c[column] for column in self.columns],
+                     unique=self.unique, **options)
+
+
+DEFAULT_TABLE_INDEXES = [IndexSpec('instance', 'id'), IndexSpec('instance', 'run_id')]
+DEFAULT_SUBTABLE_INDEXES = [IndexSpec('parent_id')]
+DATA_ID_INDEX = IndexSpec('data_id', where='data_id IS NOT NULL')
+
+
+def default_indexes(table):
+    """ index specs used for *table* if its module declares none """
+    if table.name.startswith('sub_'):
+        return list(DEFAULT_SUBTABLE_INDEXES)
+    specs = [spec for spec in DEFAULT_TABLE_INDEXES if all(column in table.c for column in spec.columns)]
+    if 'data_id' in table.c:
+        specs.append(DATA_ID_INDEX)
+    return specs
+
+
+def module_indexes(module_class):
+    """ (table, [IndexSpec]) pairs of the module table and the subtables of *module_class* """
+    pairs = []
+    module_table = getattr(module_class, 'module_table', None)
+    if module_table is not None:
+        specs = getattr(module_class, 'table_indexes', None)
+        pairs.append((module_table, default_indexes(module_table) if specs is None else specs))
+    declared = getattr(module_class, 'subtable_indexes', {})
+    for name, table in sorted(getattr(module_class, 'subtables', {}).iteritems()):
+        specs = declared.get(name)
+        pairs.append((table, default_indexes(table) if specs is None else specs))
+    return pairs
+
+
+def _existing_columns(connection, table_name):
+    from sqlalchemy import inspect
+    return set(tuple(index['column_names']) for index in inspect(connection).get_indexes(table_name))
+
+
+def migrate(engine, pairs, dry_run=False, out=sys.stdout):
+    """
+    Create the indexes of the (table, [IndexSpec]) *pairs* which do not
+    exist in the database of *engine*. Tables which do not exist yet are
+    skipped, they get their indexes the next time. Returns the names of the
+    created indexes.
+    """
+    from sqlalchemy import inspect
+    created = []
+    connection = engine.connect()
+    try:
+        tables = set(inspect(connection).get_table_names())
+        for table, specs in pairs:
+            if table.name not in tables:
+                continue
+            existing = _existing_columns(connection, table.name)
+            for spec in specs:
+                if spec.columns in existing:
+                    continue
+                index = spec.index(table)
+                out.write('%s %s on %s (%s)\n' % ('would create' if dry_run else 'creating',
+                          index.name, table.name, ', '.join(spec.columns)))
+                if not dry_run:
+                    index.create(connection)
+                existing.add(spec.columns)
+                created.append(index.name)
+    finally:
+        connection.close()
+    return created
+
+
+def _to_integer(connection, table, column, dry_run, out):
+    """ convert the text column *column* of *table* to an integer column """
+    dialect = connection.dialect
+    quote = dialect.identifier_preparer.quote
+    table_name, name = quote(table.name), quote(column.name)
+    column_type = column.type.compile(dialect=dialect)
+    if dialect.name == 'postgresql':
+        statements = ["ALTER TABLE %s ALTER COLUMN %s TYPE %s USING CASE WHEN %s ~ '^ *-?[0-9]+ *$' THEN trim(%s)::%s END" %
+                      (table_name, name, column_type, name, name, column_type)]
+    elif dialect.name == 'mysql':
+        statements = ["UPDATE %s SET %s = NULL WHERE %s NOT REGEXP '^ *-?[0-9]+ *$'" % (table_name, name, name),
+                      "ALTER TABLE %s MODIFY %s %s" % (table_name, name, column_type)]
+    elif dialect.name == 'sqlite':
+        # SQLite cannot change the type of a column, but compares the numbers stored in it like integers
+        invalid = "%s IS NOT NULL AND (trim(%s) = '' OR trim(%s) GLOB '*[^0-9-]*')" % (name, name, name)
+        if not connection.execute(text('SELECT count(*) FROM %s WHERE %s' % (table_name, invalid))).scalar():
+            return False
+        statements = ["UPDATE %s SET %s = NULL WHERE %s" % (table_name, name, invalid)]
+    else:
+        out.write('cannot convert %s.%s to %s on %s, please convert it by hand\n' %
+                  (table.name, column.name, column_type, dialect.name))
+        return False
+    out.write('%s %s.%s to %s\n' % ('would convert' if dry_run else 'converting', table.name, column.name, column_type))
+    if not dry_run:
+        for statement in statements:
+            connection.execute(text(statement))
+    return True
+
+
+def migrate_columns(engine, tables, dry_run=False, out=sys.stdout):
+    """
+    Create the *tables* which do not exist in the database of *engine* and
+    add their missing columns. Text columns declared as integers are
+    converted. Returns the names of the changed tables.
+    """
+    from sqlalchemy import inspect
+    changed = []
+    connection = engine.connect()
+    try:
+        existing_tables = set(inspect(connection).get_table_names())
+        for table in tables:
+            if table.name not in existing_tables:
+                out.write('%s table %s\n' % ('would create' if dry_run else 'creating', table.name))
+                if not dry_run:
+                    table.create(connection)
+                changed.append(table.name)
+                continue
+            columns = dict((column['name'], column['type']) for column in inspect(connection).get_columns(table.name))
+            table_changed = False
+            for column in table.columns:
+                if column.name not in columns:
+                    column_type = column.type.compile(dialect=connection.dialect)
+                    out.write('%s column %s.%s %s\n' % ('would add' if dry_run else 'adding',
+                              table.name, column.name, column_type))
+                    if not dry_run:
+                        preparer = connection.dialect.identifier_preparer
+                        connection.execute(text('ALTER TABLE %s ADD COLUMN %s %s' %
+                            (preparer.quote(table.name), preparer.quote(column.name), column_type)))
+                    table_changed = True
+                    continue
+                existing = columns[column.name]
+                if isinstance(column.type, Integer) and isinstance(existing, String):
+                    table_changed = _to_integer(connection, table, column, dry_run, out) or table_changed
+                elif not isinstance(existing, NullType) and column.type._type_affinity is not existing._type_affinity:
+                    out.write('column %s.%s is %s in the database but declared as %s, not changed\n' %
+                              (table.name, column.name, existing, column.type))
+            if table_changed:
+                changed.append(table.name)
+    finally:
+        connection.close()
+    return changed
+
+
+def _module_classes():
+    import hf
+    classes = []
+    pending = list(hf.module.ModuleBase.__subclasses__())
+    while pending:
+        module_class = pending.pop()
+        classes.append(module_class)
+        pending.extend(module_class.__subclasses__())
+    return classes
+
+
+def main(argv=None):
+    """ The migration command, see the module documentation """
+    import hf
+    argv = sys.argv[1:] if argv is None else argv
+    dry_run = '--dry-run' in argv
+    hf.configtools.readConfigurationAndEnv()
+    hf.module.importModuleClasses()
+    hf.database.connect(implicit_execution=True)
+
+    pairs = []
+    covered = set()
+    for module_class in _module_classes():
+        for table, specs in module_indexes(module_class):
+            if table.name not in covered:
+                covered.add(table.name)
+                pairs.append((table, specs))
+    changed = migrate_columns(hf.database.engine, [table for table, specs in pairs], dry_run)
+    print '%i tables %s' % (len(changed), 'to be changed' if dry_run else 'changed')
+
+    # tables in the database without a module class, e.g. of removed modules
+    from sqlalchemy import MetaData
+    database = MetaData()
+    database.reflect(bind=hf.database.engine)
+    for table in database.sorted_tables:
+        if table.name not in covered and table.name.startswith(('mod_', 'sub_')):
+            pairs.append((table, default_indexes(table)))
+
+    created = migrate(hf.database.engine, pairs, dry_run)
+    print '%i indexes %s' % (len(created), 'missing' if dry_run else 'created')
+
+
+if __name__ == '__main__':
+    main()
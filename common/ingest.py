@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Iterative parsing of downloaded JSON and XML files.
+
+Instead of reading a whole download into a string and building the complete
+document tree, modules iterate over the records they are interested in,
+e.g. ``iter_json_items(path, 'phedex.link')`` or
+``iter_xml_elements(path, 'block')``. Only one record is held in memory at a
+time, so memory usage no longer grows with the size of the download.
+"""
+
+import json
+from decimal import Decimal
+
+
+def iter_json_items(path, prefix):
+    """
+    Yield the elements of the JSON array found at *prefix* in the file at *path*.
+
+    *prefix* is a dot separated list of object keys, 'item' stands for the
+    elements of an enclosing array (the notation used by ijson). If ijson is
+    not installed, the whole file is parsed with the json module instead.
+    """
+    try:
+        import ijson
+    except ImportError:
+        with open(path, 'r') as f:
+            obj = json.load(f)
+        for item in _walk_json(obj, prefix.split('.') if prefix else []):
+            yield item
+        return
+
+    with open(path, 'rb') as f:
+        for item in _ijson_items(ijson, f, prefix + '.item' if prefix else 'item'):
+            yield item
+
+
+def load_json_object(path, prefix):
+    """
+    Return the single JSON value at *prefix*, e.g. a small header object
+    next to a large array, without building the rest of the document.
+    """
+    try:
+        import ijson
+    except ImportError:
+        with open(path, 'r') as f:
+            obj = json.load(f)
+        for key in prefix.split('.'):
+            obj = obj[key]
+        return obj
+
+    with open(path, 'rb') as f:
+        for item in _ijson_items(ijson, f, prefix):
+            return item
+    raise KeyError(prefix)
+
+
+def iter_xml_elements(path, tag=None, depth=None, **parser_options):
+    """
+    Yield the elements of the XML file at *path* once they are completely parsed.
+
+    Either select elements by *tag*, by *depth* (1 are the children of the
+    root element) or by both. A yielded element is cleared and removed from
+    its parent as soon as the caller asks for the next one, so callers must
+    copy whatever they need before. The root element itself stays alive and
+    keeps its attributes, use ``element.getparent()`` to reach it.
+    """
+    from lxml import etree
+    if depth is None:
+        context = etree.iterparse(path, events=('end',), tag=tag, **parser_options)
+        for event, element in context:
+            yield element
+            release_element(element)
+        del context
+        return
+
+    level = -1
+    context = etree.iterparse(path, events=('start', 'end'), **parser_options)
+    for event, element in context:
+        if event == 'start':
+            level += 1
+            continue
+        if level == depth:
+            if tag is None or element.tag == tag:
+                yield element
+            release_element(element)
+        level -= 1
+    del context
+
+
+def xml_root_attributes(path, **parser_options):
+    """
+    Return the attributes of the root element of the XML file at *path*,
+    only the start of the file is read.
+    """
+    from lxml import etree
+    for event, element in etree.iterparse(path, events=('start',), **parser_options):
+        return dict(element.attrib)
+    return {}
+
+
+def release_element(element):
+    """
+    Free an element handled during ``iterparse`` together with its
+    preceding siblings, so the parsed tree does not grow with the file
+    """
+    element.clear()
+    while element.getprevious() is not None:
+        del element.getparent()[0]
+
+
+def _ijson_items(ijson, f, prefix):
+    # ijson returns non-integer numbers as decimals, the json module as floats
+    return (_undecimal(item) for item in ijson.items(f, prefix))
+
+
+def _walk_json(obj, keys):
+    if not keys:
+        for item in obj:
+            yield item
+        return
+    if keys[0] == 'item':
+        for element in obj:
+            for item in _walk_json(element, keys[1:]):
+                yield item
+    else:
+        for item in _walk_json(obj[keys[0]], keys[1:]):
+            yield item
+
+
+def _undecimal(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, dict):
+        return dict((key, _undecimal(value)) for key, value in obj.iteritems())
+    if isinstance(obj, list):
+        return [_undecimal(value) for value in obj]
+    return obj
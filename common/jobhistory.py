@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Local rolling copy of the job history of HTCondor schedds, kept in an SQLite file.
+
+For every schedd the store remembers a cursor, the latest EnteredCurrentStatus
+of a completely received history. A run only asks the schedds for jobs which
+entered their final state after the cursor, adds them to the store and
+expires the jobs which dropped out of the time window. The statistics are then
+computed from the store, so the transfer from the schedds depends on the
+interval between two runs instead of the length of the window.
+"""
+
+import os
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursors (
+    schedd TEXT PRIMARY KEY,
+    entered REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    schedd TEXT NOT NULL,
+    entered REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_entered ON jobs (entered);
+"""
+
+
+def _plain(value):
+    # the history of a schedd may contain expressions instead of values
+    if hasattr(value, 'eval'):
+        value = value.eval()
+    if isinstance(value, (basestring, bool, int, long, float)):
+        return value
+    return None
+
+
+class CondorHistoryStore(object):
+    """
+    Jobs of the history of several schedds keyed by their GlobalJobId. Only
+    the ClassAd *attributes* given to the constructor are stored, new ones
+    are added to an existing file automatically.
+    """
+
+    def __init__(self, path, attributes, timeout=60):
+        self.attributes = list(attributes)
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.executescript(_SCHEMA)
+        known = set(row[1] for row in self.connection.execute('PRAGMA table_info(jobs)'))
+        with self.connection:
+            for attribute in self.attributes:
+                if attribute not in known:
+                    self.connection.execute('ALTER TABLE jobs ADD COLUMN "%s"' % attribute)
+        self.pending_jobs = []
+        self.pending_cursors = {}
+
+    def cursor(self, schedd):
+        """ EnteredCurrentStatus up to which the history of *schedd* is complete, None if unknown """
+        row = self.connection.execute('SELECT entered FROM cursors WHERE schedd = ?', (schedd,)).fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, schedd, ad):
+        """
+        Queue a job ad of *schedd*, it is written by the next commit.
+        Returns the EnteredCurrentStatus of the job.
+        """
+        entered = _plain(ad.get('EnteredCurrentStatus')) or 0
+        self.pending_jobs.append([ad.get('GlobalJobId'), schedd, entered] +
+                                 [_plain(ad.get(attribute)) for attribute in self.attributes])
+        return entered
+
+    def advance(self, schedd, entered):
+        """ Move the cursor of *schedd* to *entered* with the next commit """
+        self.pending_cursors[schedd] = entered
+
+    def commit(self):
+        columns = ['job_id', 'schedd', 'entered'] + ['"%s"' % attribute for attribute in self.attributes]
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO jobs (%s) VALUES (%s)' %
+                (', '.join(columns), ', '.join('?' * len(columns))), self.pending_jobs)
+            self.connection.executemany('INSERT OR REPLACE INTO cursors (schedd, entered) VALUES (?, ?)',
+                self.pending_cursors.iteritems())
+        self.pending_jobs = []
+        self.pending_cursors = {}
+
+    def expire(self, since):
+        """ Forget all jobs which entered their current status before *since* """
+        with self.connection:
+            self.connection.execute('DELETE FROM jobs WHERE entered < ?', (since,))
+
+    def jobs(self):
+        """ Yield a dictionary of the stored attributes for every job """
+        query = 'SELECT %s FROM jobs' % ', '.join('"%s"' % attribute for attribute in self.attributes)
+        for row in self.connection.execute(query):
+            yield dict(zip(self.attributes, row))
+
+    def close(self):
+        self.connection.close()
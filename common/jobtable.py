@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Columnar tables of HTCondor ClassAds.
+
+The ads returned by a schedd or collector query are read once into one NumPy
+array per projected attribute. Numeric attributes become float arrays with
+NaN for undefined values, string attributes become integer category codes
+(-1 for undefined) plus a list of the distinct values. Statistics per user,
+site or node are then computed with array operations instead of nested
+dictionaries, e.g.::
+
+    jobs = JobTable.from_ads(ads, numeric=['JobStatus', 'RequestCpus'],
+                             categorical=['User'])
+    running = jobs['JobStatus'] == 2
+    cores_per_user = jobs.sum_by('User', jobs['RequestCpus'], running)
+"""
+
+import numpy as np
+
+
+def _evaluate(values):
+    # the history of a schedd may contain expressions instead of values
+    if any(hasattr(value_type, 'eval') for value_type in set(map(type, values))):
+        values = [value.eval() if hasattr(value, 'eval') else value for value in values]
+    return values
+
+
+def _numbers(values, converter):
+    if converter is not None:
+        values = [value if value is None else converter(value) for value in values]
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        pass
+    array = np.array(values, dtype=object)
+    array[np.equal(array, None)] = np.nan
+    try:
+        return array.astype(np.float64)
+    except (TypeError, ValueError):
+        return np.array([_number(value) for value in array], dtype=np.float64)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def _categories(values, converter):
+    raw_categories = sorted(set(values).difference([None]))
+    index = dict((value, code) for code, value in enumerate(raw_categories))
+    index[None] = -1
+    codes = np.fromiter(map(index.__getitem__, values), dtype=np.int32, count=len(values))
+    if converter is None:
+        return codes, raw_categories
+    # convert each distinct value once and merge the values which become equal
+    categories = []
+    merged = {}
+    mapping = np.empty(len(raw_categories) + 1, dtype=np.int32)
+    mapping[-1] = -1
+    for code, value in enumerate(raw_categories):
+        value = converter(value)
+        if value is None:
+            mapping[code] = -1
+            continue
+        if value not in merged:
+            merged[value] = len(categories)
+            categories.append(value)
+        mapping[code] = merged[value]
+    return mapping[codes], categories
+
+
+class JobTable(object):
+    """
+    Typed arrays of a set of ClassAds, see the module documentation.
+
+    ``table[name]`` returns the array of a numeric attribute or the code array
+    of a categorical one, ``table.categories[name]`` the values belonging to
+    the codes.
+    """
+
+    def __init__(self, columns, categories, length):
+        self.columns = columns
+        self.categories = categories
+        self.length = length
+
+    @classmethod
+    def from_ads(cls, ads, numeric=(), categorical=(), converters=None):
+        """
+        Read the attributes *numeric* and *categorical* of every ad in *ads*.
+
+        *ads* may be any iterable of mappings, it is consumed only once.
+        *converters* maps attribute names to functions which are applied to
+        defined values before they are stored, e.g. ``{'CloudSite': str.lower}``.
+        """
+        converters = converters or {}
+        numeric = list(numeric)
+        categorical = list(categorical)
+        ads = list(ads)
+        columns = dict((name, _evaluate([ad.get(name) for ad in ads]))
+                       for name in numeric + categorical)
+
+        categories = {}
+        for name in numeric:
+            columns[name] = _numbers(columns[name], converters.get(name))
+        for name in categorical:
+            columns[name], categories[name] = _categories(columns[name], converters.get(name))
+        return cls(columns, categories, len(ads))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return self.length
+
+    def code(self, name, value):
+        """ Category code of *value* in the column *name*, -1 if it does not occur """
+        try:
+            return self.categories[name].index(value)
+        except ValueError:
+            return -1
+
+    def isin(self, name, values):
+        """ Mask of the rows whose categorical attribute *name* is one of *values* """
+        codes = [self.code(name, value) for value in values]
+        return np.in1d(self.columns[name], [code for code in codes if code >= 0])
+
+    def _selection(self, mask, *arrays):
+        selected = np.ones(self.length, dtype=bool) if mask is None else np.array(mask, dtype=bool)
+        for array in arrays:
+            selected = selected & ~np.isnan(array)
+        return selected
+
+    def count_by(self, name, mask=None):
+        """ Dictionary category -> number of selected rows """
+        codes = self.columns[name][self._selection(mask)]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.categories[name]))
+        return dict((self.categories[name][code], int(count))
+                    for code, count in enumerate(counts) if count > 0)
+
+    def sum_by(self, name, values, mask=None):
+        """ Dictionary category -> sum of *values*, undefined values are skipped """
+        selected = self._selection(mask, values)
+        codes = self.columns[name][selected]
+        valid = codes >= 0
+        counts = np.bincount(codes[valid], minlength=len(self.categories[name]))
+        sums = np.bincount(codes[valid], weights=values[selected][valid], minlength=len(self.categories[name]))
+        return dict((self.categories[name][code], float(sums[code]))
+                    for code in np.flatnonzero(counts))
+
+    def mean_by(self, name, values, mask=None):
+        """ Dictionary category -> mean of *values*, undefined values are skipped """
+        selected = self._selection(mask, values)
+        codes = self.columns[name][selected]
+        valid = codes >= 0
+        counts = np.bincount(codes[valid], minlength=len(self.categories[name]))
+        sums = np.bincount(codes[valid], weights=values[selected][valid], minlength=len(self.categories[name]))
+        return dict((self.categories[name][code], float(sums[code] / counts[code]))
+                    for code in np.flatnonzero(counts))
+
+    def groups(self, names, mask=None):
+        """
+        Yield ``(key, rows)`` for every combination of values of the attributes
+        *names* which occurs in the selected rows. *key* is a tuple of the
+        values, *rows* the array of row indices. Undefined values form no group.
+        """
+        arrays = [self.columns[name] for name in names]
+        selected = self._selection(mask, *[array for name, array in zip(names, arrays)
+                                           if name not in self.categories])
+        for name, array in zip(names, arrays):
+            if name in self.categories:
+                selected &= array >= 0
+        rows = np.flatnonzero(selected)
+        if not len(rows):
+            return
+        keys = [array[rows] for array in arrays]
+        order = np.lexsort(keys[::-1])
+        rows = rows[order]
+        keys = [key[order] for key in keys]
+        change = np.zeros(len(rows) - 1, dtype=bool)
+        for key in keys:
+            change |= key[1:] != key[:-1]
+        bounds = np.concatenate(([0], np.flatnonzero(change) + 1, [len(rows)]))
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            key = tuple(self.categories[name][key[start]] if name in self.categories else key[start]
+                        for name, key in zip(names, keys))
+            yield key, rows[start:stop]
+
+    def percentiles_by(self, names, values, q, mask=None):
+        """ Dictionary group key (see groups) -> array of the percentiles *q* of *values* """
+        return dict((key, np.percentile(values[rows], q))
+                    for key, rows in self.groups(names, self._selection(mask, values)))
+
+    def histogram(self, values, bins=10, mask=None, range=None):
+        """ numpy.histogram of the defined selected *values* """
+        return np.histogram(values[self._selection(mask, values)], bins=bins, range=range)
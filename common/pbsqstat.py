@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Streaming reader for the full job listing of PBS/Torque, ``qstat -f``.
+
+The listing consists of one block per job, a ``Job Id:`` line followed by
+``name = value`` lines indented by four spaces. Long values are continued on
+lines starting with a tab::
+
+    Job Id: 4711.batch.example.org
+        Job_Owner = alice@ui.example.org
+        job_state = R
+        queue = long
+        Variable_List = PBS_O_HOME=/home/alice,PBS_O_LANG=C,
+    \tPBS_O_LOGNAME=alice
+
+``iter_qstat_jobs`` reads the file line by line and keeps only the projected
+attributes of the current job, everything else is skipped without being
+split or copied. ``count_qstat_jobs`` adds the jobs to counters right away,
+so no structure proportional to the number of jobs is built.
+"""
+
+
+def iter_qstat_jobs(lines, attributes):
+    """
+    Yield ``(job_id, values)`` for every job in *lines*, an iterable of the
+    lines of ``qstat -f``. *values* is a list with the value of each of
+    *attributes* in the same order, None for attributes the job lacks.
+    """
+    positions = dict((name, position) for position, name in enumerate(attributes))
+    size = len(positions)
+    job_id = None
+    values = None
+    # position of the value the next continuation line belongs to, None if it is not projected
+    position = None
+    parts = None
+    for line in lines:
+        if line[0] == '\t':
+            if position is not None:
+                if parts is None:
+                    parts = [values[position]]
+                parts.append(line.strip())
+            continue
+        if parts is not None:
+            values[position] = ''.join(parts)
+            parts = None
+        position = None
+
+        if line.startswith('    '):
+            if values is None:
+                continue
+            separator = line.find(' = ', 4)
+            if separator < 0:
+                continue
+            position = positions.get(line[4:separator])
+            if position is not None:
+                values[position] = line[separator + 3:].strip()
+        elif line.startswith('Job Id: '):
+            if values is not None:
+                yield job_id, values
+            job_id = line[8:].strip()
+            values = [None] * size
+
+    if parts is not None:
+        values[position] = ''.join(parts)
+    if values is not None:
+        yield job_id, values
+
+
+def count_qstat_jobs(lines, keys, state='job_state'):
+    """
+    Count the jobs in *lines* per value of each of *keys* and per *state*.
+
+    Returns ``(summary, total)``: *summary* maps every key to a dictionary
+    ``{name: {state: count}}``, *total* maps every state to the number of
+    jobs. The name is the value up to the first ``@``, so the host part of
+    ``Job_Owner`` is dropped. Jobs without a value for a key are only
+    counted in *total*.
+    """
+    keys = list(keys)
+    counts = [{} for key in keys]
+    total = {}
+    for job_id, values in iter_qstat_jobs(lines, [state] + keys):
+        job_state = values[0]
+        total[job_state] = total.get(job_state, 0) + 1
+        for index in xrange(len(keys)):
+            value = values[index + 1]
+            if value is not None:
+                counter = counts[index]
+                pair = (value, job_state)
+                counter[pair] = counter.get(pair, 0) + 1
+
+    # the names are derived once per distinct value instead of once per job
+    summary = {}
+    for key, counter in zip(keys, counts):
+        names = summary[key] = {}
+        for (value, job_state), count in counter.iteritems():
+            states = names.setdefault(value.split('@')[0], {})
+            states[job_state] = states.get(job_state, 0) + count
+    return summary, total
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Rendering of module plots in a pool of worker processes.
+
+Instead of drawing with pyplot inside ``extractData``, a module describes the
+figure with a ``FigureSpec``. The spec offers the familiar figure and axes
+methods, but only records the calls::
+
+    spec = FigureSpec(figsize=(8, 5))
+    axis = spec.add_subplot(111)
+    axis.bar(positions, heights, 0.5, color='orange')
+    axis.set_xlabel('Number of jobs')
+    submit(spec, hf.downloadService.getArchivePath(self.run, filename), dpi=60)
+
+``submit`` hands the spec to a process pool and returns at once, so the
+module finishes its acquisition while the figure is rasterised on another
+core. Every figure is closed right after it has been saved. Pending figures
+are completed before the interpreter exits. If no process pool can be
+started, figures are rendered in the calling process instead.
+
+matplotlib itself is only imported when a figure is rendered. Modules which
+still draw with pyplot directly get it from ``pyplot()``, which selects the
+headless Agg backend once per process.
+
+Calls are recorded in order and replayed on the real objects. Results of
+calls and items of them (e.g. the mappable returned by ``pcolor`` or ``bars[0]``
+of a bar container) can be passed to later calls such as ``spec.colorbar(mesh)``. Values which are read back from matplotlib
+in interactive code are covered by a few helpers, see ``AxesSpec``.
+"""
+
+import atexit
+import multiprocessing
+import sys
+import threading
+
+AXES_METHODS = frozenset([
+    'annotate', 'axhline', 'axvline', 'bar', 'barh', 'errorbar', 'fill_between',
+    'grid', 'hexbin', 'hist', 'legend', 'minorticks_off', 'pcolor', 'pie', 'plot',
+    'plot_date', 'scatter', 'set_axis_off', 'set_position', 'set_title',
+    'set_xlabel', 'set_xlim', 'set_xscale', 'set_xticklabels', 'set_xticks',
+    'set_ylabel', 'set_ylim', 'set_yscale', 'set_yticklabels', 'set_yticks',
+    'text', 'tick_params',
+])
+
+FIGURE_METHODS = frozenset([
+    'autofmt_xdate', 'colorbar', 'subplots_adjust', 'suptitle', 'text', 'tight_layout',
+])
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = []
+_backend_lock = threading.Lock()
+_backend_ready = False
+
+
+def pyplot():
+    """ matplotlib.pyplot with the Agg backend, which is selected on the first call """
+    global _backend_ready
+    with _backend_lock:
+        if not _backend_ready:
+            import matplotlib
+            if 'matplotlib.pyplot' not in sys.modules:
+                matplotlib.use('Agg')
+            _backend_ready = True
+        import matplotlib.pyplot
+    return matplotlib.pyplot
+
+
+class _Ref(object):
+    """ Placeholder for the result of a recorded call, or an item of it """
+
+    def __init__(self, key, path=()):
+        self.key = key
+        self.path = path
+
+    def __getitem__(self, index):
+        return _Ref(self.key, self.path + (index,))
+
+
+class _Handle(object):
+    """ Placeholder for a legend handle which is created by the renderer """
+
+    def __init__(self, kind, options):
+        self.kind = kind
+        self.options = options
+
+
+class FigureSpec(object):
+    """
+    Declarative description of a matplotlib figure. The keyword arguments are
+    passed to ``pyplot.figure``, the methods in FIGURE_METHODS are recorded.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+        self.calls = []
+
+    def record(self, target, method, args, kwargs):
+        ref = _Ref(len(self.calls) + 1)
+        self.calls.append((target.key if target is not None else 0, method, args, kwargs, ref.key))
+        return ref
+
+    def add_subplot(self, *args, **kwargs):
+        return AxesSpec(self, self.record(None, 'add_subplot', args, kwargs))
+
+    def __getattr__(self, name):
+        if name not in FIGURE_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.record(None, name, args, kwargs)
+
+    @staticmethod
+    def patch(**options):
+        """ matplotlib.patches.Patch for a legend """
+        return _Handle('patch', options)
+
+    @staticmethod
+    def line(**options):
+        """ matplotlib.lines.Line2D without data for a legend """
+        return _Handle('line', options)
+
+
+class AxesSpec(object):
+    """
+    Recorder for the calls on one axes object, the methods in AXES_METHODS are
+    available. Besides, ``scale_xlim``/``scale_ylim`` multiply the automatic
+    limits, ``format_ticklabels`` formats the automatic tick locations,
+    ``shift_position`` makes room below the axes, ``axes_text`` places text
+    relative to the axes and ``twinx`` returns the recorder of a twin axes.
+    """
+
+    def __init__(self, figure, ref):
+        self.figure = figure
+        self.ref = ref
+
+    def __getattr__(self, name):
+        if name not in AXES_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.figure.record(self.ref, name, args, kwargs)
+
+    def twinx(self):
+        return AxesSpec(self.figure, self.figure.record(self.ref, 'twinx', (), {}))
+
+    def axes_text(self, x, y, text, **kwargs):
+        """ text at the axes coordinates *x*, *y* instead of data coordinates """
+        return self.figure.record(self.ref, '_axes_text', (x, y, text), kwargs)
+
+    def format_ticklabels(self, which, fmt, **kwargs):
+        """ label the final ticks of the *which* ('x' or 'y') axis with ``fmt % location`` """
+        return self.figure.record(self.ref, '_format_ticklabels', (which, fmt), kwargs)
+
+    def shift_position(self, bottom):
+        """ move the lower edge of the axes up by *bottom* in figure coordinates, keeping the upper one """
+        return self.figure.record(self.ref, '_shift_position', (bottom,), {})
+
+    def scale_xlim(self, lower=None, upper=None):
+        """ set the x limits to the automatic ones times *lower* and *upper*, None keeps a limit """
+        return self.figure.record(self.ref, '_scale_lim', ('x', lower, upper), {})
+
+    def scale_ylim(self, lower=None, upper=None):
+        """ set the y limits to the automatic ones times *lower* and *upper*, None keeps a limit """
+        return self.figure.record(self.ref, '_scale_lim', ('y', lower, upper), {})
+
+
+def _scale_lim(axis, which, lower, upper):
+    low, high = axis.get_xlim() if which == 'x' else axis.get_ylim()
+    limits = (low if lower is None else low * lower, high if upper is None else high * upper)
+    if which == 'x':
+        axis.set_xlim(limits)
+    else:
+        axis.set_ylim(limits)
+
+
+def _axes_text(axis, x, y, text, **kwargs):
+    return axis.text(x, y, text, transform=axis.transAxes, **kwargs)
+
+
+def _format_ticklabels(axis, which, fmt, **kwargs):
+    if which == 'x':
+        axis.set_xticklabels([fmt % location for location in axis.xaxis.get_ticklocs()], **kwargs)
+    else:
+        axis.set_yticklabels([fmt % location for location in axis.yaxis.get_ticklocs()], **kwargs)
+
+
+def _shift_position(axis, bottom):
+    position = axis.get_position()
+    axis.set_position([position.x0, position.y0 + bottom, position.width, position.height - bottom])
+
+_HELPERS = {
+    '_axes_text': _axes_text,
+    '_format_ticklabels': _format_ticklabels,
+    '_scale_lim': _scale_lim,
+    '_shift_position': _shift_position,
+}
+
+
+def render(spec, path, **savefig_options):
+    """ Draw *spec* and save it to *path* in the calling process """
+    plt = pyplot()
+    fig = plt.figure(**spec.options)
+    try:
+        objects = {0: fig}
+
+        def resolve(value):
+            if isinstance(value, AxesSpec):
+                value = value.ref
+            if isinstance(value, _Ref):
+                value, path = objects[value.key], value.path
+                for index in path:
+                    value = value[index]
+                return value
+            if isinstance(value, _Handle):
+                if value.kind == 'patch':
+                    import matplotlib.patches
+                    return matplotlib.patches.Patch(**value.options)
+                import matplotlib.lines
+                return matplotlib.lines.Line2D([], [], **value.options)
+            if isinstance(value, (list, tuple)):
+                return type(value)(resolve(item) for item in value)
+            if isinstance(value, dict):
+                return dict((key, resolve(item)) for key, item in value.iteritems())
+            return value
+
+        for target, method, args, kwargs, key in spec.calls:
+            args, kwargs = resolve(args), resolve(kwargs)
+            if method in _HELPERS:
+                objects[key] = _HELPERS[method](objects[target], *args, **kwargs)
+            else:
+                objects[key] = getattr(objects[target], method)(*args, **kwargs)
+        fig.savefig(path, **savefig_options)
+    finally:
+        plt.close(fig)
+    return path
+
+
+def _render_job(spec, path, savefig_options):
+    # exceptions are returned instead of raised, the pool of python 2 has no error callback
+    try:
+        render(spec, path, **savefig_options)
+        return path, None
+    except Exception, e:
+        return path, '%s: %s' % (type(e).__name__, e)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                # the workers load matplotlib before the first figure arrives
+                _pool = multiprocessing.Pool(initializer=pyplot, maxtasksperchild=50)
+            except (OSError, ImportError):
+                _pool = False
+        return _pool
+
+
+def submit(spec, path, logger=None, **savefig_options):
+    """
+    Render *spec* to *path* in the background and return *path* at once.
+    Failures are reported to *logger*, a missing file is the only visible
+    effect on the web page.
+    """
+    pool = _get_pool()
+    if not pool:
+        path, error = _render_job(spec, path, savefig_options)
+        if error is not None and logger is not None:
+            logger.error('Rendering %s failed: %s' % (path, error))
+        return path
+
+    def done(result):
+        if result[1] is not None and logger is not None:
+            logger.error('Rendering %s failed: %s' % result)
+
+    with _pool_lock:
+        _pending[:] = [job for job in _pending if not job.ready()]
+        _pending.append(pool.apply_async(_render_job, (spec, path, savefig_options), callback=done))
+    return path
+
+
+def wait(timeout=None):
+    """ Block until all submitted figures are saved """
+    with _pool_lock:
+        jobs = list(_pending)
+    for job in jobs:
+        job.wait(timeout)
+
+
+@atexit.register
+def _shutdown():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, False
+    if pool:
+        pool.close()
+        pool.join()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Shared reading of the qstat XML file used by the batch system modules.
+
+The file consists of a header with the date of the report, a summary for
+every user group and the list of jobs. ``load_qstat_report(download)``
+parses it in a single pass and keeps the result in memory, keyed by the
+source URL and checked against a hash of the file content. When
+JobsStatistics, JobsDist and JobsEfficiencyPlot read the same download
+within a run, the file is parsed once and the other modules reuse the
+result.
+"""
+
+import hashlib
+import threading
+
+from common.ingest import iter_xml_elements
+
+# job properties converted to numbers, all others are kept as stripped text
+JOB_NUMBERS = {
+    'cpueff': float,
+    'cputime': float,
+    'walltime': float,
+    'ncpus': int,
+}
+
+SUMMARY_COUNTERS = ('jobs', 'ncpus', 'running', 'pending', 'waiting', 'ratio10')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class QstatReport(object):
+    """
+    Content of a qstat XML file.
+
+    ``date`` is the time stamp of the header, ``summaries`` a list of
+    dictionaries with the keys group, parent and SUMMARY_COUNTERS,
+    ``jobs_group`` the group attribute of the first jobs element and ``jobs``
+    a list of dictionaries, one per job of that element, mapping the tags of
+    the job properties to their values. Reports are shared between modules
+    and must not be modified.
+    """
+
+    def __init__(self):
+        self.date = 0
+        self.summaries = []
+        self.hierarchy = {}
+        self.jobs_group = ''
+        self.jobs = []
+
+    def in_groups(self, group, groups):
+        """ True if *group* is one of *groups* or a subgroup of one, or if *groups* is empty """
+        if len(groups) == 0:
+            return True
+        for parent in groups:
+            group_chk = group
+            try:
+                while group_chk != parent:
+                    if self.hierarchy[group_chk] is None:
+                        break
+                    group_chk = self.hierarchy[group_chk]
+                else:
+                    return True
+            except KeyError:
+                pass
+        return False
+
+
+def _number(convert, text):
+    try:
+        return convert(text)
+    except ValueError:
+        try:
+            return convert(float(text))
+        except ValueError:
+            return None
+
+
+def parse_qstat_xml(path):
+    """ Read the qstat XML file at *path* in a single pass and return a QstatReport """
+    report = QstatReport()
+    jobs_section = None
+    for element in iter_xml_elements(path, depth=2):
+        section = element.getparent()
+        if section.tag == 'header':
+            if element.tag == 'date' and element.text is not None:
+                report.date = int(float(element.text.strip()))
+
+        elif section.tag == 'summaries' and element.tag == 'summary':
+            summary = {
+                'group': element.get('group', 'all'),
+                'parent': element.get('parent', ''),
+            }
+            for counter in SUMMARY_COUNTERS:
+                summary[counter] = 0
+            for child in element:
+                if child.tag in SUMMARY_COUNTERS and child.text is not None:
+                    try:
+                        summary[child.tag] = int(child.text.strip())
+                    except ValueError:
+                        pass
+            report.summaries.append(summary)
+            report.hierarchy[summary['group']] = summary['parent'] or None
+
+        elif section.tag == 'jobs' and element.tag == 'job':
+            # There should only be one jobs entry
+            if jobs_section is None:
+                jobs_section = section
+                report.jobs_group = section.get('group', '')
+            elif section is not jobs_section:
+                continue
+            job = {}
+            for child in element:
+                if child.text is None:
+                    continue
+                text = child.text.strip()
+                job[child.tag] = _number(JOB_NUMBERS[child.tag], text) if child.tag in JOB_NUMBERS else text
+            report.jobs.append(job)
+    return report
+
+
+def load_qstat_report(download):
+    """
+    Return the QstatReport of a finished hf.downloadService download. The
+    report is shared with every other module reading the same URL as long as
+    the content of the file does not change.
+    """
+    path = download.getTmpPath()
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    digest = digest.hexdigest()
+
+    url = download.getSourceUrl()
+    with _cache_lock:
+        entry = _cache.get(url)
+        if entry is None or entry[0] != digest:
+            # only the latest content of every URL is kept
+            entry = _cache[url] = (digest, threading.Lock(), [])
+    digest, lock, parsed = entry
+    # modules acquiring the same file concurrently wait for the first one
+    with lock:
+        if not parsed:
+            parsed.append(parse_qstat_xml(path))
+    return parsed[0]
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Reuse of the previous dataset of a module whose sources or subtable rows did
+not change.
+
+Many sources change much less often than the modules run. Such a module adds
+``reuse_columns()`` to its table columns and starts ``extractData`` with::
+
+    fingerprint = source_fingerprint(self, self.source)
+    data = reuse_previous(self, fingerprint)
+    if data is not None:
+        return data
+    data = {'source_hash': fingerprint, ...}
+
+If the latest dataset of the module instance was extracted from the same
+content, its values are returned without parsing anything.
+
+``fillSubtables`` hands the rows of all subtables to ``store_subtables``::
+
+    store_subtables(self, parent_id, {'details': self.details_db_value_list})
+
+Nothing is written for a reused dataset, and if the rows equal those of the
+previous dataset only a reference is stored instead of a copy. Either way the
+new dataset refers to the dataset which owns the rows with ``data_id``.
+``getTemplateData`` gets the rows with ``subtable_rows(self, name)``, or
+selects those of ``subtable_parent_id(self.dataset)`` itself.
+
+The fingerprint covers the downloaded files and the module configuration,
+changed thresholds are applied at once. Values which depend on the current
+time have to be recomputed by the module or passed as *extra* to the
+fingerprint. The rows of the owning dataset are shared with all datasets
+referring to it, they are gone for all of them once it is deleted.
+
+Existing module tables do not get the new columns by themselves. After
+updating, run ``python -m common.indexes`` once, see there.
+"""
+
+import hashlib
+
+from sqlalchemy import Column, INT, TEXT
+from sqlalchemy.sql import and_
+
+from common.bulkinsert import bulk_insert
+
+CHUNK_SIZE = 1 << 20
+
+
+def reuse_columns():
+    """ Columns needed in the module table, a new list for every module """
+    return [Column('source_hash', TEXT), Column('rows_hash', TEXT), Column('data_id', INT)]
+
+
+def source_fingerprint(module, *downloads, **extra):
+    """
+    Hash of the content of the finished *downloads*, the configuration of
+    *module* and the *extra* values.
+    """
+    digest = hashlib.sha1()
+    digest.update(repr(sorted(module.config.items())))
+    digest.update(repr(sorted(extra.items())))
+    for download in downloads:
+        digest.update('\0')
+        with open(download.getTmpPath(), 'rb') as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), ''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def previous_dataset(module):
+    """ The latest dataset of the module instance, None if there is none """
+    table = module.module_table
+    return table.select().where(table.c.instance == module.instance_name).\
+        order_by(table.c.id.desc()).execute().fetchone()
+
+
+def reuse_previous(module, fingerprint):
+    """
+    If the latest dataset of *module* has *fingerprint*, return its values
+    as the result of ``extractData``, otherwise None. Only the columns of
+    the module and the status are taken over.
+    """
+    previous = previous_dataset(module)
+    if previous is None or previous['source_hash'] != fingerprint:
+        return None
+    data = dict((column.name, previous[column.name]) for column in module.table_columns[0])
+    data['status'] = previous['status']
+    data['data_id'] = subtable_parent_id(previous)
+    return data
+
+
+def subtable_parent_id(dataset):
+    """ id of the dataset owning the subtable rows of *dataset* """
+    return dataset['data_id'] if dataset['data_id'] is not None else dataset['id']
+
+
+def subtable_rows(module, name):
+    """ select statement for the rows of the subtable *name* of the current dataset """
+    table = module.subtables[name]
+    return table.select().where(table.c.parent_id == subtable_parent_id(module.dataset))
+
+
+def rows_fingerprint(subtables):
+    """ Hash of the rows in *subtables*, a dictionary of subtable names and lists of rows """
+    digest = hashlib.sha1()
+    for name in sorted(subtables):
+        digest.update('\0%s\0' % name)
+        for row in subtables[name]:
+            digest.update(repr(sorted(row.items())))
+            digest.update('\n')
+    return digest.hexdigest()
+
+
+def store_subtables(module, parent_id, subtables):
+    """
+    Store the rows in *subtables*, a dictionary of subtable names and lists
+    of rows, for the dataset *parent_id*. Nothing is written if the dataset
+    was reused or the rows equal those of the previous dataset of the module
+    instance, which are referred to instead. Returns True if rows were written.
+    """
+    table = module.module_table
+    dataset = table.select().where(table.c.id == parent_id).execute().fetchone()
+    if dataset['data_id'] is not None:
+        return False
+    values = {'rows_hash': rows_fingerprint(subtables)}
+    previous = table.select().where(and_(table.c.instance == module.instance_name, table.c.id < parent_id)).\
+        order_by(table.c.id.desc()).execute().fetchone()
+    if previous is not None and previous['rows_hash'] == values['rows_hash']:
+        values['data_id'] = subtable_parent_id(previous)
+    table.update().where(table.c.id == parent_id).execute(**values)
+    if 'data_id' in values:
+        return False
+    for name, rows in subtables.iteritems():
+        bulk_insert(module.subtables[name], rows, parent_id)
+    return True
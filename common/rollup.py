@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Hourly, daily and weekly rollups of numeric module values, and retention of
+the raw datasets.
+
+A module calls ``update_rollups`` in ``fillSubtables`` once its dataset is
+written::
+
+    update_rollups(self, parent_id, ['total', 'free', 'status'], retention=self.retention)
+
+The named columns of the new dataset, plus any *values* computed by the
+module, are added to the three rollup periods that contain the time of the
+run. Each period keeps the count, minimum, maximum, sum and last value. A
+run only updates a few rows of the shared ``module_rollups`` table, so the
+cost does not grow with the history. With a *retention* in days, the
+datasets of the instance older than that are deleted together with their
+subtable rows. Datasets whose subtable rows are still referenced by a newer
+dataset (see ``common.reuse``) are kept until the reference is gone. Hourly
+and daily rollups expire after ROLLUP_RETENTION, weekly ones are kept.
+
+``rollup_history`` reads the rollups back, e.g. for long-range plots.
+"""
+
+import datetime
+import threading
+
+from sqlalchemy import Table, Column, Index, INT, TEXT, FLOAT, DateTime
+from sqlalchemy.sql import select, and_
+
+RESOLUTIONS = ('hour', 'day', 'week')
+
+# rollups of a resolution older than this are deleted, None keeps them
+ROLLUP_RETENTION = {
+    'hour': datetime.timedelta(days=31),
+    'day': datetime.timedelta(days=732),
+    'week': None,
+}
+
+# ids per delete statement
+DELETE_CHUNK_SIZE = 500
+
+_table_lock = threading.Lock()
+
+
+def rollup_table(metadata):
+    """ The ``module_rollups`` table in *metadata*, created if needed """
+    with _table_lock:
+        table = metadata.tables.get('module_rollups')
+        if table is None:
+            table = Table('module_rollups', metadata,
+                Column('id', INT, primary_key=True),
+                Column('table_name', TEXT),
+                Column('instance', TEXT),
+                Column('resolution', TEXT),
+                Column('period_start', DateTime),
+                Column('name', TEXT),
+                Column('count', INT),
+                Column('minimum', FLOAT),
+                Column('maximum', FLOAT),
+                Column('total', FLOAT),
+                Column('last', FLOAT),
+                Column('last_time', DateTime),
+                Index('module_rollups_period', 'table_name', 'instance', 'resolution', 'period_start'))
+            table.create(checkfirst=True)
+        return table
+
+
+def period_start(time, resolution):
+    """ Start of the hour, day or week (beginning on Monday) containing *time* """
+    if resolution == 'hour':
+        return time.replace(minute=0, second=0, microsecond=0)
+    day = time.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return day
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _runs_table():
+    import hf
+    return hf.module.database.hf_runs
+
+
+def update_rollups(module, parent_id, names, values=None, retention=0):
+    """
+    Add the columns *names* of the dataset *parent_id* and the *values*
+    (a dictionary of names and numbers) to the rollups of the instance.
+    Missing values are skipped. With a *retention* (days) older datasets
+    are deleted afterwards.
+    """
+    table = module.module_table
+    runs = _runs_table()
+    dataset = select([runs.c.time] + [table.c[name] for name in names]).\
+        where(and_(table.c.id == parent_id, table.c.run_id == runs.c.id)).execute().fetchone()
+    if dataset is None:
+        return
+    time = dataset['time']
+    values = dict(values or {})
+    for name in names:
+        values[name] = dataset[name]
+    values = dict((name, float(value)) for name, value in values.iteritems() if value is not None)
+
+    rollups = rollup_table(table.metadata)
+    connection = table.bind.connect()
+    transaction = connection.begin()
+    try:
+        for resolution in RESOLUTIONS:
+            start = period_start(time, resolution)
+            key = and_(rollups.c.table_name == table.name, rollups.c.instance == module.instance_name,
+                rollups.c.resolution == resolution, rollups.c.period_start == start)
+            existing = dict((row['name'], row) for row in connection.execute(rollups.select().where(key)))
+            for name, value in values.iteritems():
+                row = existing.get(name)
+                if row is None:
+                    connection.execute(rollups.insert(), table_name=table.name, instance=module.instance_name,
+                        resolution=resolution, period_start=start, name=name, count=1, minimum=value,
+                        maximum=value, total=value, last=value, last_time=time)
+                    continue
+                update = {'count': row['count'] + 1, 'minimum': min(row['minimum'], value),
+                          'maximum': max(row['maximum'], value), 'total': row['total'] + value}
+                if row['last_time'] is None or time >= row['last_time']:
+                    update['last'] = value
+                    update['last_time'] = time
+                connection.execute(rollups.update().where(rollups.c.id == row['id']), **update)
+        for resolution, age in ROLLUP_RETENTION.iteritems():
+            if age is not None:
+                connection.execute(rollups.delete().where(and_(rollups.c.table_name == table.name,
+                    rollups.c.instance == module.instance_name, rollups.c.resolution == resolution,
+                    rollups.c.period_start < period_start(time - age, resolution))))
+        transaction.commit()
+    except:
+        transaction.rollback()
+        raise
+    finally:
+        connection.close()
+
+    if retention:
+        prune_datasets(module, time - datetime.timedelta(days=float(retention)))
+
+
+def prune_datasets(module, before):
+    """
+    Delete the datasets of the instance whose run started before *before*,
+    together with their subtable rows. Returns the number of deleted datasets.
+    """
+    table = module.module_table
+    runs = _runs_table()
+    query = select([table.c.id]).where(and_(table.c.instance == module.instance_name,
+        table.c.run_id == runs.c.id, runs.c.time < before))
+    if 'data_id' in table.c:
+        # rows shared with newer datasets are kept until these are deleted as well
+        newer = table.alias()
+        query = query.where(~table.c.id.in_(select([newer.c.data_id]).where(newer.c.data_id != None)))
+    ids = [row[0] for row in query.execute()]
+    for offset in xrange(0, len(ids), DELETE_CHUNK_SIZE):
+        chunk = ids[offset:offset + DELETE_CHUNK_SIZE]
+        connection = table.bind.connect()
+        transaction = connection.begin()
+        try:
+            for subtable in module.subtables.itervalues():
+                connection.execute(subtable.delete().where(subtable.c.parent_id.in_(chunk)))
+            connection.execute(table.delete().where(table.c.id.in_(chunk)))
+            transaction.commit()
+        except:
+            transaction.rollback()
+            raise
+        finally:
+            connection.close()
+    return len(ids)
+
+
+def rollup_history(module, name, resolution, since=None):
+    """
+    List of (period_start, minimum, maximum, mean, last) tuples of the value
+    *name* of the instance at *resolution*, ordered by time.
+    """
+    table = module.module_table
+    rollups = rollup_table(table.metadata)
+    conditions = [rollups.c.table_name == table.name, rollups.c.instance == module.instance_name,
+                  rollups.c.resolution == resolution, rollups.c.name == name]
+    if since is not None:
+        conditions.append(rollups.c.period_start >= since)
+    query = select([rollups.c.period_start, rollups.c.minimum, rollups.c.maximum, rollups.c.total,
+                    rollups.c.count, rollups.c.last]).where(and_(*conditions)).order_by(rollups.c.period_start)
+    return [(start, minimum, maximum, total / count, last)
+            for start, minimum, maximum, total, count, last in table.bind.execute(query)]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Configuration of a module instance compiled into a rule object.
+
+Modules with many thresholds parse them once per configuration instead of
+in every phase. A rule class takes the configuration in its constructor::
+
+    class SamRules(Rules):
+        def __init__(self, config):
+            self.min_jobs = int(config['min_jobs'])
+
+    rules = compiled_rules(self, SamRules)
+
+``compiled_rules`` builds the object on first use and returns the same
+object to ``prepareAcquisition``, ``extractData`` and ``getTemplateData``
+of the instance until the configuration changes. Rule objects are shared
+between threads, so their attributes cannot be set after construction.
+"""
+
+import hashlib
+import threading
+
+_compiled = {}
+_compiled_lock = threading.Lock()
+
+
+def config_hash(config):
+    """ Hash of the configuration of a module instance """
+    return hashlib.sha1(repr(sorted(config.items()))).hexdigest()
+
+
+class Rules(object):
+    """ Base class of rule objects, immutable once ``compiled_rules`` returned them """
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get('_frozen'):
+            raise AttributeError('compiled rules cannot be changed')
+        object.__setattr__(self, name, value)
+
+
+def compiled_rules(module, factory):
+    """
+    The object ``factory(module.config)`` of the instance, built again only
+    when the configuration changed.
+    """
+    key = (type(module).__name__, module.instance_name, factory)
+    digest = config_hash(module.config)
+    with _compiled_lock:
+        entry = _compiled.get(key)
+    if entry is not None and entry[0] == digest:
+        return entry[1]
+    rules = factory(module.config)
+    rules.__dict__['_frozen'] = True
+    with _compiled_lock:
+        _compiled[key] = (digest, rules)
+    return rules
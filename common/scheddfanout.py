@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""
+Concurrent queries against all schedds of a HTCondor pool.
+
+``ScheddQueries(schedds, requirements, projection)`` asks every schedd for
+its job ads with ``xquery`` and reads the answers with ``htcondor.poll`` in
+the calling thread, as HTCondorJobsPerUser does. The ads are yielded in the
+order in which they arrive, so the wall time is that of the slowest schedd
+instead of the sum over all schedds.
+
+``ScheddFanOut(schedds, request)`` calls ``request(schedd)`` for every schedd
+in a thread of its own, for requests without a non-blocking form like
+``lambda schedd: schedd.history(...)``. The bindings release the GIL during
+such a call but hold a lock of their own, so the calls still run one after
+another: three schedds taking 3s each needed 9s with the bindings of HTCondor
+8.8. The threads only let the consumer process the ads of one schedd while
+the next one is asked, and keep a failing schedd from affecting the others.
+
+A schedd which fails or exceeds *timeout* seconds is given up, the outcome
+of every schedd is kept in ``results``. A schedd given up by ScheddFanOut may
+still hold the lock of the bindings until its call returns.
+
+The schedds are passed as ``(name, schedd)`` pairs. The schedd object only
+needs to provide whatever is called on it, so tests can use a fake object
+instead of ``htcondor.Schedd``.
+"""
+
+import threading
+import time
+from Queue import Queue, Empty
+
+
+def locate_schedds(collector):
+    """ (name, htcondor.Schedd) pairs of all schedds known to *collector* """
+    import htcondor
+    return [(ad.get('Name'), htcondor.Schedd(ad)) for ad in collector.locateAll(htcondor.DaemonTypes.Schedd)]
+
+
+class ScheddResult(object):
+    def __init__(self, name):
+        self.name = name
+        self.ads = 0
+        self.error = None
+        self.elapsed = 0.0
+        self.complete = False
+
+    @property
+    def ok(self):
+        return self.complete and self.error is None
+
+
+class ScheddFanOut(object):
+    """
+    Iterable over the ads of all schedds, see the module documentation.
+
+    *timeout* is counted for every schedd from the start of the iteration,
+    ads are passed from the threads in batches of at most *batch_size*.
+    Failed schedds are reported to *logger* once the iteration is finished.
+    """
+
+    def __init__(self, schedds, request, timeout=None, logger=None, batch_size=100):
+        self.schedds = list(schedds)
+        self.request = request
+        self.timeout = timeout
+        self.logger = logger
+        self.batch_size = batch_size
+        self.results = [ScheddResult(name) for name, schedd in self.schedds]
+        self.queue = Queue()
+        self.abandoned = set()
+
+    def __iter__(self):
+        start = time.time()
+        for index, (name, schedd) in enumerate(self.schedds):
+            worker = threading.Thread(target=self._produce, args=(index, schedd))
+            worker.daemon = True
+            worker.start()
+
+        pending = set(range(len(self.schedds)))
+        try:
+            while pending:
+                wait = None
+                if self.timeout is not None:
+                    wait = max(0.0, start + self.timeout - time.time())
+                try:
+                    index, ads = self.queue.get(timeout=wait)
+                except Empty:
+                    for index in pending:
+                        self.results[index].error = 'timeout of %ss exceeded' % self.timeout
+                        self.results[index].elapsed = time.time() - start
+                    self.abandoned.update(pending)
+                    break
+                if index not in pending:
+                    continue
+                if ads is None:
+                    self.results[index].complete = True
+                    self.results[index].elapsed = time.time() - start
+                    pending.discard(index)
+                    continue
+                self.results[index].ads += len(ads)
+                for ad in ads:
+                    yield ad
+        finally:
+            # stop the remaining threads if the consumer stops early
+            self.abandoned.update(pending)
+            self._report()
+
+    def _produce(self, index, schedd):
+        batch = []
+        try:
+            for ad in self.request(schedd):
+                if index in self.abandoned:
+                    return
+                batch.append(ad)
+                if len(batch) >= self.batch_size:
+                    self.queue.put((index, batch))
+                    batch = []
+            self.queue.put((index, batch))
+        except Exception, e:
+            # ads received before the error are kept as partial result
+            self.queue.put((index, batch))
+            self.results[index].error = '%s: %s' % (type(e).__name__, e)
+        finally:
+            self.queue.put((index, None))
+
+    def _report(self):
+        if self.logger is None:
+            return
+        for result in self.results:
+            if not result.ok:
+                self.logger.warning('Schedd %s: %s after %.1fs, %i ads received' %
+                    (result.name, result.error or 'aborted', result.elapsed, result.ads))
+
+
+class ScheddQueries(ScheddFanOut):
+    """
+    Iterable over the job ads of all schedds matching *requirements*, with
+    the attributes in *projection* or all of them, see the module
+    documentation. *poll* multiplexes the queries, htcondor.poll by default.
+    """
+
+    def __init__(self, schedds, requirements, projection=(), timeout=None, logger=None, poll=None):
+        ScheddFanOut.__init__(self, schedds, None, timeout, logger)
+        self.requirements = requirements
+        self.projection = list(projection)
+        self.poll = poll
+
+    def __iter__(self):
+        poll = self.poll
+        if poll is None:
+            import htcondor
+            poll = htcondor.poll
+        start = time.time()
+        queries = []
+        for index, (name, schedd) in enumerate(self.schedds):
+            try:
+                queries.append(schedd.xquery(self.requirements, self.projection, name=str(index)))
+            except Exception, e:
+                self._fail(index, e, start)
+        pending = set(int(query.tag()) for query in queries)
+        try:
+            if queries:
+                arguments = []
+                if self.timeout is not None:
+                    # the time poll waits for any schedd to answer
+                    arguments.append(max(1, int(self.timeout * 1000)))
+                for query in poll(queries, *arguments):
+                    index = int(query.tag())
+                    if index in pending:
+                        try:
+                            ads = query.nextAdsNonBlocking()
+                        except Exception, e:
+                            self._fail(index, e, start)
+                            pending.discard(index)
+                            continue
+                        self.results[index].ads += len(ads)
+                        for ad in ads:
+                            yield ad
+                    if self.timeout is not None and time.time() > start + self.timeout:
+                        for index in pending:
+                            self.results[index].error = 'timeout of %ss exceeded' % self.timeout
+                            self.results[index].elapsed = time.time() - start
+                        pending.clear()
+                        break
+                for index in pending:
+                    self.results[index].complete = True
+                    self.results[index].elapsed = time.time() - start
+                pending.clear()
+        except Exception, e:
+            # the queries are multiplexed, an error of poll ends all of them
+            for index in pending:
+                self._fail(index, e, start)
+            pending.clear()
+        finally:
+            self._report()
+
+    def _fail(self, index, error, start):
+        self.results[index].error = '%s: %s' % (type(error).__name__, error)
+        self.results[index].elapsed = time.time() - start
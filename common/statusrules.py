@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Status of the extracted rows and of the whole module from declared rules.
+
+Instead of comparing every row with its thresholds in a Python loop, a module
+declares its rules in the configuration and evaluates them with NumPy over
+one array per column. A rule set is a list of ``status: condition`` lines,
+separated by newlines or semicolons::
+
+    pool_status_rules = critical: total < 1e-12
+                        critical: (free + removable) / total <= local_critical_ratio
+                        warning: (free + removable) / total <= local_warning_ratio
+    status_rules = critical: sum(free + removable) / sum(total) <= global_critical_ratio
+                   warning: critical > global_warning_poolcriticals
+
+The status is ``critical`` (0.0), ``warning`` (0.5) or a number between 0
+and 1. Conditions are Python expressions of numbers, column names, the
+arithmetic operators, comparisons, ``and``, ``or``, ``not`` and the
+functions in FUNCTIONS. Other names are taken from the numeric options of
+the configuration, so the thresholds remain options of their own. A column
+hides an option of the same name.
+
+Every row gets the lowest status of the row rules it matches, 1.0 if it
+matches none. The module rules see the columns as well, together with the
+number of ``rows`` and the number of ``critical``, ``warning`` and ``ok``
+rows, and yield the status of the module in the same way::
+
+    rules = status_rules(self, 'pool_status_rules', 'status_rules')
+    result = rules.evaluate({'total': totals, 'free': free, 'removable': removable})
+    result.rows, result.status, result.counts['critical']
+
+Rule sets are compiled once per configuration, see ``common.rules``.
+"""
+
+import ast
+import threading
+
+from common.rules import Rules, compiled_rules
+
+LEVELS = {
+    'critical': 0.0,
+    'warning': 0.5,
+    'ok': 1.0,
+}
+
+# the NumPy functions behind the names, looked up when the rules are compiled
+# so that importing this module does not load NumPy
+FUNCTIONS = {
+    'abs': 'abs',
+    'floor': 'floor',
+    'sum': 'sum',
+    'count': 'count_nonzero',
+    'any': 'any',
+    'all': 'all',
+    'mean': 'mean',
+    'min': 'min',
+    'max': 'max',
+}
+
+# reductions which are not defined for no values
+_EMPTY_NAN = set(['mean', 'min', 'max'])
+
+_BINARY = {
+    ast.Add: 'add',
+    ast.Sub: 'subtract',
+    ast.Mult: 'multiply',
+    ast.Div: 'true_divide',
+    ast.Mod: 'mod',
+    ast.Pow: 'power',
+}
+
+_COMPARE = {
+    ast.Lt: 'less',
+    ast.LtE: 'less_equal',
+    ast.Gt: 'greater',
+    ast.GtE: 'greater_equal',
+    ast.Eq: 'equal',
+    ast.NotEq: 'not_equal',
+}
+
+
+def _reduce(function):
+    import numpy as np
+
+    def reduce(values):
+        values = np.asarray(values)
+        if values.size == 0:
+            return np.nan
+        return function(values)
+    return reduce
+
+
+def _compile(node, constants, names):
+    """ Turn an expression node into a function of the dictionary of arrays """
+    import numpy as np
+
+    if isinstance(node, ast.Num):
+        value = node.n
+        return lambda context: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        if name in ('True', 'False'):
+            value = name == 'True'
+            return lambda context: value
+        if name in constants:
+            # a column or counter of the same name takes precedence over the option
+            value = constants[name]
+            return lambda context: context[name] if name in context else value
+        names.add(name)
+        return lambda context: context[name]
+
+    if isinstance(node, ast.BinOp) and type(node.op) in _BINARY:
+        function = getattr(np, _BINARY[type(node.op)])
+        left, right = _compile(node.left, constants, names), _compile(node.right, constants, names)
+        return lambda context: function(left(context), right(context))
+
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile(node.operand, constants, names)
+        if isinstance(node.op, ast.Not):
+            return lambda context: np.logical_not(operand(context))
+        if isinstance(node.op, ast.USub):
+            return lambda context: np.negative(operand(context))
+        if isinstance(node.op, ast.UAdd):
+            return operand
+
+    if isinstance(node, ast.BoolOp):
+        function = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        operands = [_compile(value, constants, names) for value in node.values]
+
+        def boolean(context):
+            result = operands[0](context)
+            for operand in operands[1:]:
+                result = function(result, operand(context))
+            return result
+        return boolean
+
+    if isinstance(node, ast.Compare) and all(type(op) in _COMPARE for op in node.ops):
+        operands = [_compile(value, constants, names) for value in [node.left] + node.comparators]
+        functions = [getattr(np, _COMPARE[type(op)]) for op in node.ops]
+
+        def compare(context):
+            left = operands[0](context)
+            result = True
+            for function, operand in zip(functions, operands[1:]):
+                right = operand(context)
+                result = np.logical_and(result, function(left, right))
+                left = right
+            return result
+        return compare
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS \
+            and len(node.args) == 1 and not node.keywords and node.starargs is None and node.kwargs is None:
+        function = getattr(np, FUNCTIONS[node.func.id])
+        if node.func.id in _EMPTY_NAN:
+            function = _reduce(function)
+        argument = _compile(node.args[0], constants, names)
+        return lambda context: function(argument(context))
+
+    raise ValueError('unsupported expression %r' % type(node).__name__)
+
+
+def _level(text):
+    text = text.strip()
+    if text in LEVELS:
+        return LEVELS[text]
+    try:
+        level = float(text)
+    except ValueError:
+        raise ValueError('unknown status %r' % text)
+    if not 0.0 <= level <= 1.0:
+        raise ValueError('status %r is not between 0 and 1' % text)
+    return level
+
+
+class Rule(object):
+    """ A condition and the status it assigns """
+
+    def __init__(self, level, condition, constants=None):
+        self.level = _level(level) if isinstance(level, basestring) else float(level)
+        self.condition = condition.strip()
+        self.names = set()
+        try:
+            tree = ast.parse(self.condition, mode='eval')
+        except SyntaxError, e:
+            raise ValueError('invalid condition %r: %s' % (self.condition, e))
+        self.evaluate = _compile(tree.body, constants or {}, self.names)
+
+    def __repr__(self):
+        return 'Rule(%r, %r)' % (self.level, self.condition)
+
+
+def parse_rules(text, constants=None):
+    """ Rules of a ``status: condition`` list, see the module documentation """
+    rules = []
+    for line in text.replace(';', '\n').splitlines():
+        if not line.strip():
+            continue
+        level, separator, condition = line.partition(':')
+        if not separator:
+            raise ValueError('rule %r has no status' % line.strip())
+        rules.append(Rule(level, condition, constants))
+    return rules
+
+
+class StatusResult(object):
+    """
+    Outcome of StatusRules.evaluate: ``rows`` holds the status of every row,
+    ``decided`` the index of the row rule which set it (-1 for rows matching
+    no rule), ``rule_counts`` the number of rows decided by each row rule,
+    ``counts`` the number of critical, warning and ok rows, ``status`` the
+    status of the module and ``module_rule`` the index of the module rule
+    which set it, or -1.
+    """
+
+    def __init__(self, rows, decided, rule_counts, counts, status, module_rule):
+        self.rows = rows
+        self.decided = decided
+        self.rule_counts = rule_counts
+        self.counts = counts
+        self.status = status
+        self.module_rule = module_rule
+
+
+class StatusRules(Rules):
+    """
+    Row rules and module rules, given as rule lists, ``status: condition``
+    text or lists of ``(status, condition)`` pairs. Names which are neither
+    columns nor counters are looked up in *constants*.
+    """
+
+    def __init__(self, rows=(), module=(), constants=None):
+        self.row_rules = self._rules(rows, constants)
+        self.module_rules = self._rules(module, constants)
+
+    @staticmethod
+    def _rules(rules, constants):
+        if isinstance(rules, basestring):
+            return parse_rules(rules, constants)
+        return [rule if isinstance(rule, Rule) else Rule(rule[0], rule[1], constants) for rule in rules]
+
+    @classmethod
+    def from_config(cls, config, rows_key=None, module_key=None):
+        """ Rules of the options *rows_key* and *module_key*, the numeric options are the constants """
+        constants = {}
+        for key, value in config.iteritems():
+            try:
+                constants[key] = float(value)
+            except (TypeError, ValueError):
+                pass
+        return cls(config.get(rows_key, '') if rows_key else (),
+                   config.get(module_key, '') if module_key else (), constants)
+
+    def evaluate(self, columns, values=None):
+        """
+        Status of the rows given by *columns*, a dictionary of equally long
+        arrays or sequences, and of the module. *values* adds names for the
+        module rules, e.g. numbers which are not part of the rows.
+        """
+        import numpy as np
+        columns = dict((name, np.asarray(column)) for name, column in columns.iteritems())
+        size = len(columns.itervalues().next()) if columns else 0
+        rows = np.ones(size)
+        decided = np.empty(size, dtype=np.int32)
+        decided.fill(-1)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            for index, rule in enumerate(self.row_rules):
+                matched = self._matches(rule, columns, size)
+                # a row keeps the first rule which gave it its lowest status
+                lower = matched & (rule.level < rows)
+                rows[lower] = rule.level
+                decided[lower] = index
+            rule_counts = np.bincount(decided + 1, minlength=len(self.row_rules) + 1)[1:].tolist()
+            counts = {
+                'critical': int(np.count_nonzero(rows == 0.0)),
+                'warning': int(np.count_nonzero((rows > 0.0) & (rows < 1.0))),
+                'ok': int(np.count_nonzero(rows == 1.0)),
+            }
+
+            context = dict(columns)
+            context.update(counts, rows=size)
+            context.update(values or {})
+            status, module_rule = 1.0, -1
+            for index, rule in enumerate(self.module_rules):
+                if rule.level < status and self._matches(rule, context, None):
+                    status, module_rule = rule.level, index
+        return StatusResult(rows, decided, rule_counts, counts, status, module_rule)
+
+    @staticmethod
+    def _matches(rule, context, size):
+        import numpy as np
+        missing = rule.names.difference(context)
+        if missing:
+            raise ValueError('unknown name %s in %r' % (', '.join(sorted(missing)), rule.condition))
+        matched = rule.evaluate(context)
+        if size is None:
+            if np.ndim(matched) != 0:
+                raise ValueError('module rule %r does not yield a single value, use sum, any, ...' % rule.condition)
+            return bool(matched)
+        matched = np.asarray(matched, dtype=bool)
+        if matched.ndim == 0:
+            return np.repeat(matched, size)
+        return matched
+
+
+_factories = {}
+_factories_lock = threading.Lock()
+
+
+def status_rules(module, rows_key=None, module_key='status_rules'):
+    """
+    The StatusRules of the options *rows_key* and *module_key* of *module*,
+    compiled once per configuration. Invalid rules raise a ConfigError.
+    """
+    import hf
+    key = (rows_key, module_key)
+    with _factories_lock:
+        factory = _factories.get(key)
+        if factory is None:
+            factory = _factories[key] = lambda config: StatusRules.from_config(config, rows_key, module_key)
+    try:
+        return compiled_rules(module, factory)
+    except ValueError, e:
+        raise hf.exceptions.ConfigError('Invalid status rules: %s' % e)
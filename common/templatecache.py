@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Cache of the output of ``getTemplateData``.
+
+A dataset does not change once it is written, so the template data of a
+module depends only on the instance, the dataset and the configuration. The
+time of the run is part of the key as well, so a recreated database whose
+ids start again does not get the results of the former one.
+Decorating ``getTemplateData`` makes repeated views of the same run, and
+the category overviews showing it, cost one lookup::
+
+    @cached_template_data
+    def getTemplateData(self):
+        data = hf.module.ModuleBase.getTemplateData(self)
+        ...
+
+The results are kept in memory, the least recently used ones are evicted
+once the size limit is reached. An optional second tier keeps the pickled
+results in a directory, so they survive a restart of the web server. The
+limits and the directory are read from the ``template_cache`` section of
+the HappyFace configuration::
+
+    [template_cache]
+    memory_mb = 64
+    directory = /var/cache/happyface/templates
+    disk_mb = 512
+
+On a hit, the values of ``ModuleBase.getTemplateData`` are taken from the
+current request, so the run which is viewed stays correct. Changes the
+module made to ``self.dataset`` are restored. Cached results are shared
+between requests, so templates must not modify them.
+"""
+
+import cPickle as pickle
+import functools
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from common.rules import config_hash
+
+# size charged for results which cannot be pickled
+UNPICKLABLE_SIZE = 1 << 20
+
+
+class TemplateDataCache(object):
+    """
+    Least recently used cache bounded by the pickled size of its entries,
+    with an optional directory as second tier bounded by *disk_bytes*.
+    """
+
+    def __init__(self, memory_bytes=64 << 20, directory=None, disk_bytes=512 << 20):
+        self.memory_bytes = memory_bytes
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.disk_files = None
+        self.disk_size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ The value stored for *key*, None if it is unknown """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+                self.hits += 1
+                return entry[0]
+        value, size = self._disk_get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None:
+            self._memory_put(key, value, size)
+        return value
+
+    def put(self, key, value):
+        try:
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # e.g. rows of the database which were not converted to dictionaries
+            blob = None
+        self._memory_put(key, value, len(blob) if blob is not None else UNPICKLABLE_SIZE)
+        if blob is not None:
+            self._disk_put(key, blob)
+
+    def _memory_put(self, key, value, size):
+        if size > self.memory_bytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.memory_bytes:
+                evicted, (evicted_value, evicted_size) = self.entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key)).hexdigest() + '.pickle')
+
+    def _scan(self):
+        # files of earlier processes, oldest first
+        if self.disk_files is None:
+            files = []
+            for name in os.listdir(self.directory):
+                if name.endswith('.pickle'):
+                    stat = os.stat(os.path.join(self.directory, name))
+                    files.append((stat.st_mtime, name, stat.st_size))
+            self.disk_files = OrderedDict((name, size) for mtime, name, size in sorted(files))
+            self.disk_size = sum(self.disk_files.itervalues())
+
+    def _disk_get(self, key):
+        if self.directory is None:
+            return None, 0
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            value = pickle.loads(blob)
+            os.utime(path, None)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None, 0
+        with self.lock:
+            self._scan()
+            name = os.path.basename(path)
+            if name in self.disk_files:
+                self.disk_files[name] = self.disk_files.pop(name)
+        return value, len(blob)
+
+    def _disk_put(self, key, blob):
+        if self.directory is None or len(blob) > self.disk_bytes:
+            return
+        path = self._path(key)
+        name = os.path.basename(path)
+        with self.lock:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self._scan()
+            # written under another name first, readers never see partial files
+            temporary = '%s.%i.tmp' % (path, os.getpid())
+            with open(temporary, 'wb') as f:
+                f.write(blob)
+            os.rename(temporary, path)
+            self.disk_size -= self.disk_files.pop(name, 0)
+            self.disk_files[name] = len(blob)
+            self.disk_size += len(blob)
+            while self.disk_size > self.disk_bytes:
+                evicted, size = self.disk_files.popitem(last=False)
+                self.disk_size -= size
+                try:
+                    os.remove(os.path.join(self.directory, evicted))
+                except OSError:
+                    pass
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def template_cache():
+    """ The cache of this process, configured from the HappyFace configuration on first use """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            import hf
+            options = {}
+            section = 'template_cache'
+            if hf.config.has_section(section):
+                if hf.config.has_option(section, 'memory_mb'):
+                    options['memory_bytes'] = int(float(hf.config.get(section, 'memory_mb')) * (1 << 20))
+                if hf.config.has_option(section, 'directory'):
+                    options['directory'] = hf.config.get(section, 'directory') or None
+                if hf.config.has_option(section, 'disk_mb'):
+                    options['disk_bytes'] = int(float(hf.config.get(section, 'disk_mb')) * (1 << 20))
+            _cache = TemplateDataCache(**options)
+        return _cache
+
+
+def cached_template_data(method):
+    """ Decorator caching the result of ``getTemplateData``, see the module documentation """
+    @functools.wraps(method)
+    def wrapper(self):
+        import hf
+        if self.dataset is None:
+            return method(self)
+        cache = template_cache()
+        # dataset ids start again in a new database, the time of the run tells them apart
+        key = (type(self).__name__, self.instance_name, self.dataset['id'], self.run['time'], config_hash(self.config))
+        entry = cache.get(key)
+        if entry is None:
+            data = method(self)
+            cache.put(key, (data, dict(self.dataset)))
+            # the caller gets its own dictionary, as on a hit
+            return dict(data)
+        data, dataset = entry
+        self.dataset.update(dataset)
+        data = dict(data)
+        data.update(hf.module.ModuleBase.getTemplateData(self))
+        return data
+    return wrapper
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright 2012 Institut für Experimentelle Kernphysik - Karlsruher Institut für Technologie
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""
+Checks of common.fetcher against a local stub HTTP server with injected
+latency. Runs without HappyFace and without network access::
+
+    python -m common.test_fetcher
+
+The stub server answers ``/delay/<seconds>`` after the given time,
+``/status/<code>`` with that status, ``/etag`` with an ETag and 304 for a
+matching If-None-Match, and ``/binary`` with bytes which are no valid UTF-8.
+It counts the connections and the largest number of concurrent requests.
+"""
+
+import BaseHTTPServer
+import os
+import shutil
+import SocketServer
+import tempfile
+import threading
+import time
+import unittest
+
+from common.fetcher import fetch, fetch_all, ResponseCache
+
+BINARY = ''.join(chr(i) for i in xrange(256))
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.active = 0
+        self.max_active = 0
+
+    def handle_error(self, request, client_address):
+        # clients giving up on slow requests close the connection on purpose
+        pass
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keeps connections open between requests
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            parts = self.path.strip('/').split('/')
+            headers = {}
+            status, body = 200, 'ok'
+            if parts[0] == 'delay':
+                time.sleep(float(parts[1]))
+            elif parts[0] == 'status':
+                status, body = int(parts[1]), 'status'
+            elif parts[0] == 'etag':
+                headers['ETag'] = '"v1"'
+                if self.headers.get('If-None-Match') == '"v1"':
+                    status, body = 304, ''
+                else:
+                    body = 'tagged'
+            elif parts[0] == 'binary':
+                body = BINARY
+        finally:
+            with server.lock:
+                server.active -= 1
+        self.send_response(status)
+        for key, value in headers.iteritems():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FetcherTest(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%i' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_parallel_within_host_limit(self):
+        start = time.time()
+        results = fetch_all([self.base + '/delay/0.5'] * 4, per_host=2)
+        elapsed = time.time() - start
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(self.server.max_active, 2)
+        # two rounds of two requests instead of four after each other
+        self.assertTrue(0.9 < elapsed < 1.8, elapsed)
+
+    def test_keep_alive(self):
+        results = fetch_all([self.base + '/delay/0'] * 5, per_host=1)
+        self.assertTrue(all(result.ok for result in results))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_deadline(self):
+        start = time.time()
+        slow, fast = fetch_all([self.base + '/delay/3', self.base.replace('127.0.0.1', 'localhost') + '/delay/0'],
+                               deadline=0.5)
+        self.assertTrue(time.time() - start < 1.5)
+        self.assertTrue(fast.ok)
+        self.assertFalse(slow.ok)
+        self.assertTrue('deadline' in slow.error, slow.error)
+
+    def test_timeout(self):
+        result = fetch(self.base + '/delay/2', timeout=0.3)
+        self.assertFalse(result.ok)
+        self.assertTrue('timeout' in result.error, result.error)
+
+    def test_errors(self):
+        missing, refused = fetch_all([self.base + '/status/404', 'http://127.0.0.1:1/'])
+        self.assertEqual(missing.error, 'HTTP 404 Not Found')
+        self.assertEqual(missing.status, 404)
+        self.assertFalse(refused.ok)
+        self.assertTrue(refused.body is None)
+
+    def test_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'cache.json')
+            cache = ResponseCache(path, ttl=0)
+            tagged, binary = fetch_all([self.base + '/etag', self.base + '/binary'], cache=cache)
+            self.assertEqual(binary.body, BINARY)
+            cache.save()
+
+            # reloaded bodies are the same bytes, an unchanged ETag is answered with 304
+            cache = ResponseCache(path, ttl=0)
+            tagged, binary = fetch_all([self.base + '/etag', self.base + '/binary'], cache=cache)
+            self.assertEqual(tagged.status, 304)
+            self.assertTrue(tagged.cached)
+            self.assertEqual(tagged.body, 'tagged')
+            self.assertTrue(isinstance(tagged.body, str))
+            self.assertEqual(binary.body, BINARY)
+
+            # fresh entries are not requested at all
+            cache = ResponseCache(path, ttl=3600)
+            connections = self.server.connections
+            result, = fetch_all([self.base + '/binary'], cache=cache)
+            self.assertTrue(result.cached)
+            self.assertEqual(result.body, BINARY)
+            self.assertEqual(self.server.connections, connections)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from sqlalchemy.sql import and_
-from lxml import etree
+from common.ingest import iter_xml_elements
+from common.reuse import reuse_columns, source_fingerprint, reuse_previous, store_subtables, subtable_parent_id
 
 def rare_to_GiB(rare_value):
     gib_value = rare_value/1024.0/1024.0/1024.0
@@ -35,7 +35,7 @@ class dCacheDataManagement(hf.module.ModuleBase):
         Column('bare_on_disk_size', FLOAT),
         Column('total_on_disk_files', INT),
         Column('total_on_disk_size', FLOAT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {'details': ([
         Column('name', TEXT),
@@ -57,8 +57,15 @@ class dCacheDataManagement(hf.module.ModuleBase):
 
 
     def extractData(self):
+        # the details of an unchanged chimera dump are already stored with an earlier dataset
+        fingerprint = source_fingerprint(self, self.xml_source)
+        previous = reuse_previous(self, fingerprint)
+        if previous is not None:
+            return previous
+
         data = {'chimera_timestamp':0,
-                'latest_data_id':0,
+                'source_hash': fingerprint,
+                'latest_data_id':-1,
                 'bare_total_files':0,
                 'bare_total_size':0.0,
                 'bare_on_disk_files':0,
@@ -67,41 +74,26 @@ class dCacheDataManagement(hf.module.ModuleBase):
                 'total_on_disk_size':0.0,
                 'status': 1.0}
 
-        source_tree = etree.parse(open(self.xml_source.getTmpPath()))
-        root = source_tree.getroot()
-
-        cur_timestamp = 0
-        try:
-            cur_timestamp = int(root.find('time').text)
-        except Exception:
-            cur_timestamp = -1
-        data['chimera_timestamp'] = cur_timestamp
-
-        is_new=1
-        data['latest_data_id']= -1
-        timestamp_is_in_database = self.module_table.\
-            select(and_(self.module_table.c.chimera_timestamp >= cur_timestamp, self.module_table.c.latest_data_id == -1 )).\
-            execute().fetchall()
-        if len(timestamp_is_in_database) > 0:
-            data['latest_data_id'] = timestamp_is_in_database[-1].id
-            is_new=0
-
-        for element in root:
+        cur_timestamp = -1
+        for element in iter_xml_elements(self.xml_source.getTmpPath(), depth=1):
             if element.tag == 'time':
-                pass
+                try:
+                    cur_timestamp = int(element.text)
+                except Exception:
+                    cur_timestamp = -1
             elif element.tag == 'dataset':
-                if is_new:
-                    details_db_values = {}
-                    details_db_values['name'] = element.attrib['name']
-                    for subelement in element:
-                        details_db_values[subelement.tag] =  int(subelement.text)
-                    self.details_db_value_list.append(details_db_values)
+                details_db_values = {}
+                details_db_values['name'] = element.attrib['name']
+                for subelement in element:
+                    details_db_values[subelement.tag] =  int(subelement.text)
+                self.details_db_value_list.append(details_db_values)
             elif element.tag != "duration":
                 data[element.tag] = int(element.text)
+        data['chimera_timestamp'] = cur_timestamp
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
@@ -143,11 +135,11 @@ class dCacheDataManagement(hf.module.ModuleBase):
         return data
 
     def ajax(self, **kwargs):
-        info_list = []
+        parent_id = subtable_parent_id(self.dataset)
         if self.dataset['latest_data_id']>-1:
-            info_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['latest_data_id']).execute().fetchall()
-        else:
-            info_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+            # datasets stored before data_id referred to the details with latest_data_id
+            parent_id = self.dataset['latest_data_id']
+        info_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==parent_id).execute().fetchall()
 
         info_list_expand =[]
         for info in info_list:
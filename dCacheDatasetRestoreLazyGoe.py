@@ -16,7 +16,6 @@
 
 import hf
 from sqlalchemy import Column, TEXT, INT
-from lxml.html import parse
 from string import strip
 import datetime
 
@@ -81,6 +80,7 @@ class dCacheDatasetRestoreLazyGoe(hf.module.ModuleBase):
 
     def extractData(self):
 
+        from lxml.html import parse
         data = {'time_limit': self.stage_max_time,
                 'retry_limit': self.stage_max_retry,
                 'status': self.status}
@@ -16,7 +16,7 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from lxml.html import parse
+from common.plotting import FigureSpec, submit
 
 class dCacheDistributeMetric(hf.module.ModuleBase):
     config_keys = {
@@ -78,6 +78,7 @@ class dCacheDistributeMetric(hf.module.ModuleBase):
         self.too_low_value_list = []
 
     def extractData(self):
+        from lxml.html import parse
         data = {}
         data['status'] = 1
         data['num_pools'] = 0
@@ -118,9 +119,7 @@ class dCacheDistributeMetric(hf.module.ModuleBase):
         srtd_xlist = sorted(single_xlist + [1e5])
 
         #plotting
-        import matplotlib.pyplot as plt
-        self.plt = plt
-        fig = self.plt.figure()
+        fig = FigureSpec()
         axis = fig.add_subplot(111)
         axis.fill_between(srtd_xlist, self.lowfunc(srtd_xlist, data['num_pools']), self.topfunc(srtd_xlist), alpha=0.2, color='green')
         axis.plot(srtd_xlist, self.lowfunc(srtd_xlist, data['num_pools']), 'g-', label="optimal")
@@ -134,8 +133,8 @@ class dCacheDistributeMetric(hf.module.ModuleBase):
         axis.set_ylim(0, 1.0)
         axis.text(25, 0.9, r"$m(ds) = \sqrt{\sum_{p=0..N_\mathrm{pools}} "\
             r"\left( \frac{size(ds,p)}{size(ds)} - \frac{size(p)}{size(all\, pools)} \right)^2 }$")
-        fig.savefig(hf.downloadService.getArchivePath(
-            self.run, self.instance_name + '_dist_metric.png'), dpi=100)
+        submit(fig, hf.downloadService.getArchivePath(
+            self.run, self.instance_name + '_dist_metric.png'), self.logger, dpi=100)
         data['filename_plot'] = self.instance_name + '_dist_metric.png'
 
         return data
@@ -16,10 +16,13 @@
 
 import hf
 from sqlalchemy import TEXT, INT, FLOAT, Column
-from lxml.html import parse
 from string import strip
 from string import replace
 import parser
+from common.reuse import reuse_columns, store_subtables, subtable_rows
+from common.rollup import update_rollups
+from common.templatecache import cached_template_data
+from common.statusrules import status_rules
 
 class dCacheInfoPool(hf.module.ModuleBase):
     config_keys = {
@@ -31,12 +34,21 @@ class dCacheInfoPool(hf.module.ModuleBase):
         'global_critical_poolwarnings': ('module status is critical if more than this amount of pools are  warning pools', '4'),
         'global_warning_poolcriticals': ('module status is warning if more than this amount of pools are  critical pools', '0'),
         'global_warning_poolwarnings': ('module status is warning if more than this amount of pools are  warning pools', '0'),
+        'pool_status_rules': ('rules for the pool status, see common/statusrules.py; the options above can be used as thresholds',
+            'critical: total < 1e-12; critical: (free + removable) / total <= local_critical_ratio; '
+            'warning: (free + removable) / total <= local_warning_ratio'),
+        'status_rules': ('rules for the module status, critical and warning are the numbers of such pools',
+            'critical: sum(free + removable) / sum(total) <= global_critical_ratio; '
+            'critical: critical > global_critical_poolcriticals or warning > global_critical_poolwarnings; '
+            'warning: sum(free + removable) / sum(total) <= global_warning_ratio; '
+            'warning: critical > global_warning_poolcriticals or warning > global_warning_poolwarnings'),
         'poolgroups': ('name of the pools, a list is possible', 'rT_ops, rT_cms'),
         'unit': ('This should be GiB or TiB', 'TiB'),
         'source_xml': ('link to the source file', 'both||http://adm-dcache.gridka.de:2286/info/pools'),
         'special_overview': ('this parameter allows you to add several new lines to the overview, \
             you have 4 variables(total, free, precious, removable) you can use to define the new line. \
             this adds the line example with the value calculated the way described after =', 'example[%]=(r+t)/(f-p)*100'),
+        'retention': ('Days after which datasets are deleted, their values remain in the hourly, daily and weekly rollups, 0 keeps them', '0'),
         'special_details': ('it is equal to special_overview but adds a new column for details', 'example=(r+t)/(f-p)'),
     }
     #'categories': ('name of the categories to be extracted, poolname and status will always be generated', 'total,free,precious,removable'),
@@ -53,7 +65,7 @@ class dCacheInfoPool(hf.module.ModuleBase):
         Column('special_overview', TEXT),
         Column('special_details', TEXT),
         Column('unit', TEXT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         "details": ([
@@ -83,6 +95,7 @@ class dCacheInfoPool(hf.module.ModuleBase):
             self.special_details = self.config['special_details']
         except KeyError, e:
             raise hf.exceptions.ConfigError('Required parameter "%s" not specified' % str(e))
+        self.rules = status_rules(self, 'pool_status_rules', 'status_rules')
 
         if 'source_xml' not in self.config: raise hf.exceptions.ConfigError('source_xml option not set')
         self.source_xml = hf.downloadService.addDownload(self.config['source_xml'])
@@ -90,6 +103,8 @@ class dCacheInfoPool(hf.module.ModuleBase):
         self.details_db_value_list = []
 
     def extractData(self):
+        from lxml.html import parse
+        import numpy as np
         data = {}
         if self.unit != 'GiB' and self.unit != 'TiB':
             self.logger.error(self.unit + ' is not an accepted unit, using TiB instead!')
@@ -125,50 +140,32 @@ class dCacheInfoPool(hf.module.ModuleBase):
                         removable = float(removable) / 100.0 * append['total']
                         append['removable'] = removable
                 self.details_db_value_list.append(append)
-        data['num_pools'] = 0
-        data['crit_pools'] = 0
-        data['warn_pools'] = 0
-        data['total'] = 0
-        data['free'] = 0
-        data['precious'] = 0
-        data['removable'] = 0        
-        for pool in self.details_db_value_list:
-            data['num_pools'] += 1
-            data['total'] += pool['total']
-            data['free'] += pool['free']
-            data['precious'] += pool['precious']
-            data['removable'] += pool['removable']
+        columns = {}
+        for name in ('total', 'free', 'precious', 'removable'):
+            columns[name] = np.array([pool[name] for pool in self.details_db_value_list], dtype=float)
+        result = self.rules.evaluate(columns)
+        for pool, status in zip(self.details_db_value_list, result.rows.tolist()):
+            pool['status'] = status
 
-            if pool['total'] < 1e-12:
-                pool['status'] = 0.0
-                data['crit_pools'] += 1
-            elif (pool['free'] + pool['removable']) / pool['total'] <= self.local_critical_ratio:
-                pool['status'] = 0.0
-                data['crit_pools'] += 1
-            elif (pool['free'] + pool['removable']) / pool['total'] <= self.local_warning_ratio:
-                pool['status'] = 0.5
-                data['warn_pools'] += 1
-            else:
-                pool['status'] = 1.0
-
-        if (data['free'] + data['removable']) / data['total'] <= self.global_critical_ratio or \
-            data['crit_pools'] > self.global_critical_poolcriticals or \
-            data['warn_pools'] > self.global_critical_poolwarnings:
-            data['status'] = 0.0
-        elif (data['free'] + data['removable']) / data['total'] <= self.global_warning_ratio or \
-            data['crit_pools'] > self.global_warning_poolcriticals or \
-            data['warn_pools'] > self.global_warning_poolwarnings:
-            data['status'] = 0.5
+        data['num_pools'] = len(self.details_db_value_list)
+        data['crit_pools'] = result.counts['critical']
+        data['warn_pools'] = result.counts['warning']
+        for name, column in columns.iteritems():
+            data[name] = float(column.sum())
+        data['status'] = result.status
 
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
+        update_rollups(self, parent_id, ['total', 'free', 'precious', 'removable', 'crit_pools', 'warn_pools',
+            'status'], retention=float(self.config['retention']))
 
+    @cached_template_data
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         details_list = map(dict, details_list)
 
         try:
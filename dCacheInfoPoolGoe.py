@@ -19,6 +19,7 @@ from sqlalchemy import TEXT, INT, FLOAT, Column
 from xml.dom import minidom
 from string import strip
 import parser
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 class dCacheInfoPoolGoe(hf.module.ModuleBase):
     config_keys = {
@@ -52,7 +53,7 @@ class dCacheInfoPoolGoe(hf.module.ModuleBase):
         Column('special_overview', TEXT),
         Column('special_details', TEXT),
         Column('unit', TEXT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         "details": ([
@@ -174,12 +175,12 @@ class dCacheInfoPoolGoe(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
 
-        details_list = self.subtables['details'].select().where(self.subtables['details'].c.parent_id==self.dataset['id']).execute().fetchall()
+        details_list = subtable_rows(self, 'details').execute().fetchall()
         details_list = map(dict, details_list)
         
         try:
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 import hf
 from sqlalchemy import TEXT, INT, Column
-from lxml.html import parse
 from string import strip
+from common.htmltable import iter_table_rows
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 class dCacheMoverInfo(hf.module.ModuleBase):
     config_keys = {
@@ -15,7 +16,7 @@ class dCacheMoverInfo(hf.module.ModuleBase):
 
     table_columns = [
         Column('critical_queue_threshold', TEXT),
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {
         "summary": ([
@@ -50,36 +51,37 @@ class dCacheMoverInfo(hf.module.ModuleBase):
     def extractData(self):
         data = {'critical_queue_threshold':self.critical_queue_threshold}
 
-        source_tree = parse(open(self.source.getTmpPath()))
-        root = source_tree.getroot()
-        #take first tbody as table body with the information
         job_list = [] #list of jobs: gridftpq etc.
 
-        for th in root.findall('.//th'):
-            try:
-                if th.get('colspan') == '3':
-                    span = th.findall('span')[0]
-                    job_list.append(span.text)
-            except ValueError:
-                pass
-        root = root.findall('.//tbody')[0]
-
-        #find all pools to be watched
-        pool_list = []
-        for tr in root.findall('.//tr'):
-            spans = tr.findall('.//td')[0].findall('.//span')[0]
-            bools = [group in spans.text for group in self.pool_match_string]
-            if True in bools:
-                pool_list.append(tr)
-
         #build summary list:
         help_dict = []
         for i in range(len(self.watch_jobs)):
             help_dict.append({'active': 0, 'max': 0, 'queued': 0})
         summary_dict = dict(zip(self.watch_jobs, help_dict))
 
-        for pool in pool_list:
-            tds = pool.findall('.//td')
+        #the job names are in the header, take first tbody as table body with the information
+        tbody = None
+        for tr in iter_table_rows(self.source.getTmpPath(), limit=None):
+            if tr.getparent().tag != 'tbody':
+                for th in tr.iter('th'):
+                    try:
+                        if th.get('colspan') == '3':
+                            span = th.findall('span')[0]
+                            job_list.append(span.text)
+                    except ValueError:
+                        pass
+                continue
+            if tbody is None:
+                tbody = tr.getparent()
+            elif tr.getparent() is not tbody:
+                break
+
+            #process the pools to be watched
+            tds = tr.findall('.//td')
+            spans = tds[0].findall('.//span')[0]
+            bools = [group in spans.text for group in self.pool_match_string]
+            if not True in bools:
+                continue
             p_name = tds.pop(0).findall('.//span')[0].text
             p_domain = tds.pop(0).findall('.//span')[0].text
             job_tuples_list = [tds[x:x+3] for x in range(0, len(tds) - 3, 3)]
@@ -109,14 +111,15 @@ class dCacheMoverInfo(hf.module.ModuleBase):
         return data
 
     def fillSubtables(self, parent_id):
-        self.subtables['info'].insert().execute([dict(parent_id=parent_id, **row) for row in self.job_info_db_value_list])
-        self.subtables['summary'].insert().execute([dict(parent_id=parent_id, **row) for row in self.job_summary_db_value_list])
+        store_subtables(self, parent_id, {
+            'info': self.job_info_db_value_list,
+            'summary': self.job_summary_db_value_list})
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        info_list = self.subtables['info'].select().where(self.subtables['info'].c.parent_id==self.dataset['id']).execute().fetchall()
+        info_list = subtable_rows(self, 'info').execute().fetchall()
         info_list = map(dict, info_list)
-        summary_list = self.subtables['summary'].select().where(self.subtables['summary'].c.parent_id==self.dataset['id']).execute().fetchall()
+        summary_list = subtable_rows(self, 'summary').execute().fetchall()
         summary_list = map(dict, summary_list)
         for group in summary_list:
             queue_ratio = group['queued'] / max(1, float(group['max']))
@@ -1,7 +1,8 @@
 import hf
 from sqlalchemy import Column, TEXT, INT, FLOAT
-import lxml.html
 import StringIO
+from common.indexes import IndexSpec
+from common.reuse import reuse_columns, store_subtables, subtable_rows
 
 def rare_to_TB(rare_value):
     tb_value = rare_value/(10.0)**12
@@ -14,7 +15,7 @@ class dCacheSpace(hf.module.ModuleBase):
     config_hint = ''
     table_columns = [
         Column('timestamp', INT)   #stays in!!
-    ], []
+    ] + reuse_columns(), []
 
     subtable_columns = {'details': ([
         Column('group', TEXT),
@@ -31,6 +32,9 @@ class dCacheSpace(hf.module.ModuleBase):
         Column('unknown_files', INT)
     ], []),}
 
+    # the details are shown ordered by group
+    subtable_indexes = {'details': [IndexSpec('parent_id', 'group')]}
+
     def prepareAcquisition(self):
 
         if 'xml_source' not in self.config: raise hf.exceptions.ConfigError('xml_source option not set')
@@ -39,6 +43,7 @@ class dCacheSpace(hf.module.ModuleBase):
         self.details_db_value_list = []
 
     def extractData(self):
+        import lxml.html
         data={'timestamp': 0}
 
         webpage = open(self.xml_source.getTmpPath())
@@ -67,12 +72,11 @@ class dCacheSpace(hf.module.ModuleBase):
         return data
     
     def fillSubtables(self, parent_id):
-        self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        store_subtables(self, parent_id, {'details': self.details_db_value_list})
         
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)
-        details_list = self.subtables['details'].select(). \
-            where(self.subtables['details'].c.parent_id==self.dataset['id']). \
+        details_list = subtable_rows(self, 'details'). \
             order_by(self.subtables['details'].c.group.asc()).execute().fetchall()
         
         table_dict = {}
@@ -16,9 +16,9 @@
 
 import hf
 from sqlalchemy import Column, TEXT, INT, FLOAT
-from lxml.html import parse
 from string import strip
-import math
+from common.rollup import update_rollups
+from common.statusrules import status_rules
 class dCacheTransfers(hf.module.ModuleBase):
     config_keys = {
         'speed_warning_limit': ('Warn if the speed is less than n KiB/s', '250'),
@@ -27,7 +27,13 @@ class dCacheTransfers(hf.module.ModuleBase):
         'time_critical_limit': ('Display error if age of a transfer is older than n hours', '96'),
         'rating_ratio': ('Calculate rating of the specified fraction of transfers has errors or warnings', '0.1'),
         'rating_threshold': ('Rate only if there are more than n transfers', '10'),
+        'transfer_status_rules': ('rules for the status of a transfer, see common/statusrules.py; the limits above can be used as thresholds',
+            'critical: floor(speed) <= speed_critical_limit; critical: since >= time_critical_limit * 3600; '
+            'warning: floor(speed) <= speed_warning_limit; warning: since >= time_warning_limit * 3600'),
+        'status_rules': ('rules for the module status, critical and warning are the numbers of such transfers',
+            'warning: rows >= rating_threshold and (warning + critical) / rows >= rating_ratio'),
         'source_url': ('', ''),
+        'retention': ('Days after which datasets are deleted, their values remain in the hourly, daily and weekly rollups, 0 keeps them', '0'),
     }
     config_hint = ''
 
@@ -67,23 +73,18 @@ class dCacheTransfers(hf.module.ModuleBase):
             self.rating_threshold = int(self.config['rating_threshold']) 
         except KeyError, ex:
             raise hf.exceptions.ConfigError('Required parameter "%s" not specified' % str(ex))
+        self.rules = status_rules(self, 'transfer_status_rules', 'status_rules')
         if 'source_url' not in self.config: raise hf.exceptions.ConfigError('No source file')
         self.source = hf.downloadService.addDownload(self.config['source_url'])
         self.source_url = self.source.getSourceUrl()
         self.details_db_value_list = []
 
     def extractData(self):
+        from lxml.html import parse
+        import numpy as np
         data = {}
-        data['below_speed_warning_limit'] = 0
-        data['below_speed_critical_limit'] = 0
-        data['exceed_time_warning_limit'] = 0
-        data['exceed_time_critical_limit'] = 0
-        data['total_transfers'] = 0
-        data['warning_transfers'] = 0
-        data['critical_transfers'] = 0
         root = parse(self.source.getTmpPath()).getroot()
         root = root.findall('.//tbody')[0]
-        speed_sum = 0
         for line in root.findall('.//tr'):
             try:
                 tds = line.findall('.//td')
@@ -105,55 +106,48 @@ class dCacheTransfers(hf.module.ModuleBase):
                     appender['speed'] = float(tds[11].findall('.//span')[0].text) * 1000.0 / 1024.0
                 except ValueError:
                     appender['speed'] = 0
-                data['total_transfers'] += 1
-                speed_sum += appender['speed']
-                if int(appender['speed']) <= self.speed_critical_limit:
-                    appender['status'] = 0.0
-                    data['below_speed_critical_limit'] += 1
-                elif int(appender['speed']) <= self.speed_warning_limit:
-                    appender['status'] = 0.5
-                    data['below_speed_warning_limit'] += 1
-                else:
-                    appender['status'] = 1.0
-                
-                if appender['since'] >= (self.time_critical_limit * 3600) and appender['status'] != 0.0:
-                    appender['status'] = 0.0
-                    data['exceed_time_critical_limit'] += 1
-                elif appender['since'] >= (self.time_warning_limit * 3600) and appender['status'] == 1.0:
-                    appender['status'] = 0.5
-                    data['exceed_time_warning_limit'] += 1
                 self.details_db_value_list.append(appender)
             except IndexError:
                 continue
 
-        data['warning_transfers'] = data['below_speed_warning_limit'] + data['exceed_time_warning_limit']
-        data['critical_transfers'] = data['below_speed_critical_limit'] + data['exceed_time_critical_limit']
+        speed = np.array([item['speed'] for item in self.details_db_value_list], dtype=float)
+        since = np.array([item['since'] for item in self.details_db_value_list], dtype=float)
+        result = self.rules.evaluate({'speed': speed, 'since': since})
+        for item, status in zip(self.details_db_value_list, result.rows.tolist()):
+            item['status'] = status
 
-        if data['total_transfers']<>0:
-            data['speed_average'] = int(speed_sum / data['total_transfers'])
-        else:
-            data['speed_average'] = 0
-        speed_avg = data['speed_average']
-        speed_delta = 0
-        total_jobs = data['total_transfers']
-        for item in self.details_db_value_list:
-            speed_delta += 1.0 /((float(total_jobs) - 1.0) * float(total_jobs)) * (float(item['speed']) - float(speed_avg)) ** 2
-        data['speed_stdev'] = int(math.sqrt(speed_delta))
+        # the counters describe the limits, whatever the rules are, and count like
+        # the former loop: a transfer is below at most one speed limit, the time
+        # critical limit counts all transfers not below the speed critical limit
+        # and the time warning limit only those which break no other limit
+        slow = np.floor(speed)
+        below_speed_critical = slow <= self.speed_critical_limit
+        below_speed_warning = ~below_speed_critical & (slow <= self.speed_warning_limit)
+        exceed_time_critical = ~below_speed_critical & (since >= self.time_critical_limit * 3600)
+        exceed_time_warning = ~below_speed_critical & ~below_speed_warning & ~exceed_time_critical \
+            & (since >= self.time_warning_limit * 3600)
+        data['below_speed_critical_limit'] = int(np.count_nonzero(below_speed_critical))
+        data['below_speed_warning_limit'] = int(np.count_nonzero(below_speed_warning))
+        data['exceed_time_critical_limit'] = int(np.count_nonzero(exceed_time_critical))
+        data['exceed_time_warning_limit'] = int(np.count_nonzero(exceed_time_warning))
+        data['total_transfers'] = len(speed)
+        data['warning_transfers'] = result.counts['warning']
+        data['critical_transfers'] = result.counts['critical']
 
-        if float(data['warning_transfers']) / data['total_transfers'] >= self.rating_ratio \
-            and data['total_transfers'] >= self.rating_threshold:
-            data['status'] = 0.5
-        elif float(data['warning_transfers'] + data['critical_transfers']) / data['total_transfers'] >= self.rating_ratio \
-            and data['total_transfers'] >= self.rating_threshold:
-            data['status'] = 0.5
-        elif float(data['critical_transfers']) / data['total_transfers'] >= self.rating_ratio and data['total_transfers'] >= self.rating_threshold:
-            data['status'] = 0.0
+        total_jobs = len(speed)
+        data['speed_average'] = int(speed.sum() / total_jobs) if total_jobs else 0
+        if total_jobs > 1:
+            speed_delta = ((speed - data['speed_average']) ** 2).sum() / ((total_jobs - 1.0) * total_jobs)
+            data['speed_stdev'] = int(np.sqrt(speed_delta))
         else:
-            data['status'] = 1.0
+            data['speed_stdev'] = 0
+        data['status'] = result.status
         return data
 
     def fillSubtables(self, parent_id):
         self.subtables['details'].insert().execute([dict(parent_id=parent_id, **row) for row in self.details_db_value_list])
+        update_rollups(self, parent_id, ['speed_average', 'speed_stdev', 'total_transfers', 'warning_transfers',
+            'critical_transfers', 'status'], retention=float(self.config['retention']))
 
     def getTemplateData(self):
         data = hf.module.ModuleBase.getTemplateData(self)